@@ -6,11 +6,23 @@ A module that defines the main file from which the web app is run.
 # Local Modules
 from setup import app
 from blueprints.cli_bp import db_commands
+from blueprints.bench_bp import bench_commands
+from blueprints.jobs_bp import job_commands
 from blueprints.item_posts_bp import item_posts_bp
 from blueprints.users_bp import users_bp
+from response_cache import init_response_cache
+from location_cache import init_location_cache
 
 
 # Register all blueprints
 app.register_blueprint(db_commands)
+app.register_blueprint(bench_commands)
+app.register_blueprint(job_commands)
 app.register_blueprint(item_posts_bp)
 app.register_blueprint(users_bp)
+
+# Cache the responses of read-only routes
+init_response_cache(app)
+
+# Cache the locations resolved when creating item posts
+init_location_cache(app)
@@ -1,17 +1,67 @@
 """
 A module that defines how authorization works, based on JWT identity as users
 login into the app.
+
+Every request with a JWT token reads the role of its user from the database
+once, when the token is checked, so a change of role takes effect at once in
+every server process. Tokens of users that no longer exist, or that are
+being deleted in the background (deleted_at is set), are rejected with a 401
+on every protected route, including those that do not call authorize.
 """
 
 
-from flask import abort
+# Third-party Library Modules
+from flask import abort, g
 from flask_jwt_extended import get_jwt_identity
+
+# Local Modules
 from models.user import User
-from setup import db
+from setup import db, jwt
+
+
+def role_claims(user):
+    """
+    Returns the additional JWT claims carrying the role of a user, to be
+    passed to create_access_token when the user logs in.
+
+    Args:
+    1. user (User instance): The user logging in.
+    """
+    return {'is_admin': bool(user.is_admin)}
+
+
+def get_role(user_id):
+    """
+    Returns whether a user is an admin, read from the database, or None if
+    the user no longer exists or is being deleted.
+
+    Args:
+    1. user_id (int): The id of the user currently logged in.
+    """
+    stmt = db.select(User.is_admin).filter_by(id=user_id, deleted_at=None)
+    user = db.session.execute(stmt).first()
+    return bool(user.is_admin) if user else None
+
+
+@jwt.token_in_blocklist_loader
+def user_disabled(jwt_header, jwt_payload):
+    """
+    Rejects the tokens of users that no longer exist or are being deleted,
+    keeping the role of the others for authorize.
+    """
+    user_id = jwt_payload.get('sub')
+    g.user_is_admin = get_role(user_id) if isinstance(user_id, int) else None
+    return g.user_is_admin is None
+
+
+@jwt.revoked_token_loader
+def disabled_user_response(jwt_header, jwt_payload):
+    return {'error': 'You are not authorized to access this resource'}, 401
+
 
 def authorize(*user_ids):
     """
-    Authorizes the user currently logged in before proceeding with the 
+    Authorizes the user currently logged in before proceeding with the
     functionality. The user currently logged in must have an id that matches
     the ids specified by the parameters to proceed.
 
@@ -24,11 +74,13 @@ def authorize(*user_ids):
     if jwt_user_id is None or not isinstance(jwt_user_id, int):
         abort(401)
 
-    # Finds the user in the db with id that matches jwt_user_id
-    stmt = db.select(User).filter_by(id=jwt_user_id)
-    user = db.session.scalar(stmt)
-    
+    # Abort if the user no longer exists. The role was read when the token
+    # was checked.
+    is_admin = g.user_is_admin if 'user_is_admin' in g else get_role(jwt_user_id)
+    if is_admin is None:
+        abort(401)
+
     # Proceed if user is either an admin or id matches one of user_ids.
     # Otherwise abort.
-    if not (user.is_admin or jwt_user_id in user_ids):
+    if not (is_admin or jwt_user_id in user_ids):
         abort(401)
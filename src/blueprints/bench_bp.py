@@ -0,0 +1,389 @@
+"""
+A module that defines the blueprint for terminal commands benchmarking the API
+endpoints. Every route of the item posts, comments, locations and users
+blueprints is driven through the Flask test client against the database the
+app is configured with, and its latency, number of SQL statements and peak
+memory are recorded and compared against a saved baseline.
+
+The serializers command compares the dump throughput of plain marshmallow
+with the fast dump path of the serializer registry on large lists of records.
+"""
+
+
+# Standard Library Modules
+import json
+import tracemalloc
+from time import perf_counter
+from uuid import uuid4
+
+# Third-party Library Modules
+import click
+from flask import Blueprint, current_app
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, func
+
+# Local Modules
+from setup import db, bcrypt
+from models.user import User, UserSchema
+from models.item_post import ItemPost, ItemPostSchema
+from models.comment import Comment
+from models.location import Location
+from blueprints.cli_bp import db_seed_bulk
+from loading_profiles import loading_profile
+from serializers import get_schema, fast_dump
+from utilities import encode_cursor
+
+
+bench_commands = Blueprint('bench', __name__)
+
+# Sizes of the datasets that can be generated with --reseed, as numbers of
+# users and item posts
+DATASETS = {
+    '10k': (1000, 10000),
+    '100k': (5000, 100000),
+    '1m': (20000, 1000000),
+}
+
+# Schemas whose dumps are compared by "flask bench serializers", as
+# (name, schema class, model, schema options)
+SERIALIZER_CASES = (
+    ('item_posts', ItemPostSchema, ItemPost, {}),
+    ('item_posts_sparse', ItemPostSchema, ItemPost,
+     {'only': ('id', 'title', 'status', 'date', 'images')}),
+    ('users', UserSchema, User, {'exclude': ('password',)}),
+)
+
+# Credentials of the admin user the benchmarks run as
+BENCH_USERNAME = 'benchadmin'
+BENCH_PASSWORD = 'benchadmin123'
+
+
+class Recorder:
+    """
+    Calls routes through the Flask test client and records the latency, the
+    number of SQL statements and optionally the peak memory of each call,
+    grouped by route name.
+    """
+    def __init__(self, client, headers):
+        self.client = client
+        self.headers = headers
+        self.trace_memory = False
+        self.latencies = {}
+        self.queries = {}
+        self.peak_memory = {}
+        self._statements = 0
+
+    def count_statement(self, *args):
+        self._statements += 1
+
+    def call(self, name, method, url, json=None, headers=None):
+        """
+        Calls a route and records its measurements. Raises ClickException if
+        the route responds with an error, so that broken routes are never
+        mistaken for fast ones.
+
+        Args:
+        1. name (str): The name the measurements are recorded under.
+        2. method (str): The HTTP method of the request.
+        3. url (str): The URL of the request.
+        4. json (dict): The JSON body of the request, if any.
+        5. headers (dict): The headers of the request, the admin
+        authorization header by default.
+        """
+        self._statements = 0
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = perf_counter()
+        response = self.client.open(
+            url, method=method, json=json,
+            headers=self.headers if headers is None else headers
+        )
+        # Reads the whole body, so that streamed responses are fully timed
+        response.get_data()
+        elapsed = perf_counter() - start
+        if response.status_code >= 400:
+            raise click.ClickException(
+                f'{name} ({method} {url}) responded with {response.status_code}: '
+                f'{response.get_data(as_text=True)[:200]}'
+            )
+        if self.trace_memory:
+            self.peak_memory[name] = tracemalloc.get_traced_memory()[1]
+        else:
+            self.latencies.setdefault(name, []).append(elapsed)
+            self.queries[name] = max(self.queries.get(name, 0), self._statements)
+        return response
+
+    def results(self):
+        """
+        Returns the measurements of every route, as p50 / p95 latency in
+        milliseconds, SQL statements per request and peak memory in KiB.
+        """
+        return {
+            name: {
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+                'queries': self.queries[name],
+                'peak_kib': round(self.peak_memory.get(name, 0) / 1024, 1),
+            }
+            for name, latencies in sorted(self.latencies.items())
+        }
+
+
+def percentile(values, fraction):
+    """
+    Returns the value at the given fraction of the sorted values, using the
+    nearest rank.
+
+    Args:
+    1. values (list): The measured values.
+    2. fraction (float): The fraction, between 0 and 1.
+    """
+    values = sorted(values)
+    return values[round(fraction * (len(values) - 1))]
+
+
+def read_routes():
+    """
+    Returns the read-only routes to benchmark as (name, method, url) tuples,
+    using records sampled from the database.
+    """
+    # The item post with the most comments, to benchmark busy posts
+    busy_post_id = db.session.scalar(
+        db.select(Comment.item_post_id)
+        .group_by(Comment.item_post_id)
+        .order_by(func.count().desc())
+        .limit(1)
+    ) or db.session.scalar(db.select(ItemPost.id).limit(1))
+    user_id = db.session.scalar(db.select(ItemPost.user_id).filter_by(id=busy_post_id))
+    location = db.session.scalar(db.select(Location).limit(1))
+    # A cursor 90% of the way through the item post listing, to check that
+    # deep pages cost the same as the first one
+    post_count = db.session.scalar(db.select(func.count(ItemPost.id)))
+    deep_post = db.session.execute(
+        db.select(ItemPost.date, ItemPost.id)
+        .order_by(ItemPost.date.desc(), ItemPost.id.desc())
+        .offset(post_count * 9 // 10)
+        .limit(1)
+    ).first()
+    title_word = db.session.scalar(db.select(ItemPost.title).filter_by(id=busy_post_id)).split()[-1]
+
+    routes = [
+        ('all_item_posts', 'GET', '/item-posts/'),
+        ('text_search_posts', 'GET', f'/item-posts/search?q={title_word}'),
+        ('search_posts', 'GET', f'/item-posts/title/{title_word}'),
+        ('one_item_post', 'GET', f'/item-posts/{busy_post_id}'),
+        ('view_comments', 'GET', f'/item-posts/{busy_post_id}/comments/'),
+        ('search_location', 'GET', f'/item-posts/locations/seen/suburb/{location.suburb}'),
+        ('search_location_postcode', 'GET',
+         f'/item-posts/locations/pickup/postcode/{str(location.postcode)[:2]}'),
+        ('all_users', 'GET', '/users/'),
+        ('one_user', 'GET', f'/users/{user_id}'),
+    ]
+    if deep_post:
+        routes.append((
+            'all_item_posts_deep', 'GET', f'/item-posts/?after={encode_cursor(*deep_post)}'
+        ))
+    return routes
+
+
+def run_writes(recorder, post_id):
+    """
+    Runs every write route once, each one cleaning up after the previous
+    ones, so that the dataset is left unchanged.
+
+    Args:
+    1. recorder (Recorder): The recorder the routes are called through.
+    2. post_id (int): The id of an existing item post to comment on.
+    """
+    suffix = uuid4().hex[:8]
+    location = {'suburb': 'Kensington', 'state': 'NSW', 'postcode': 2033, 'country': 'Australia'}
+    post = recorder.call('create_item_post', 'POST', '/item-posts/', json={
+        'title': 'Benchmark Laptop', 'post_type': 'lost', 'category': 'electronics',
+        'item_description': 'Black laptop used for benchmarking',
+        'seen_location': location, 'pickup_location': location,
+        'images': [{'image_url': 'bench.png'}],
+    }).json
+    recorder.call('edit_item_post', 'PATCH', f'/item-posts/{post["id"]}', json={'status': 'claimed'})
+    comment = recorder.call('create_comment', 'POST', f'/item-posts/{post_id}/comments/', json={
+        'comment_text': 'Benchmark comment', 'images': [{'image_url': 'bench.png'}],
+    }).json
+    recorder.call('update_comment', 'PATCH', f'/item-posts/{post_id}/comments/{comment["id"]}',
+                  json={'comment_text': 'Edited benchmark comment'})
+    recorder.call('delete_comment', 'DELETE', f'/item-posts/{post_id}/comments/{comment["id"]}')
+    recorder.call('delete_item_post', 'DELETE', f'/item-posts/{post["id"]}')
+
+    user = recorder.call('register', 'POST', '/users/register', json={
+        'name': 'Benchmark User', 'username': f'bench{suffix}',
+        'email': f'bench{suffix}@spam.com', 'password': BENCH_PASSWORD,
+    }, headers={}).json
+    recorder.call('login', 'POST', '/users/login', json={
+        'username': f'bench{suffix}', 'password': BENCH_PASSWORD,
+    }, headers={})
+    recorder.call('update_user', 'PATCH', f'/users/{user["id"]}', json={'name': 'Edited User'})
+    recorder.call('delete_user', 'DELETE', f'/users/{user["id"]}')
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares results with a baseline and returns a list of regressions. A
+    route regresses when its p95 latency or peak memory grows by more than
+    the tolerance, or when it runs more SQL statements than before.
+
+    Args:
+    1. results (dict): The measurements of the current run, per route.
+    2. baseline (dict): The measurements of the baseline, per route.
+    3. tolerance (float): The allowed relative growth, e.g. 0.25 for 25%.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+        if current['queries'] > previous['queries']:
+            regressions.append(f"{name}: queries {previous['queries']} -> {current['queries']}")
+        if previous['peak_kib'] and current['peak_kib'] > previous['peak_kib'] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {previous['peak_kib']} KiB -> {current['peak_kib']} KiB")
+    return regressions
+
+
+# Benchmark every API route against the configured database when command
+# "flask bench run" is entered
+@bench_commands.cli.command("run")
+@click.option('--dataset', type=click.Choice(sorted(DATASETS)), default='10k', show_default=True,
+              help='Name of the dataset the results are recorded under.')
+@click.option('--reseed', is_flag=True,
+              help='Drop all tables and generate the dataset first. Destroys existing data.')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation before --reseed.')
+@click.option('--iterations', default=30, show_default=True, help='Timed calls per route.')
+@click.option('--warmup', default=3, show_default=True, help='Untimed calls per route.')
+@click.option('--baseline', type=click.Path(dir_okay=False),
+              help='JSON file of baselines to compare the results with.')
+@click.option('--tolerance', default=0.25, show_default=True,
+              help='Allowed relative growth of p95 latency and peak memory.')
+@click.option('--save', type=click.Path(dir_okay=False),
+              help='JSON file to save the results to as the new baseline of the dataset.')
+@click.pass_context
+def bench_run(ctx, dataset, reseed, yes, iterations, warmup, baseline, tolerance, save):
+    if reseed:
+        if not yes:
+            click.confirm(f'This drops every table of {db.engine.url!r}. Continue?', abort=True)
+        db.drop_all()
+        db.create_all()
+        users, posts = DATASETS[dataset]
+        ctx.invoke(db_seed_bulk, users=users, posts=posts)
+
+    if not db.session.scalar(db.select(ItemPost.id).limit(1)):
+        raise click.ClickException('The database has no item posts, run with --reseed first.')
+
+    # The admin user the benchmarks run as
+    admin = db.session.scalar(db.select(User).filter_by(username=BENCH_USERNAME))
+    if not admin:
+        admin = User(
+            name='Benchmark Admin', username=BENCH_USERNAME, email='benchadmin@spam.com',
+            password=bcrypt.generate_password_hash(BENCH_PASSWORD).decode('utf8'),
+            is_admin=True,
+        )
+        db.session.add(admin)
+        db.session.commit()
+    headers = {'Authorization': f'Bearer {create_access_token(identity=admin.id)}'}
+
+    routes = read_routes()
+    post_id = db.session.scalar(db.select(ItemPost.id).limit(1))
+    recorder = Recorder(current_app.test_client(), headers)
+    # The routes are measured without the response cache, which would
+    # otherwise answer every call after the first
+    response_cache = current_app.extensions.pop('response_cache', None)
+    event.listen(db.engine, 'before_cursor_execute', recorder.count_statement)
+    try:
+        with click.progressbar(length=(warmup + iterations + 1) * (len(routes) + 1),
+                               label=f'Benchmarking ({dataset})') as bar:
+            for round_number in range(warmup + iterations):
+                for name, method, url in routes:
+                    recorder.call(name, method, url)
+                    bar.update(1)
+                run_writes(recorder, post_id)
+                bar.update(1)
+                # Warmup calls are not recorded
+                if round_number == warmup - 1:
+                    recorder.latencies.clear()
+            # One more call of every route while tracing memory allocations
+            tracemalloc.start()
+            recorder.trace_memory = True
+            try:
+                for name, method, url in routes:
+                    recorder.call(name, method, url)
+                    bar.update(1)
+                run_writes(recorder, post_id)
+                bar.update(1)
+            finally:
+                tracemalloc.stop()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', recorder.count_statement)
+        if response_cache is not None:
+            current_app.extensions['response_cache'] = response_cache
+
+    results = recorder.results()
+    click.echo(f"\n{'route':<28}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'peak KiB':>11}")
+    for name, result in results.items():
+        click.echo(f"{name:<28}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+                   f"{result['queries']:>9}{result['peak_kib']:>11}")
+
+    if save:
+        try:
+            with open(save) as file:
+                saved = json.load(file)
+        except FileNotFoundError:
+            saved = {}
+        saved[dataset] = {
+            'dialect': db.engine.dialect.name,
+            'item_posts': db.session.scalar(db.select(func.count(ItemPost.id))),
+            'routes': results,
+        }
+        with open(save, 'w') as file:
+            json.dump(saved, file, indent=2, sort_keys=True)
+        click.echo(f'Saved results to {save}')
+
+    if baseline:
+        with open(baseline) as file:
+            previous = json.load(file).get(dataset)
+        if not previous:
+            raise click.ClickException(f'{baseline} has no baseline for the {dataset} dataset')
+        regressions = compare(results, previous['routes'], tolerance)
+        if regressions:
+            raise click.ClickException(
+                'Performance regressions found:\n  ' + '\n  '.join(regressions)
+            )
+        click.echo(f'No regressions against {baseline}')
+
+
+# Compare the dump throughput of marshmallow and of the serializer registry's
+# fast dump path when command "flask bench serializers" is entered
+@bench_commands.cli.command("serializers")
+@click.option('--records', default=2000, show_default=True, help='Records dumped per call.')
+@click.option('--iterations', default=10, show_default=True, help='Timed dumps per serializer.')
+def bench_serializers(records, iterations):
+    click.echo(f"{'schema':<20}{'records':>9}{'marshmallow/s':>15}{'fast/s':>12}{'speedup':>9}")
+    for name, schema_class, model, options in SERIALIZER_CASES:
+        schema = get_schema(schema_class, many=True, **options)
+        rows = db.session.scalars(
+            db.select(model).options(*loading_profile(schema, model)).limit(records)
+        ).all()
+        if not rows:
+            raise click.ClickException(f'The database has no {model.__tablename__}, seed it first.')
+        # Both paths must produce the same output for the timings to compare
+        if fast_dump(schema, rows) != schema.dump(rows):
+            raise click.ClickException(f'{name}: the fast dump differs from marshmallow')
+        timings = {}
+        for label, dump in (('marshmallow', schema.dump), ('fast', lambda rows: fast_dump(schema, rows))):
+            elapsed = []
+            for _ in range(iterations):
+                start = perf_counter()
+                dump(rows)
+                elapsed.append(perf_counter() - start)
+            timings[label] = min(elapsed)
+        click.echo(
+            f"{name:<20}{len(rows):>9}{len(rows) / timings['marshmallow']:>15.0f}"
+            f"{len(rows) / timings['fast']:>12.0f}{timings['marshmallow'] / timings['fast']:>8.1f}x"
+        )
@@ -5,31 +5,56 @@ database.
 
 
 # Standard Library Modules
-from datetime import datetime
+import random
+from datetime import date, datetime, timedelta
 
 # Third-party Library Modules
+import click
 from flask import Blueprint
+from sqlalchemy import delete, func, insert
 
 # Local Modules
+import migrations
 from setup import db, bcrypt
 from models.user import User
-from models.item_post import ItemPost
+from models.item_post import ItemPost, VALID_CATEGORIES, VALID_STATUS, VALID_POST_TYPE
 from models.comment import Comment
 from models.image import Image
-from models.location import Location
+from models.location import Location, LOCATION_COLUMNS, location_key, location_coordinates
+from models.item_post_match import ItemPostMatch
+from matching import rematch
 
 
 db_commands = Blueprint('db', __name__)
 
 # Delete all tables in the db, then create all tables in the db based on the
-# defined models when command "flask db create" is entered
+# defined models when command "flask db create" is entered. The new tables
+# already match the models, so every migration is recorded as applied.
 @db_commands.cli.command("create")
 def db_create():
     db.drop_all()
     db.create_all()
+    migrations.stamp(db.engine)
     print("Tables created")
 
 
+# Apply the migrations that the database is missing when command "flask db
+# upgrade" is entered, without losing its data
+@db_commands.cli.command("upgrade")
+def db_upgrade():
+    applied = migrations.upgrade(db.engine)
+    print(f"Applied {len(applied)} migrations" if applied else "Database is up to date")
+
+
+# List the migrations and whether they are applied when command "flask db
+# migrations" is entered
+@db_commands.cli.command("migrations")
+def db_migrations():
+    applied = migrations.applied_versions(db.engine)
+    for version, _ in migrations.migrations():
+        print(f"[{'x' if version in applied else ' '}] {version}")
+
+
 # Seed the database when command "flask db seed" is entered
 @db_commands.cli.command("seed")
 def db_seed():
@@ -185,3 +210,257 @@ def db_seed():
     db.session.commit()
 
     print("Database seeded")
+
+
+# Vocabulary used to generate realistic item posts in "flask db seed-bulk"
+BULK_ITEMS = {
+    'electronics': ('Phone', 'Laptop', 'Tablet', 'Headphones', 'Charger', 'USB Device', 'Camera'),
+    'apparel': ('Jacket', 'T-Shirt', 'Scarf', 'Cap', 'Hoodie', 'Umbrella', 'Sneakers'),
+    'computers': ('Mouse', 'Keyboard', 'Hard Drive', 'Monitor Cable', 'Laptop Bag'),
+    'jewellery': ('Ring', 'Necklace', 'Bracelet', 'Watch', 'Earrings'),
+    'others': ('Wallet', 'Keys', 'Water Bottle', 'Backpack', 'Student Card', 'Book'),
+}
+BULK_BRANDS = ('Apple', 'Samsung', 'HP', 'Sony', 'UNIQLO', 'Nike', 'Kingston', 'Lenovo', 'Casio')
+BULK_COLOURS = ('Black', 'White', 'Red', 'Blue', 'Green', 'Grey', 'Silver', 'Pink')
+BULK_SUBURBS = (
+    ('Kensington', 'NSW', 2033), ('Kingsford', 'NSW', 2032), ('Mascot', 'NSW', 2020),
+    ('Randwick', 'NSW', 2031), ('Coogee', 'NSW', 2034), ('Sydney', 'NSW', 2000),
+    ('Parramatta', 'NSW', 2150), ('Carlton', 'VIC', 3053), ('Melbourne', 'VIC', 3000),
+    ('Brisbane City', 'QLD', 4000), ('St Lucia', 'QLD', 4067), ('Adelaide', 'SA', 5000),
+)
+BULK_STREETS = ('Anzac Parade', 'High Street', 'George Street', 'Forsyth Street',
+                'Muller Lane', 'Barker Street', 'Botany Road', 'King Street')
+# Generated item posts are dated within the two years up to this date, so the
+# data does not depend on the day the command is run
+BULK_LAST_DATE = date(2024, 12, 31)
+BULK_COMMENTS = (
+    'I think I may have found it, is this it?',
+    'That is the one, thanks! Where can I pick it up?',
+    'I saw something similar near the library yesterday.',
+    'Is it still available?',
+    'Sent you a message with my number.',
+    'Could you post another photo of it?',
+)
+
+
+def insert_in_chunks(model, rows, total, chunk_size, label):
+    """
+    Inserts rows into the table of a model in chunks, each chunk with a single
+    executemany INSERT and its own commit, while showing a progress bar.
+    Returns the ids of the inserted records, in the order of the rows.
+
+    Args:
+    1. model (Model class): The model whose table the rows are inserted into.
+    2. rows (iterable): The rows to insert, as dictionaries of column values.
+    3. total (int): The number of rows, for the progress bar.
+    4. chunk_size (int): The number of rows inserted per statement.
+    5. label (str): The label shown next to the progress bar.
+    """
+    ids = []
+    with click.progressbar(length=total, label=label) as bar:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                ids += insert_returning_ids(model, chunk)
+                db.session.commit()
+                bar.update(len(chunk))
+                chunk = []
+        if chunk:
+            ids += insert_returning_ids(model, chunk)
+            db.session.commit()
+            bar.update(len(chunk))
+    return ids
+
+
+def insert_returning_ids(model, rows):
+    """
+    Inserts rows into the table of a model with a single executemany INSERT,
+    and returns the ids of the inserted records in the order of the rows.
+
+    Args:
+    1. model (Model class): The model whose table the rows are inserted into.
+    2. rows (list): The rows to insert, as dictionaries of column values.
+    """
+    stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+    return db.session.scalars(stmt, rows).all()
+
+
+def max_id(model):
+    """
+    Returns the highest id in the table of a model, or 0 if it is empty.
+
+    Args:
+    1. model (Model class): The model to select the highest id of.
+    """
+    return db.session.scalar(db.select(func.coalesce(func.max(model.id), 0)))
+
+
+# Fill the database with large amounts of generated data for load testing
+# when command "flask db seed-bulk" is entered. The data only depends on the
+# --seed option, so every run with the same options produces the same data.
+@db_commands.cli.command("seed-bulk")
+@click.option('--users', default=1000, show_default=True, help='Number of users to create.')
+@click.option('--posts', default=10000, show_default=True, help='Number of item posts to create.')
+@click.option('--comments-per-post', default=3, show_default=True,
+              help='Average number of comments on each item post.')
+@click.option('--locations', default=500, show_default=True, help='Number of distinct locations.')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows inserted per statement.')
+@click.option('--seed', default=0, show_default=True, help='Seed of the random number generator.')
+def db_seed_bulk(users, posts, comments_per_post, locations, chunk_size, seed):
+    if users < 1 and posts > 0:
+        raise click.UsageError('At least one user is needed to create item posts.')
+    rng = random.Random(seed)
+    # Hashing is deliberately slow, so every generated user shares one hash
+    # of the password "password123"
+    password = bcrypt.generate_password_hash("password123").decode("utf8")
+
+    # Locations, reusing any existing locations with the same address
+    existing = set(db.session.scalars(db.select(Location.location_key)))
+    addresses = {}
+    for _ in range(locations):
+        suburb, state, postcode = rng.choice(BULK_SUBURBS)
+        address = dict(zip(LOCATION_COLUMNS, (
+            str(rng.randint(1, 40)) if rng.random() < 0.3 else "",
+            str(rng.randint(1, 300)), rng.choice(BULK_STREETS),
+            suburb, state, postcode, "Australia"
+        )))
+        key = location_key(address)
+        if key not in existing:
+            addresses[key] = address
+    location_ids = insert_in_chunks(
+        Location, (
+            {**addresses[key], **location_coordinates(addresses[key]), 'location_key': key}
+            for key in sorted(addresses)
+        ),
+        len(addresses), chunk_size, 'Locations'
+    )
+    location_ids = location_ids or db.session.scalars(db.select(Location.id)).all()
+
+    # Users, with usernames and emails numbered after the existing users
+    first_user = max_id(User)
+    user_ids = insert_in_chunks(User, (
+        {
+            'name': f'Bulk User {first_user + n}',
+            'username': f'bulkuser{first_user + n}',
+            'email': f'bulkuser{first_user + n}@spam.com',
+            'password': password,
+            'private_email': rng.random() < 0.2,
+            'is_admin': False,
+        }
+        for n in range(1, users + 1)
+    ), users, chunk_size, 'Users')
+
+    def generate_post():
+        category = rng.choice(VALID_CATEGORIES)
+        item = rng.choice(BULK_ITEMS[category])
+        colour = rng.choice(BULK_COLOURS)
+        brand = rng.choice(BULK_BRANDS)
+        return {
+            'title': f'{colour} {brand} {item}',
+            'post_type': rng.choice(VALID_POST_TYPE),
+            'category': category,
+            'item_description': f'{colour} {item.lower()} made by {brand}, '
+                                f'{rng.choice(("with stickers", "slightly scratched", "in a case", "brand new"))}',
+            'retrieval_description': f'Please call 04{rng.randint(10, 99)} {rng.randint(100, 999)} '
+                                     f'{rng.randint(100, 999)}',
+            'status': rng.choice(VALID_STATUS),
+            'date': BULK_LAST_DATE - timedelta(days=rng.randint(0, 730)),
+            'user_id': rng.choice(user_ids),
+            'seen_location_id': rng.choice(location_ids) if location_ids else None,
+            'pickup_location_id': rng.choice(location_ids) if location_ids else None,
+        }
+
+    # Item posts, then the comments and images of each chunk of item posts, so
+    # that only one chunk of item post ids is held in memory at a time
+    with click.progressbar(length=posts, label='Item posts') as bar:
+        created = 0
+        while created < posts:
+            size = min(chunk_size, posts - created)
+            chunk = [generate_post() for _ in range(size)]
+            post_ids = insert_returning_ids(ItemPost, chunk)
+
+            comments, images = [], []
+            for post_id, post in zip(post_ids, chunk):
+                for _ in range(rng.randint(0, 2 * comments_per_post)):
+                    posted = datetime.combine(post['date'], datetime.min.time())
+                    comments.append({
+                        'comment_text': rng.choice(BULK_COMMENTS),
+                        'time_stamp': posted + timedelta(minutes=rng.randint(0, 60 * 24 * 30)),
+                        'user_id': rng.choice(user_ids),
+                        'item_post_id': post_id,
+                    })
+                for n in range(rng.randint(0, 2)):
+                    images.append({'image_url': f'item{post_id}_{n}.png', 'item_post_id': post_id})
+            for start in range(0, len(comments), chunk_size):
+                db.session.execute(insert(Comment), comments[start:start + chunk_size])
+            for start in range(0, len(images), chunk_size):
+                db.session.execute(insert(Image), images[start:start + chunk_size])
+            db.session.commit()
+            created += size
+            bar.update(size)
+
+    print(f"Database seeded with {len(addresses)} locations, {users} users and {posts} item posts")
+
+
+# Recompute the matches of every item post when command "flask db
+# rebuild-matches" is entered, e.g. after seeding, as matches are otherwise
+# only computed when item posts are created or edited through the API
+@db_commands.cli.command("rebuild-matches")
+@click.option('--chunk-size', default=1000, show_default=True, help='Number of item posts matched per transaction.')
+def db_rebuild_matches(chunk_size):
+    db.session.execute(delete(ItemPostMatch))
+    item_post_ids = db.session.scalars(db.select(ItemPost.id).order_by(ItemPost.id)).all()
+    # Every item post is rematched, so each one only needs its own matches
+    # computed
+    chunks = [item_post_ids[start:start + chunk_size] for start in range(0, len(item_post_ids), chunk_size)]
+    with click.progressbar(length=len(item_post_ids), label='Item posts') as bar:
+        for chunk in chunks:
+            rematch(*chunk)
+            db.session.commit()
+            bar.update(len(chunk))
+    total = db.session.scalar(db.select(func.count()).select_from(ItemPostMatch))
+    print(f"Matched {len(item_post_ids)} item posts, {total} matches found")
+
+
+# Fill in the coordinates of the locations that have none, from the postcode
+# centroid table, when command "flask db geocode-locations" is entered, e.g.
+# after replacing the table with a more complete one
+@db_commands.cli.command("geocode-locations")
+def db_geocode_locations():
+    locations = db.session.scalars(
+        db.select(Location).filter(Location.latitude.is_(None))
+    ).all()
+    geocoded = 0
+    for location in locations:
+        coordinates = location_coordinates(
+            {'country': location.country, 'postcode': location.postcode}
+        )
+        if coordinates['geohash']:
+            for column, value in coordinates.items():
+                setattr(location, column, value)
+            geocoded += 1
+    db.session.commit()
+    print(f"Geocoded {geocoded} of {len(locations)} locations without coordinates")
+
+
+# Copy the whole primary database into the read replica when command
+# "flask db copy-replica" is entered. Only SQLite databases can be copied this
+# way, e.g. to try the replica locally with two database files; PostgreSQL
+# replicas are kept up to date by replication.
+@db_commands.cli.command("copy-replica")
+def db_copy_replica():
+    if 'replica' not in db.engines:
+        print("No replica is configured, set DB_REPLICA_URI first")
+        return
+    primary, replica = db.engines[None], db.engines['replica']
+    if primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+        print("Only SQLite databases can be copied")
+        return
+    source, target = primary.raw_connection(), replica.raw_connection()
+    try:
+        source.driver_connection.backup(target.driver_connection)
+    finally:
+        source.close()
+        target.close()
+    print("Replica copied")
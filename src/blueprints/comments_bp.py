@@ -4,32 +4,81 @@ A module that defines the blueprint for routes involving records in the
 """
 
 
+# Standard Library Modules
+from datetime import datetime
+
 # Third-party Library Modules
 from flask import Blueprint, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import func, tuple_
 
 # Local Modules
 from setup import db
 from models.comment import CommentSchema, Comment
-from models.item_post import ItemPostSchema, ItemPost
+from models.item_post import ItemPost
+from models.user import User
 from auth import authorize
-from utilities import attach_image, clear_attached_images
+from loading_profiles import loading_profile
+from serializers import get_schema, fast_dump
+from response_cache import add_cache_tags, cached_response, invalidate
+from replica import reads_from_replica
+from notifications import notify_comment
+from utilities import (
+    attach_image, clear_attached_images, get_requested_fields, get_page_limit,
+    encode_cursor, decode_cursor, paginated_response
+)
 
 
 comments_bp = Blueprint('comments', __name__, url_prefix='/<int:item_post_id>/comments')
 
 
-# View comments on an item post
+# View the comments on an item post, oldest first, one page at a time. Pages
+# are keyed on (time_stamp, id), so that the cost of a page does not depend on
+# the number of comments on the item post.
 @comments_bp.route('/', methods=['GET'])
+@reads_from_replica
+@cached_response()
 def view_comments(item_post_id):
-    # Selects an item post from the db that matches the id
-    stmt = db.select(ItemPost).filter_by(id=item_post_id)
-    item_post = db.session.scalar(stmt)
-    # Returns serialized information on the item post but only its comments, 
-    # or error if the item post is not found
-    if item_post:
-        return ItemPostSchema(only=["comments"]).dump(item_post), 200
-    return {'error': 'Item post not found'}, 404
+    limit = get_page_limit()
+    schema = get_schema(CommentSchema, many=True, only=get_requested_fields(), exclude=['item_post'])
+    # The page depends on the item post even if it has no comments
+    add_cache_tags(f'item_post:{item_post_id}')
+    # Selects one page of comments on the item post, with their users and
+    # images. One extra row is fetched to find out whether there is a next
+    # page. The columns of the cursor are loaded even if they are not
+    # requested.
+    stmt = (
+        db.select(Comment)
+        .options(*loading_profile(schema, Comment, ('time_stamp',)))
+        .filter_by(item_post_id=item_post_id)
+        .order_by(Comment.time_stamp, Comment.id)
+        .limit(limit + 1)
+    )
+    # Continue after the last comment of the previous page, if a cursor is
+    # given
+    cursor = request.args.get('after')
+    if cursor:
+        last_time_stamp, last_id = decode_cursor(cursor, 2)
+        try:
+            last_time_stamp, last_id = datetime.fromisoformat(last_time_stamp), int(last_id)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+        stmt = stmt.filter(tuple_(Comment.time_stamp, Comment.id) > (last_time_stamp, last_id))
+    comments = db.session.scalars(stmt).all()
+    # An empty first page may be because the item post does not exist
+    if not comments and not cursor and not db.session.get(ItemPost, item_post_id):
+        return {'error': 'Item post not found'}, 404
+    next_cursor = None
+    if len(comments) > limit:
+        comments = comments[:limit]
+        next_cursor = encode_cursor(comments[-1].time_stamp, comments[-1].id)
+    body = {'comments': fast_dump(schema, comments)}
+    # Counts every comment on the item post, if requested
+    if request.args.get('count', '').lower() in ('1', 'true', 'yes'):
+        body['total'] = db.session.scalar(
+            db.select(func.count(Comment.id)).filter_by(item_post_id=item_post_id)
+        )
+    return paginated_response(body, next_cursor)
 
 
 # Create a comment
@@ -43,20 +92,31 @@ def create_comment(item_post_id):
     if not item_post:
         return {'error': 'Item post not found'}, 404
     # Parses incoming POST request body through CommentSchema
-    comment_info = CommentSchema(only=['comment_text', 'images']).load(request.json)
+    comment_info = get_schema(CommentSchema, only=['comment_text', 'images']).load(request.json)
     comment = Comment(
         comment_text = comment_info['comment_text'],
-        user_id = get_jwt_identity(),
-        item_post_id = item_post_id
+        user = db.session.get(User, get_jwt_identity()),
+        item_post = item_post,
+        images = [],
     )
+    # Create attached image records and associate them with the new comment
+    attach_image(comment_info, comment)
     db.session.add(comment)
+    # Inserts the comment and its images, with the generated ids returned by
+    # the inserts themselves
+    db.session.flush()
+    # Serializes the comment before committing, as committing expires its
+    # attributes, which would otherwise be reloaded one query at a time
+    response = fast_dump(get_schema(CommentSchema), comment)
+    # The owner of the item post is notified in the background, by a job
+    # committed along with the comment
+    notify_comment(comment)
     db.session.commit()
-
-    # Create attached image records and associate them with the created comment
-    attach_image(comment_info, comment, "comment")
+    # Comments are shown as part of their item post
+    invalidate(f'item_post:{item_post_id}')
 
     # Return serialized information on the newly created comment
-    return CommentSchema().dump(comment), 201
+    return response, 201
 
 
 # Edit a comment
@@ -64,7 +124,7 @@ def create_comment(item_post_id):
 @jwt_required()
 def update_comment(item_post_id, comment_id):
     # Parses incoming POST request body through CommentSchema
-    comment_info = CommentSchema(only=['comment_text', 'images']).load(request.json)
+    comment_info = get_schema(CommentSchema, only=['comment_text', 'images']).load(request.json)
     # Select comment matching id params from URL query
     stmt = db.select(Comment).filter_by(id=comment_id)
     comment = db.session.scalar(stmt)
@@ -80,10 +140,11 @@ def update_comment(item_post_id, comment_id):
         # new ones based on JSON from HTTP request, if images field exist in request
         if comment_info.get('images', ''):
             clear_attached_images(comment, "comment")
-            attach_image(comment_info, comment, "comment")
+            attach_image(comment_info, comment)
         db.session.commit()
+        invalidate(f'item_post:{comment.item_post_id}')
         # Return serialized information on the newly updated comment
-        return CommentSchema().dump(comment), 201
+        return fast_dump(get_schema(CommentSchema), comment), 201
     else:
         return {'error': 'Comment not found'}, 404
 
@@ -103,6 +164,7 @@ def delete_comment(item_post_id, comment_id):
         authorize(comment.user_id, item_post.user_id)
         db.session.delete(comment)
         db.session.commit()
+        invalidate(f'item_post:{comment.item_post_id}')
         return {}, 200
     else:
         return {'error': 'Comment not found'}, 404
@@ -4,73 +4,260 @@ A module that defines the blueprint for routes involving records in the
 """
 
 
+# Standard Library Modules
+from datetime import date
+from math import cos, radians
+
 # Third-party Library Modules
 from flask import Blueprint, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from sqlalchemy import desc
+from sqlalchemy import insert, or_, tuple_
+from marshmallow.exceptions import ValidationError
 
 # Local Modules
 from setup import db
-from models.item_post import ItemPost, ItemPostSchema
+from models.item_post import ItemPost, ItemPostSchema, VALID_POST_TYPE
+from models.item_post_match import ItemPostMatch, ItemPostMatchSchema
+from models.location import Location, location_key
+from models.image import Image
+from models.user import User
 from auth import authorize
 from blueprints.comments_bp import comments_bp
 from blueprints.locations_bp import locations_bp
-from utilities import check_location, attach_image, clear_attached_images
+from loading_profiles import loading_profile
+from serializers import get_schema, fast_dump
+from response_cache import cached_response, invalidate
+from replica import reads_from_replica
+from search import search_item_posts
+from utilities import (
+    check_location, attach_image, clear_attached_images, get_page_limit,
+    get_page_offset, encode_cursor, decode_cursor, paginated_response,
+    get_requested_fields
+)
+from location_cache import resolve_locations
+from streaming import wants_stream, stream_response
+from matching import matched_by, matches_statement, rematch, update_matches
+from jobs import enqueue
+from geo import KM_PER_DEGREE, covering_cells, geohash_range
 
 
 item_posts_bp = Blueprint('item_posts', __name__, url_prefix='/item-posts')
 
+# Maximum number of item posts that can be created in one bulk request
+MAX_BULK_ITEM_POSTS = 100
+
+# Maximum radius of a search for item posts near a point
+MAX_RADIUS_KM = 50
+
 
-# Get all item posts
+# Get all item posts, one page at a time. Pages are keyed on (date, id) so
+# that the cost of a page does not depend on how deep the client has scrolled.
 @item_posts_bp.route("/")
+@reads_from_replica
+@cached_response('item_posts')
 def all_item_posts():
-    # Selects all item posts from the db
-    stmt = db.select(ItemPost).order_by(desc('date'))
-    item_posts = db.session.scalars(stmt).all()
-    # Returns serialized information on all item posts, or error if none are
-    # found
+    schema = get_schema(ItemPostSchema, many=True, only=get_requested_fields())
+    # Selects the item posts from the db, newest first. The columns of the
+    # cursor are loaded even if they are not requested.
+    stmt = (
+        db.select(ItemPost)
+        .options(*loading_profile(schema, ItemPost, ('date',)))
+        .order_by(ItemPost.date.desc(), ItemPost.id.desc())
+    )
+    # Continue after the last item post of the previous page, if a cursor
+    # is given
+    cursor = request.args.get('after')
+    if cursor:
+        last_date, last_id = decode_cursor(cursor, 2)
+        try:
+            last_date, last_id = date.fromisoformat(last_date), int(last_id)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+        stmt = stmt.filter(tuple_(ItemPost.date, ItemPost.id) < (last_date, last_id))
+    # Streams every remaining item post, if requested
+    if wants_stream():
+        return stream_response(stmt, schema)
+    # Otherwise, selects one page of item posts. One extra row is fetched to
+    # find out whether there is a next page.
+    limit = get_page_limit()
+    item_posts = db.session.scalars(stmt.limit(limit + 1)).all()
+    # Returns serialized information on the page of item posts, or error if
+    # none are found
     if item_posts:
-        return ItemPostSchema(many=True).dump(item_posts), 200
+        next_cursor = None
+        if len(item_posts) > limit:
+            item_posts = item_posts[:limit]
+            next_cursor = encode_cursor(item_posts[-1].date, item_posts[-1].id)
+        return paginated_response(fast_dump(schema, item_posts), next_cursor)
     return {'error': 'No item posts founds'}, 404
 
 
+def search_results_page(stmt):
+    """
+    Runs a search statement one page at a time, keeping the order of the
+    statement (e.g. relevance), and returns the serialized page of item posts,
+    or a stream of every remaining item post if requested.
+
+    Args:
+    1. stmt (Select): The statement selecting the matching item posts.
+    """
+    offset = get_page_offset()
+    schema = get_schema(ItemPostSchema, many=True, only=get_requested_fields())
+    stmt = stmt.options(*loading_profile(schema, ItemPost)).offset(offset)
+    if wants_stream():
+        return stream_response(stmt, schema)
+    # One extra row is fetched to find out whether there is a next page
+    limit = get_page_limit()
+    item_posts = db.session.scalars(stmt.limit(limit + 1)).all()
+    # Returns serialized information on the matching item posts, or error
+    # if none are found
+    if item_posts:
+        next_cursor = None
+        if len(item_posts) > limit:
+            item_posts = item_posts[:limit]
+            next_cursor = encode_cursor(offset + limit)
+        return paginated_response(fast_dump(schema, item_posts), next_cursor)
+    return {'error': 'No item posts found'}, 404
+
+
+# Full-text search through the title and descriptions of item posts, most
+# relevant first
+@item_posts_bp.route("/search")
+@reads_from_replica
+@cached_response('item_posts')
+def text_search_posts():
+    return search_results_page(search_item_posts(request.args.get('q', '')))
+
+
+def float_arg(name, low, high):
+    """
+    Reads a number between low and high from a query parameter of the current
+    request. Raises ValueError if it is missing or out of range.
+
+    Args:
+    1. name (str): The name of the query parameter.
+    2. low, high (float): The bounds of the number.
+    """
+    try:
+        value = float(request.args[name])
+    except (KeyError, ValueError):
+        raise ValueError(f'{name} must be a number')
+    if not low <= value <= high:
+        raise ValueError(f'{name} must be between {low} and {high}')
+    return value
+
+
+# Searches for item posts seen within a radius of a point, closest first. The
+# locations are found through the geohash index, one range scan per cell
+# covering the circle, rather than by computing the distance to every location.
+@item_posts_bp.route("/near")
+@reads_from_replica
+@cached_response('item_posts')
+def item_posts_near():
+    latitude = float_arg('lat', -90, 90)
+    longitude = float_arg('lon', -180, 180)
+    radius_km = float_arg('radius_km', 0, MAX_RADIUS_KM)
+    # Distances are compared in degrees of latitude, with longitudes scaled
+    # to match at the latitude of the point, which is accurate to well under
+    # a percent within the maximum radius
+    scale = cos(radians(latitude))
+    distance = (
+        (Location.latitude - latitude) * (Location.latitude - latitude)
+        + (Location.longitude - longitude) * scale * (Location.longitude - longitude) * scale
+    )
+    stmt = (
+        db.select(ItemPost)
+        .join(Location, ItemPost.seen_location_id == Location.id)
+        .filter(
+            or_(*(
+                Location.geohash.between(*geohash_range(cell))
+                for cell in covering_cells(latitude, longitude, radius_km)
+            )),
+            distance <= (radius_km / KM_PER_DEGREE) ** 2
+        )
+        .order_by(distance, ItemPost.id.desc())
+    )
+    # Only lost or found item posts, if requested
+    post_type = request.args.get('post_type')
+    if post_type is not None:
+        if post_type.lower() not in VALID_POST_TYPE:
+            raise ValueError(f'post_type must be one of {", ".join(VALID_POST_TYPE)}')
+        stmt = stmt.filter(ItemPost.post_type == post_type.lower())
+    return search_results_page(stmt)
+
+
 # Searches for item posts that matches certain query parameters
 @item_posts_bp.route("/<string:field>/<string:keyword>")
+@reads_from_replica
+@cached_response('item_posts')
 def search_posts(field, keyword):
     if field in ('title', 'post_type', 'category', 'status', 'date'):
+        # Keywords match anywhere in the field, e.g. "top" matches "Laptop".
+        # Ranked searches by word go through /item-posts/search instead.
         field = getattr(ItemPost, field.lower())
         # Selects item posts based on the field and keyword params from URI query
-        stmt = db.select(ItemPost).filter(field.ilike(f"%{keyword}%"))
-        item_posts = db.session.scalars(stmt).all()
-        # Returns serialized information on the matching item posts, or error 
-        # if none are found
-        if item_posts:
-            return ItemPostSchema(many=True).dump(item_posts), 200
-        return {'error': 'No item posts found'}, 404
+        stmt = (
+            db.select(ItemPost)
+            .filter(field.ilike(f"%{keyword}%"))
+            .order_by(ItemPost.id.desc())
+        )
+        return search_results_page(stmt)
     else:
         return {'error': 'Invalid field'}, 404
 
 
 # Get one item post
 @item_posts_bp.route('/<int:id>')
+@reads_from_replica
+@cached_response()
 def one_item_post(id):
+    schema = get_schema(ItemPostSchema, only=get_requested_fields())
     # Selects an item post from the db that matches the id
-    stmt = db.select(ItemPost).filter_by(id=id)
+    stmt = (
+        db.select(ItemPost)
+        .options(*loading_profile(schema, ItemPost))
+        .filter_by(id=id)
+    )
     item_post = db.session.scalar(stmt)
     # Returns serialized information on the item post, or error if the item post
     # is not found
     if item_post:
-        return ItemPostSchema().dump(item_post), 200
+        return fast_dump(schema, item_post), 200
     return {'error': 'Item post not found'}, 404
 
 
+# Get the lost or found item posts that may be the same item as an item post,
+# best match first
+@item_posts_bp.route('/<int:id>/matches')
+@reads_from_replica
+@cached_response('item_posts')
+def item_post_matches(id):
+    # The requested fields are those of the matched item posts
+    requested = get_requested_fields('item_post.')
+    schema = get_schema(
+        ItemPostMatchSchema, many=True,
+        only=None if requested is None else ['score', *requested]
+    )
+    stmt = (
+        matches_statement(id)
+        .options(*loading_profile(schema, ItemPostMatch))
+        .limit(get_page_limit())
+    )
+    matches = db.session.scalars(stmt).all()
+    # No matches may be because the item post does not exist
+    if not matches and not db.session.get(ItemPost, id):
+        return {'error': 'Item post not found'}, 404
+    return fast_dump(schema, matches), 200
+
+
 # Create a new item post
 @item_posts_bp.route('/', methods=['POST'])
 @jwt_required()
 def create_item_post():
     # Parses incoming POST request body through ItemPostSchema
-    item_post_info = ItemPostSchema(exclude=['id', 'date', 'user', 'comments']).load(request.json)
-    # Retrieve location information from parsed request
+    item_post_info = get_schema(ItemPostSchema, exclude=['id', 'date', 'user', 'comments']).load(request.json)
+    # Retrieve location information from parsed request, registering new
+    # locations in the same transaction as the item post
     seen_location, pickup_location = check_location(item_post_info)
     item_post = ItemPost(
         title = item_post_info['title'],
@@ -79,18 +266,116 @@ def create_item_post():
         item_description = item_post_info.get('item_description', ''),
         retrieval_description = item_post_info.get('retrieval_description', ''),
         status = item_post_info.get('status', 'unclaimed'),
-        user_id = get_jwt_identity(),
-        seen_location_id = seen_location.id if seen_location else None,
-        pickup_location_id = pickup_location.id if pickup_location else None,
+        user = db.session.get(User, get_jwt_identity()),
+        seen_location = seen_location,
+        pickup_location = pickup_location,
+        # A new item post has no comments yet, and setting the collections
+        # up front spares loading them when serializing
+        comments = [],
+        images = [],
     )
+    # Create attached image records and associate them with the new item post
+    attach_image(item_post_info, item_post)
     db.session.add(item_post)
+    # Inserts the new locations, the item post and its images, with the
+    # generated ids returned by the inserts themselves
+    db.session.flush()
+    # Pairs the item post with the lost or found item posts it may match
+    update_matches(item_post.id)
+    # Serializes the item post before committing, as committing expires its
+    # attributes, which would otherwise be reloaded one query at a time
+    response = fast_dump(get_schema(ItemPostSchema), item_post)
     db.session.commit()
-
-    # Create attached image records and associate them with the created item post
-    attach_image(item_post_info, item_post, "item_post")
+    # Item post listings may now include the new item post
+    invalidate('item_posts')
 
     # Returns serialized information on the new item post
-    return ItemPostSchema().dump(item_post), 201
+    return response, 201
+
+
+# Create many item posts in a single transaction
+@item_posts_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+def create_item_posts_bulk():
+    if not isinstance(request.json, list):
+        return {'error': 'Request body must be a list of item posts'}, 400
+    if len(request.json) > MAX_BULK_ITEM_POSTS:
+        return {'error': f'At most {MAX_BULK_ITEM_POSTS} item posts can be created at once'}, 400
+    # In strict mode, no item post is created if any of them is invalid
+    strict = request.args.get('strict', '').lower() in ('1', 'true', 'yes')
+
+    # Parses every item post of the request body through ItemPostSchema,
+    # keeping the valid ones and the errors of the invalid ones by index
+    try:
+        parsed = get_schema(
+            ItemPostSchema, many=True, exclude=['id', 'date', 'user', 'comments']
+        ).load(request.json)
+        errors = {}
+    except ValidationError as err:
+        parsed, errors = err.valid_data, err.messages
+    if errors and strict:
+        return {'errors': errors}, 400
+    valid = [
+        (index, item_post_info) for index, item_post_info in enumerate(parsed)
+        if index not in errors
+    ]
+    if not valid:
+        return {'errors': errors}, 400
+
+    # Finds or registers every distinct location, with at most one query each
+    location_rows = resolve_locations(
+        item_post_info[attribute]
+        for _, item_post_info in valid
+        for attribute in ('seen_location', 'pickup_location')
+        if item_post_info.get(attribute)
+    )
+
+    def location_id(item_post_info, attribute):
+        location_info = item_post_info.get(attribute)
+        return location_rows[location_key(location_info)][0] if location_info else None
+
+    # Inserts the item posts with one executemany INSERT, getting back their
+    # ids in the same order
+    rows = [
+        {
+            'title': item_post_info['title'],
+            'post_type': item_post_info['post_type'].lower(),
+            'category': item_post_info['category'].lower(),
+            'item_description': item_post_info.get('item_description', ''),
+            'retrieval_description': item_post_info.get('retrieval_description', ''),
+            'status': item_post_info.get('status', 'unclaimed'),
+            'user_id': get_jwt_identity(),
+            'seen_location_id': location_id(item_post_info, 'seen_location'),
+            'pickup_location_id': location_id(item_post_info, 'pickup_location'),
+        }
+        for _, item_post_info in valid
+    ]
+    stmt = insert(ItemPost).returning(ItemPost.id, sort_by_parameter_order=True)
+    item_post_ids = db.session.scalars(stmt, rows).all()
+
+    # Inserts the attached images of every item post with one more INSERT
+    images = [
+        {'image_url': image['image_url'], 'item_post_id': item_post_id}
+        for item_post_id, (_, item_post_info) in zip(item_post_ids, valid)
+        for image in item_post_info.get('images', [])
+    ]
+    if images:
+        db.session.execute(insert(Image), images)
+    # Pairs the new item posts with the lost or found item posts they may
+    # match in the background, as each of them may change the matches of many
+    # others
+    enqueue('match_item_posts', item_post_ids=item_post_ids)
+    db.session.commit()
+    # Item post listings may now include the new item posts
+    invalidate('item_posts')
+
+    # Returns the ids of the new item posts by their index in the request,
+    # and the errors of the invalid ones
+    created = [
+        {'index': index, 'id': item_post_id}
+        for item_post_id, (index, _) in zip(item_post_ids, valid)
+    ]
+    return {'created': created, 'errors': errors}, 201
 
 
 # Edit an item post
@@ -98,7 +383,7 @@ def create_item_post():
 @jwt_required()
 def edit_item_post(id):
     # Parses incoming POST request body through ItemPostSchema
-    item_post_info = ItemPostSchema(exclude=['id', 'date', 'user', 'comments']).load(request.json, partial=True)
+    item_post_info = get_schema(ItemPostSchema, exclude=['id', 'date', 'user', 'comments']).load(request.json, partial=True)
     # Select item post matching id params from URL query
     stmt = db.select(ItemPost).filter_by(id=id)
     item_post = db.session.scalar(stmt)
@@ -108,16 +393,21 @@ def edit_item_post(id):
         for field, value in item_post_info.items():
             if field == 'images':
                 clear_attached_images(item_post, "item_post")
-                attach_image(item_post_info, item_post, "item_post")
+                attach_image(item_post_info, item_post)
             elif field in ['seen_location', 'pickup_location']:
                 seen_location, pickup_location = check_location(item_post_info)
-                item_post.seen_location_id = seen_location.id if seen_location else item_post.seen_location_id
-                item_post.pickup_location_id = pickup_location.id if pickup_location else item_post.pickup_location_id
+                item_post.seen_location = seen_location or item_post.seen_location
+                item_post.pickup_location = pickup_location or item_post.pickup_location
             else:
                 setattr(item_post, field, value)
+        # The edit may change which item posts match it
+        db.session.flush()
+        update_matches(item_post.id)
         db.session.commit()
+        # The edit may also change which listings include the item post
+        invalidate(f'item_post:{id}', 'item_posts')
         # Returns serialized information on newly edited item post
-        return ItemPostSchema().dump(item_post), 201
+        return fast_dump(get_schema(ItemPostSchema), item_post), 201
     # Or return error if no item post matches the id
     else:
         return {'error': 'Item post not found'}, 404
@@ -133,8 +423,14 @@ def delete_item_post(id):
     if item_post:
         # Only the owner of the item post or admin is allowed to delete it
         authorize(item_post.user_id)
+        # Its comments, images and matches are deleted by the database, and
+        # the item posts it was a match of are matched again without it
+        rematched = matched_by([item_post.id])
         db.session.delete(item_post)
+        db.session.flush()
+        rematch(*rematched)
         db.session.commit()
+        invalidate(f'item_post:{id}', 'item_posts')
         return {}, 200
     else:
         return {'error': 'Item post not found'}, 404
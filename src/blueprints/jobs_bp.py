@@ -0,0 +1,101 @@
+"""
+A module that defines the blueprint for terminal commands running and
+inspecting the background job queue. See jobs.py for how jobs are queued and
+run.
+"""
+
+
+# Standard Library Modules
+from datetime import datetime, timedelta
+
+# Third-party Library Modules
+import click
+from flask import Blueprint
+from sqlalchemy import delete, func
+
+# Local Modules
+from setup import db
+from models.job import Job, VALID_JOB_STATUS
+from jobs import run_worker
+
+
+job_commands = Blueprint('jobs', __name__)
+
+
+# Run the queued jobs as they are due when command "flask jobs worker" is
+# entered, until interrupted. Several workers can run at the same time, e.g.
+# one per server.
+@job_commands.cli.command("worker")
+@click.option('--concurrency', default=4, show_default=True, help='Number of jobs run at the same time.')
+@click.option('--processes', is_flag=True, help='Run jobs in a pool of processes rather than threads.')
+@click.option('--burst', is_flag=True, help='Stop once no job is due.')
+def jobs_worker(concurrency, processes, burst):
+    print(f"Running jobs, {concurrency} at a time in {'processes' if processes else 'threads'}")
+    run_worker(concurrency=concurrency, processes=processes, burst=burst)
+
+
+# Print, for every job function, the number of jobs in each status and the
+# time they waited for a worker and ran for, when command "flask jobs stats"
+# is entered
+@job_commands.cli.command("stats")
+def jobs_stats():
+    counts = {}
+    for name, status, number in db.session.execute(
+        db.select(Job.name, Job.status, func.count()).group_by(Job.name, Job.status)
+    ):
+        counts.setdefault(name, dict.fromkeys(VALID_JOB_STATUS, 0))[status] = number
+    timings = {
+        row.name: row
+        for row in db.session.execute(
+            db.select(
+                Job.name,
+                func.avg(Job.wait).label('wait'),
+                func.avg(Job.duration).label('duration'),
+                func.max(Job.duration).label('max_duration'),
+            )
+            .filter(Job.duration.is_not(None))
+            .group_by(Job.name)
+        )
+    }
+    if not counts:
+        print("No jobs")
+        return
+    print(f"{'job':<20}" + ''.join(f"{status:>9}" for status in VALID_JOB_STATUS)
+          + f"{'avg wait':>11}{'avg run':>11}{'max run':>11}")
+    for name, statuses in sorted(counts.items()):
+        timing = timings.get(name)
+        seconds = (
+            f"{timing.wait:>10.3f}s{timing.duration:>10.3f}s{timing.max_duration:>10.3f}s"
+            if timing else f"{'-':>11}" * 3
+        )
+        print(f"{name:<20}" + ''.join(f"{statuses[status]:>9}" for status in VALID_JOB_STATUS) + seconds)
+
+
+# Delete the jobs that finished more than a number of days ago when command
+# "flask jobs prune" is entered, keeping the jobs table small
+@job_commands.cli.command("prune")
+@click.option('--days', default=7, show_default=True, help='Age in days of the finished jobs deleted.')
+@click.option('--failed', is_flag=True, help='Also delete failed jobs.')
+def jobs_prune(days, failed):
+    statuses = ('done', 'failed') if failed else ('done',)
+    deleted = db.session.execute(
+        delete(Job).filter(
+            Job.status.in_(statuses),
+            Job.finished_at < datetime.utcnow() - timedelta(days=days)
+        )
+    ).rowcount
+    db.session.commit()
+    print(f"Deleted {deleted} jobs")
+
+
+# Queue the failed jobs again when command "flask jobs retry" is entered, e.g.
+# once the cause of their failure is fixed
+@job_commands.cli.command("retry")
+def jobs_retry():
+    retried = db.session.execute(
+        db.update(Job)
+        .filter(Job.status == 'failed')
+        .values(status='queued', attempts=0, run_at=datetime.utcnow(), finished_at=None)
+    ).rowcount
+    db.session.commit()
+    print(f"Queued {retried} failed jobs again")
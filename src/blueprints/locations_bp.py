@@ -5,50 +5,113 @@ A module that defines the blueprint for routes involving records in the
 
 
 # Third-party Library Modules
-from flask import Blueprint
+from flask import Blueprint, request
 
 # Local Modules
 from setup import db
 from models.location import Location
 from models.item_post import ItemPost, ItemPostSchema
+from loading_profiles import loading_profile
+from serializers import get_schema, fast_dump
+from response_cache import cached_response
+from replica import reads_from_replica
+from streaming import wants_stream, stream_response
+from utilities import (
+    get_page_limit, encode_cursor, decode_cursor, paginated_response,
+    get_requested_fields
+)
 
 
 locations_bp = Blueprint('locations', __name__, url_prefix='/locations')
 
 
-# Searches for item posts based on seen location attribute
+# Number of digits of the postcodes searched by prefix. Longer keywords, e.g.
+# postcodes of countries with 5 digit postcodes, are matched exactly.
+POSTCODE_DIGITS = 4
+# Largest value of the postcode column
+MAX_POSTCODE = 2 ** 31 - 1
+
+
+def postcode_filter(keyword):
+    """
+    Returns a filter matching postcodes that are equal to, or start with, the
+    digits of the keyword. Postcodes are stored as integers, so a prefix such
+    as "20" is turned into the ranges 20, 200-209 and 2000-2099, which can all
+    be answered by the index on the postcode column. Keywords of more than
+    POSTCODE_DIGITS digits only match the same postcode.
+
+    Args:
+    1. keyword (str): The digits of the postcode to search for.
+    """
+    if not keyword.isdigit():
+        raise ValueError('Postcode must only contain digits')
+    prefix = int(keyword)
+    # No postcode is larger than the postcode column can hold
+    if prefix > MAX_POSTCODE:
+        return db.false()
+    if len(keyword) >= POSTCODE_DIGITS:
+        return Location.postcode == prefix
+    return db.or_(*(
+        Location.postcode.between(prefix * 10 ** n, (prefix + 1) * 10 ** n - 1)
+        for n in range(POSTCODE_DIGITS - len(keyword) + 1)
+    ))
+
+
+# Searches for item posts based on seen or pickup location attribute
 @locations_bp.route("<string:seen_or_pickup>/<string:field>/<string:keyword>")
+@reads_from_replica
+@cached_response('item_posts')
 def search_location(seen_or_pickup, field, keyword):
     # Checks if field is searchable
-    if field.lower() in ('suburb', 'state', 'postcode', 'country'):
-        field = getattr(Location, field.lower())
-        # Selects records from the locations table matching the keyword
-        stmt = db.select(Location).filter(field.ilike(f"%{keyword}%"))
-        locations = db.session.scalars(stmt).all()
-        if locations:
-            # Gets all location id from the retrieved location records
-            search_id = []
-            for location in locations:
-                search_id.append(location.id)
-            # Gets all item posts with the gathered location id
-            match seen_or_pickup:
-                case "seen":
-                    # Searches for item post based on seen location if
-                    # seen_or_pickup is "seen"
-                    stmt = db.select(ItemPost).filter(
-                        ItemPost.seen_location_id.in_(search_id)
-                    )
-                case "pickup":
-                    # Searches for item post based on pickup location if
-                    # seen_or_pickup is "pickup"
-                    stmt = db.select(ItemPost).filter(
-                        ItemPost.pickup_location_id.in_(search_id)
-                    )
-                case _:
-                    return {'error': 'Invalid URL'}, 404
-            item_posts = db.session.scalars(stmt).all()
-            # Returns serialized information on item posts matching search query
-            return ItemPostSchema(many=True).dump(item_posts), 200
-        return {'error': 'No item posts found'}, 404
-    else:
+    if field.lower() not in ('suburb', 'state', 'postcode', 'country'):
         return {'error': 'Invalid field'}, 404
+    # Gets the location foreign key to search item posts by
+    match seen_or_pickup:
+        case "seen":
+            location_id = ItemPost.seen_location_id
+        case "pickup":
+            location_id = ItemPost.pickup_location_id
+        case _:
+            return {'error': 'Invalid URL'}, 404
+    # Postcodes are matched exactly or by prefix, the other fields by
+    # substring, backed by trigram indexes on PostgreSQL
+    if field.lower() == 'postcode':
+        location_filter = postcode_filter(keyword)
+    else:
+        location_filter = getattr(Location, field.lower()).icontains(
+            keyword, autoescape=True
+        )
+    schema = get_schema(ItemPostSchema, many=True, only=get_requested_fields())
+    # Selects the item posts at a matching location in a single query,
+    # newest first
+    stmt = (
+        db.select(ItemPost)
+        .join(Location, location_id == Location.id)
+        .filter(location_filter)
+        .options(*loading_profile(schema, ItemPost))
+        .order_by(ItemPost.id.desc())
+    )
+    # Continue after the last item post of the previous page, if a cursor
+    # is given
+    cursor = request.args.get('after')
+    if cursor:
+        last_id, = decode_cursor(cursor, 1)
+        if not isinstance(last_id, int):
+            raise ValueError('Invalid cursor')
+        stmt = stmt.filter(ItemPost.id < last_id)
+    # Streams every remaining item post, if requested
+    if wants_stream():
+        return stream_response(stmt, schema)
+    # Otherwise, selects one page of item posts. One extra row is fetched to
+    # find out whether there is a next page.
+    limit = get_page_limit()
+    stmt = stmt.limit(limit + 1)
+    item_posts = db.session.scalars(stmt).all()
+    # Returns serialized information on item posts matching search query
+    if item_posts:
+        next_cursor = None
+        if len(item_posts) > limit:
+            item_posts = item_posts[:limit]
+            next_cursor = encode_cursor(item_posts[-1].id)
+        return paginated_response(fast_dump(schema, item_posts), next_cursor)
+    return {'error': 'No item posts found'}, 404
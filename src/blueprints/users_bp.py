@@ -13,8 +13,18 @@ from flask_jwt_extended import create_access_token, jwt_required
 
 # Local Modules
 from models.user import User, UserSchema
-from setup import bcrypt, db
-from auth import authorize
+from models.item_post import ItemPost
+from setup import db
+from auth import authorize, role_claims
+from hashing import hash_password, check_password
+from response_cache import invalidate
+from replica import reads_from_replica
+from purge import schedule_purge
+from matching import matched_by, rematch
+from loading_profiles import loading_profile
+from serializers import get_schema, fast_dump
+from utilities import get_requested_fields
+from streaming import wants_stream, stream_response
 
 
 users_bp = Blueprint('users', __name__, url_prefix='/users')
@@ -25,15 +35,13 @@ users_bp = Blueprint('users', __name__, url_prefix='/users')
 def register():
     try:
         # Parses incoming POST user data through the UserSchema
-        user_info = UserSchema(exclude=["id", "is_admin", "item_posts"]).load(request.json)
+        user_info = get_schema(UserSchema, exclude=["id", "is_admin", "item_posts"]).load(request.json)
         # Create a new user record with the parsed data
         user = User(
             name=user_info["name"],
             username=user_info["username"],
             email=user_info["email"],
-            password=bcrypt.generate_password_hash(user_info["password"]).decode(
-                "utf8"
-            ),
+            password=hash_password(user_info["password"]),
             private_email = user_info.get("private_email", False)
         )
 
@@ -43,7 +51,7 @@ def register():
 
         # Returns serialized information on the new user without password and 
         # admin rights
-        return UserSchema(exclude=["password", "is_admin"]).dump(user), 201
+        return fast_dump(get_schema(UserSchema, exclude=["password", "is_admin"]), user), 201
     # If username or email already exists, return error
     except IntegrityError:
         return {"error": "Username or email address already in use"}, 409
@@ -53,25 +61,39 @@ def register():
 @users_bp.route("/login", methods=["POST"])
 def login():
     # Get either username or email from the POST body
-    user_info = UserSchema(only=['username', 'email', 'password']).load(request.json, partial=True)
+    user_info = get_schema(UserSchema, only=['username', 'email', 'password']).load(request.json, partial=True)
     username_or_email = user_info.get("username") or user_info.get("email")
     # Checks if user provided either a username or email
     if username_or_email:
         # Finds a user record in the db matching either the username or email
+        # Users being deleted in the background can no longer log in
         stmt = (
             db.select(User).where(
-                (User.username == username_or_email) | (User.email == username_or_email)
+                (User.username == username_or_email) | (User.email == username_or_email),
+                User.deleted_at.is_(None)
             )
         )
         user = db.session.scalar(stmt)
     else:
         return {"error": "Username or email is required"}, 400
     # Checks if password hash matches the specified user in the db
-    if user and bcrypt.check_password_hash(user.password, request.json["password"]):
+    password_matches, new_hash = (
+        check_password(user.password, request.json["password"]) if user else (False, None)
+    )
+    if password_matches:
+        # Stores the password hashed with the configured work factor, if the
+        # work factor has changed since the password was last hashed
+        if new_hash:
+            user.password = new_hash
+            db.session.commit()
         # Create and return a JWT token + logged in user serialized information if
         # password hash matches
-        token = create_access_token(identity=user.id, expires_delta=timedelta(hours=2))
-        return {'token': token, 'user': UserSchema(exclude=['password', 'is_admin', 'item_posts']).dump(user)}, 202
+        token = create_access_token(
+            identity=user.id,
+            additional_claims=role_claims(user),
+            expires_delta=timedelta(hours=2)
+        )
+        return {'token': token, 'user': fast_dump(get_schema(UserSchema, exclude=['password', 'is_admin', 'item_posts']), user)}, 202
     # Returns error if password does not match
     else:
         return {"error": "Invalid email, username, or password"}, 401
@@ -80,28 +102,35 @@ def login():
 # Allows users to view all users
 @users_bp.route("/")
 @jwt_required()
+@reads_from_replica
 def all_users():
+    schema = get_schema(UserSchema, many=True, only=get_requested_fields(), exclude=['password'])
     # Select all users in the db
-    stmt = db.select(User)
+    stmt = db.select(User).options(*loading_profile(schema, User)).order_by(User.id)
+    # Streams the users, if requested
+    if wants_stream():
+        return stream_response(stmt, schema)
     users = db.session.scalars(stmt).all()
     # Return all users, or error if no users are found
     if users:
         # Return serialized information on all users except passwords
-        return UserSchema(many=True, exclude=['password']).dump(users), 200
+        return fast_dump(schema, users), 200
     return {'error': 'No users found'}, 404
 
 
 # Allows users to view specified user
 @users_bp.route('/<int:id>')
 @jwt_required()
+@reads_from_replica
 def one_user(id):
+    schema = get_schema(UserSchema, only=get_requested_fields(), exclude=['password'])
     # Select user that matches the specified id
-    stmt = db.select(User).filter_by(id=id)
+    stmt = db.select(User).options(*loading_profile(schema, User)).filter_by(id=id)
     user = db.session.scalar(stmt)
     # Returns the user, or error if the user is not found
     if user:
          # Returns serialized user information except password
-         return UserSchema(exclude=['password']).dump(user), 200
+         return fast_dump(schema, user), 200
     return {'error': 'User not found'}, 404
 
 
@@ -110,7 +139,7 @@ def one_user(id):
 @jwt_required()
 def update_user(id):
     # Parses incoming PUT or PATCH request body through the UserSchema
-    user_info = UserSchema().load(request.json, partial=True)
+    user_info = get_schema(UserSchema).load(request.json, partial=True)
     # Select a user record from the db that matches the id specified in the URL
     stmt = db.select(User).filter_by(id=id)
     user = db.session.scalar(stmt)
@@ -124,14 +153,16 @@ def update_user(id):
                     setattr(user, field, value)
                 # Hashes the new password if password is updated
                 elif field == 'password':
-                    user.password = bcrypt.generate_password_hash(value).decode('utf8')
+                    user.password = hash_password(value)
                 # Only admins are allowed to edit admin rights
                 elif field == 'is_admin':
                     authorize()
                     user.is_admin = value
             db.session.commit()
+            # Item posts and comments show the name and username of their user
+            invalidate(f'user:{user.id}')
             # Return serialized user information except password
-            return UserSchema(exclude=['password']).dump(user), 201
+            return fast_dump(get_schema(UserSchema, exclude=['password']), user), 201
         # IntegrityError is raised if username / email is not unique to the record,
         # and handled appropriately
         except IntegrityError:
@@ -150,8 +181,24 @@ def delete_user(user_id):
     if user:
         # Only the user itself or admin can delete the user
         authorize(user.id)
+        # Users with many records can be purged in the background, in chunks,
+        # by a job committed here. The job runs in another process, which
+        # cannot reach the response cache of this one, so the responses
+        # showing the user or their records are invalidated here.
+        if request.args.get('background', '').lower() in ('1', 'true', 'yes'):
+            schedule_purge(user.id)
+            db.session.commit()
+            invalidate(f'user:{user.id}', 'item_posts')
+            return {}, 202
+        # The user's item posts and comments, and everything attached to
+        # them, are deleted by the database. The item posts that the user's
+        # item posts were a match of are matched again without them.
+        rematched = matched_by(db.select(ItemPost.id).filter_by(user_id=user.id))
         db.session.delete(user)
+        db.session.flush()
+        rematch(*rematched)
         db.session.commit()
+        invalidate(f'user:{user.id}', 'item_posts')
         return {}, 200
     else:
         return {'error': 'User not found'}, 404
@@ -0,0 +1,203 @@
+"""
+A module that defines how the database connection pool of each process is
+configured and instrumented.
+
+The pool is sized with DB_POOL_SIZE persistent connections plus at most
+DB_MAX_OVERFLOW temporary ones, and a request waits at most DB_POOL_TIMEOUT
+seconds for a connection before failing. Every gunicorn worker has its own
+pool, so a deployment opens up to
+
+    workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+
+connections, which must stay below the max_connections of PostgreSQL minus
+the connections reserved for other clients.
+
+The pool is instrumented with the time spent waiting for a connection, the
+number of connections in use, idle and in overflow, the number of checkouts
+that timed out and the lifetime of the connections, all exposed at /metrics
+with the other metrics of the process.
+
+SQLite only enforces foreign keys, and their ON DELETE actions, on connections
+that enable them, so every SQLite connection enables them when opened.
+"""
+
+
+# Standard Library Modules
+from time import perf_counter
+
+# Third-party Library Modules
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Local Modules
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+
+# Upper bounds of the histogram buckets of each kind of measurement
+WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LIFETIME_BUCKETS = (1, 10, 60, 300, 900, 1800, 3600, 7200, 21600, 86400)
+
+# Engines whose pools are reported, by name
+_engines = {}
+
+
+def _pool_name(pool):
+    return pool.logging_name or 'default'
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    A queue pool recording how long each checkout waits for a connection,
+    including the time spent opening a new one, and the checkouts that time
+    out.
+    """
+    def connect(self):
+        start = perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.inc((_pool_name(self),))
+            raise
+        finally:
+            POOL_WAIT.observe((_pool_name(self),), perf_counter() - start)
+
+
+def engine_options(config, uri, name='default'):
+    """
+    Returns the options of an engine, from the pool settings of the app's
+    config.
+
+    Args:
+    1. config (Config): The app's config, with the DB_POOL_* settings.
+    2. uri (str): The database URI of the engine.
+    3. name (str): The name of the engine's pool in the metrics.
+    """
+    url = make_url(uri)
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_logging_name': name,
+    }
+    # In-memory SQLite databases use a single connection, which cannot be
+    # sized
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return options
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=config['DB_POOL_SIZE'],
+        max_overflow=config['DB_MAX_OVERFLOW'],
+        pool_timeout=config['DB_POOL_TIMEOUT'],
+    )
+    # PostgreSQL cancels statements running longer than the timeout
+    if url.get_backend_name() == 'postgresql' and config['DB_STATEMENT_TIMEOUT']:
+        options['connect_args'] = {
+            'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"
+        }
+    return options
+
+
+def _read_pools():
+    """
+    Returns the current size, checked out, idle and overflow connections of
+    every reported pool.
+    """
+    values = {}
+    for name, engine in _engines.items():
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        values[(name, 'size')] = pool.size()
+        values[(name, 'in_use')] = pool.checkedout()
+        values[(name, 'idle')] = pool.checkedin()
+        # Negative while the pool has not opened all of its persistent
+        # connections yet
+        values[(name, 'overflow')] = max(pool.overflow(), 0)
+    return values
+
+
+POOL_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds',
+    'Time spent waiting for a connection from the pool.',
+    WAIT_BUCKETS, labels=('pool',)
+)
+POOL_TIMEOUTS = Counter(
+    'db_pool_checkout_timeouts_total',
+    'Number of checkouts that timed out waiting for a connection.',
+    labels=('pool',)
+)
+POOL_CONNECTIONS = Gauge(
+    'db_pool_connections',
+    'Number of connections of the pool, by state.',
+    labels=('pool', 'state'), read=_read_pools
+)
+CONNECTION_LIFETIME = Histogram(
+    'db_pool_connection_lifetime_seconds',
+    'Time between opening and closing a database connection.',
+    LIFETIME_BUCKETS, labels=('pool',)
+)
+
+
+def instrument_engine(engine, name='default'):
+    """
+    Reports the pool of an engine in the metrics, and records the lifetime of
+    its connections.
+
+    Args:
+    1. engine (Engine): The engine to instrument.
+    2. name (str): The name of the engine's pool in the metrics.
+    """
+    if name in _engines:
+        return
+    _engines[name] = engine
+
+    def connect(dbapi_connection, connection_record):
+        connection_record.info['opened_at'] = perf_counter()
+
+    # Connections are closed by the pool when recycled, invalidated or
+    # discarded on overflow
+    def close(dbapi_connection, connection_record):
+        opened_at = connection_record.info.pop('opened_at', None)
+        if opened_at is not None:
+            CONNECTION_LIFETIME.observe((name,), perf_counter() - opened_at)
+
+    event.listen(engine, 'connect', connect)
+    event.listen(engine, 'close', close)
+
+
+def enforce_foreign_keys(engine):
+    """
+    Enables the foreign keys of every connection of a SQLite engine, which
+    SQLite leaves disabled by default. Other databases always enforce them.
+
+    Args:
+    1. engine (Engine): The engine of the database.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+    event.listen(engine, 'connect', connect)
+
+
+def init_connection_pool(app, db):
+    """
+    Instruments the pools of every engine of the app, and enables the foreign
+    keys of SQLite engines.
+
+    Args:
+    1. app (Flask): The Flask app.
+    2. db (SQLAlchemy): The app's SQLAlchemy extension.
+    """
+    if not _engines:
+        REGISTRY.extend([POOL_WAIT, POOL_TIMEOUTS, POOL_CONNECTIONS, CONNECTION_LIFETIME])
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            if (bind_key or 'default') not in _engines:
+                enforce_foreign_keys(engine)
+            instrument_engine(engine, bind_key or 'default')
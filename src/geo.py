@@ -0,0 +1,146 @@
+"""
+A module that defines the geographic helpers of the app: the coordinates of
+postcodes, geohashes and the geohash cells covering a search radius.
+
+Locations get the coordinates of the centroid of their postcode, from the
+offline table in data/postcode_centroids.csv (columns country, postcode,
+latitude and longitude). The bundled table covers the postcodes of the seed
+data and of the main cities, and can be replaced by a complete table in the
+same format; locations whose postcode is not in the table have no coordinates.
+
+Every location with coordinates also stores their geohash, a string whose
+prefixes are nested cells of a grid over the earth, e.g. "r3gx2" lies within
+"r3gx". A B-tree index over the geohash therefore answers "which locations are
+in this cell" with one range scan, and a radius search with one range scan per
+cell covering the circle.
+"""
+
+
+# Standard Library Modules
+import csv
+from functools import lru_cache
+from math import ceil, cos, radians
+from pathlib import Path
+
+
+# Path of the postcode centroid table
+CENTROIDS_PATH = Path(__file__).parent / 'data' / 'postcode_centroids.csv'
+
+# Length of the stored geohashes, cells of about 1.2 x 0.6 km
+GEOHASH_PRECISION = 6
+# Maximum number of cells scanned by a radius search
+MAX_COVERING_CELLS = 32
+
+# Length of a degree of latitude
+KM_PER_DEGREE = 111.195
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+@lru_cache(maxsize=1)
+def _centroids():
+    with open(CENTROIDS_PATH, newline='', encoding='utf8') as file:
+        return {
+            (row['country'].casefold(), int(row['postcode'])): (
+                float(row['latitude']), float(row['longitude'])
+            )
+            for row in csv.DictReader(file)
+        }
+
+
+def postcode_centroid(country, postcode):
+    """
+    Returns the (latitude, longitude) of the centroid of a postcode, or None
+    if the postcode is not in the centroid table.
+
+    Args:
+    1. country (str): The country of the postcode, e.g. "Australia".
+    2. postcode (int): The postcode.
+    """
+    if not country or postcode is None:
+        return None
+    return _centroids().get((country.strip().casefold(), int(postcode)))
+
+
+def geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    Returns the geohash of a point.
+
+    Args:
+    1. latitude (float): The latitude of the point, in degrees.
+    2. longitude (float): The longitude of the point, in degrees.
+    3. precision (int): The number of characters of the geohash.
+    """
+    latitude_range, longitude_range = [-90.0, 90.0], [-180.0, 180.0]
+    characters, bits, value, even = [], 0, 0, True
+    while len(characters) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        interval, coordinate = (longitude_range, longitude) if even else (latitude_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            characters.append(_BASE32[value])
+            bits, value = 0, 0
+    return ''.join(characters)
+
+
+def _cell_size(precision):
+    """
+    Returns the (height, width) in degrees of the geohash cells of a
+    precision.
+    """
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ceil(bits / 2)
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """
+    Returns the geohashes of the cells covering the bounding box of a circle,
+    as precise as possible without exceeding MAX_COVERING_CELLS cells.
+
+    Args:
+    1. latitude (float): The latitude of the center, in degrees.
+    2. longitude (float): The longitude of the center, in degrees.
+    3. radius_km (float): The radius of the circle, in kilometres.
+    """
+    latitude_delta = radius_km / KM_PER_DEGREE
+    longitude_delta = radius_km / (KM_PER_DEGREE * max(cos(radians(latitude)), 0.01))
+    south, north = max(latitude - latitude_delta, -90.0), min(latitude + latitude_delta, 90.0)
+    west, east = max(longitude - longitude_delta, -180.0), min(longitude + longitude_delta, 180.0)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = _cell_size(precision)
+        rows = ceil((north - south) / height) + 1
+        columns = ceil((east - west) / width) + 1
+        if rows * columns <= MAX_COVERING_CELLS or precision == 1:
+            break
+    # Samples the box one cell apart, including its edges, so that every
+    # cell it overlaps contains a sample
+    return sorted({
+        geohash(
+            min(south + row * height, north),
+            min(west + column * width, east),
+            precision
+        )
+        for row in range(rows)
+        for column in range(columns)
+    })
+
+
+def geohash_range(prefix):
+    """
+    Returns the lowest and highest stored geohashes within a cell, for range
+    scans of the geohash index.
+
+    Args:
+    1. prefix (str): The geohash of the cell.
+    """
+    padding = GEOHASH_PRECISION - len(prefix)
+    return prefix + _BASE32[0] * padding, prefix + _BASE32[-1] * padding
+
@@ -0,0 +1,149 @@
+"""
+A module that defines how passwords are hashed and checked. Bcrypt is
+deliberately slow, so the work runs in a dedicated pool of processes instead
+of the thread handling the request. The number of hashing jobs waiting or
+running at once is bounded; when the pool is saturated, requests fail fast
+with a 503 instead of piling up behind each other. If a process of the pool
+dies, e.g. killed by the OOM killer, the pool is replaced and the request
+that found it broken fails with a 503.
+
+The bcrypt work factor is set by the BCRYPT_LOG_ROUNDS config. When a user
+logs in with a password hashed with a different work factor, the password is
+transparently rehashed with the configured one.
+"""
+
+
+# Standard Library Modules
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore, Lock
+
+# Third-party Library Modules
+import bcrypt
+from flask import abort, current_app
+
+
+# The pool is created on first use, so that each server worker process gets
+# its own pool after it has been started
+_pool = None
+_slots = None
+_pool_lock = Lock()
+
+
+def _hash(password, rounds):
+    """
+    Hashes a password with the given bcrypt work factor. Runs in the pool.
+    """
+    return bcrypt.hashpw(password.encode('utf8'), bcrypt.gensalt(rounds)).decode('utf8')
+
+
+def _check(password_hash, password, rounds):
+    """
+    Checks a password against its hash, and rehashes it if it was hashed with
+    a work factor other than the given one. Runs in the pool.
+
+    Returns a tuple of whether the password matches, and the new hash or None.
+    """
+    if not bcrypt.checkpw(password.encode('utf8'), password_hash.encode('utf8')):
+        return False, None
+    if hash_rounds(password_hash) != rounds:
+        return True, _hash(password, rounds)
+    return True, None
+
+
+def hash_rounds(password_hash):
+    """
+    Returns the work factor a bcrypt hash was created with, e.g. 12 for
+    "$2b$12$...".
+
+    Args:
+    1. password_hash (str): The bcrypt hash.
+    """
+    return int(password_hash.split('$')[2])
+
+
+def _get_pool(config):
+    """
+    Returns the hashing pool, creating it on first use or after it broke.
+    """
+    global _pool, _slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = config['PASSWORD_HASH_WORKERS']
+                if _slots is None:
+                    _slots = BoundedSemaphore(config['PASSWORD_HASH_QUEUE_SIZE'])
+                # Processes are spawned rather than forked, as forking a
+                # multithreaded server process is unsafe
+                _pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _pool
+
+
+def _discard_pool(pool):
+    """
+    Discards a broken pool, so that the next hashing job creates a new one.
+    Does nothing if another request already replaced it.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(function, *args):
+    """
+    Runs a function in the hashing pool and waits for its result. Aborts with
+    a 503 if too many hashing jobs are already waiting or running, if the job
+    takes longer than PASSWORD_HASH_TIMEOUT seconds, or if the pool broke.
+    """
+    config = current_app.config
+    pool = _get_pool(config)
+    if not _slots.acquire(blocking=False):
+        abort(503, 'Server is busy, please try again later')
+    try:
+        future = pool.submit(function, *args)
+    except BrokenProcessPool:
+        _slots.release()
+        _discard_pool(pool)
+        abort(503, 'Server is busy, please try again later')
+    except BaseException:
+        _slots.release()
+        raise
+    # The slot is freed when the job finishes, even if the request stops
+    # waiting for it
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=config['PASSWORD_HASH_TIMEOUT'])
+    except TimeoutError:
+        abort(503, 'Server is busy, please try again later')
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        abort(503, 'Server is busy, please try again later')
+
+
+def hash_password(password):
+    """
+    Returns the bcrypt hash of a password, using the configured work factor.
+
+    Args:
+    1. password (str): The password to hash.
+    """
+    return _run(_hash, password, current_app.config['BCRYPT_LOG_ROUNDS'])
+
+
+def check_password(password_hash, password):
+    """
+    Checks a password against its hash. Returns a tuple of whether the
+    password matches, and a new hash of the password if the existing hash
+    uses a work factor other than the configured one (otherwise None).
+
+    Args:
+    1. password_hash (str): The stored bcrypt hash.
+    2. password (str): The password entered by the user.
+    """
+    return _run(_check, password_hash, password, current_app.config['BCRYPT_LOG_ROUNDS'])
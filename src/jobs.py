@@ -0,0 +1,297 @@
+"""
+A module that defines the background job queue of the app, for work that
+should not delay the response of a request, e.g. purging a deleted user or
+calling a webhook.
+
+A job is a row of the jobs table naming a job function, registered with the
+job decorator, and the keyword arguments to call it with. Routes queue jobs
+with enqueue, in the same transaction as the change they follow from, so a
+job is queued if and only if the change is committed, and the only cost to
+the request is one more INSERT.
+
+Jobs are run by "flask jobs worker", which claims the due jobs and runs them
+in a pool of threads or processes:
+
+1. On PostgreSQL, jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so
+   that any number of workers claim different jobs without waiting on each
+   other.
+2. On SQLite, which has no row locks, a job is claimed by an UPDATE that only
+   succeeds while the job is still queued, writes being serialized by the
+   database lock.
+
+A failed job is run again after JOB_RETRY_BACKOFF seconds, doubling after
+every attempt, until it has been attempted max_attempts times. A job still
+running after JOB_TIMEOUT seconds is assumed to belong to a worker that died,
+and is queued again. Jobs are therefore run at least once, and job functions
+must be safe to run again.
+
+The time every job waited for a worker and ran for is kept in its row, and
+summed up per job function by "flask jobs stats".
+"""
+
+
+# Standard Library Modules
+import os
+import random
+import signal
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from socket import gethostname
+from time import perf_counter, sleep
+from uuid import uuid4
+
+# Third-party Library Modules
+from flask import current_app
+from sqlalchemy import select, update
+
+# Local Modules
+from setup import db
+from models.job import Job
+
+
+# Longest delay between two attempts of a job, in seconds
+MAX_RETRY_BACKOFF = 3600
+
+# Job functions, by name
+_job_functions = {}
+
+# App run by the worker, inherited by the processes of a process pool
+_worker_app = None
+
+
+def job(name):
+    """
+    A decorator registering a function as a job, which can then be queued
+    with enqueue(name, **kwargs). The function is called with the keyword
+    arguments of the job in an app context, and its changes are committed
+    when it returns.
+
+    Args:
+    1. name (str): The name of the job.
+    """
+    def decorator(function):
+        _job_functions[name] = function
+        return function
+    return decorator
+
+
+def enqueue(name, key=None, delay=0, max_attempts=None, **payload):
+    """
+    Adds a job to the current session, to be run once the session is
+    committed. Returns the job, or the queued or running job with the same
+    key if there is one.
+
+    Args:
+    1. name (str): The name of the job function.
+    2. key (str): A key for which only one job is queued at a time.
+    3. delay (float): The number of seconds to wait before running the job.
+    4. max_attempts (int): The number of times the job is attempted,
+       JOB_MAX_ATTEMPTS by default.
+    5. **payload: The keyword arguments of the job function, as JSON values.
+    """
+    if name not in _job_functions:
+        raise ValueError(f'Unknown job: {name}')
+    if key is not None:
+        stmt = select(Job).filter(Job.key == key, Job.status.in_(('queued', 'running'))).limit(1)
+        existing = db.session.scalar(stmt)
+        if existing is not None:
+            return existing
+    job = Job(
+        name=name,
+        payload=payload,
+        key=key,
+        max_attempts=max_attempts or current_app.config.get('JOB_MAX_ATTEMPTS', 5),
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(job)
+    return job
+
+
+def retry_backoff(attempts):
+    """
+    Returns the number of seconds to wait before the next attempt of a job,
+    with a random part so that jobs failing together are not retried
+    together.
+
+    Args:
+    1. attempts (int): The number of attempts of the job so far.
+    """
+    base = current_app.config.get('JOB_RETRY_BACKOFF', 10)
+    delay = min(base * 2 ** (attempts - 1), MAX_RETRY_BACKOFF)
+    return delay * random.uniform(0.75, 1.25)
+
+
+def claim_jobs(worker_id, limit):
+    """
+    Marks up to limit due jobs as running for a worker, oldest first, and
+    returns their ids.
+
+    Args:
+    1. worker_id (str): The id of the worker.
+    2. limit (int): The maximum number of jobs to claim.
+    """
+    now = datetime.utcnow()
+    stmt = (
+        select(Job.id)
+        .filter(Job.status == 'queued', Job.run_at <= now)
+        .order_by(Job.run_at, Job.id)
+        .limit(limit)
+    )
+    if db.session.get_bind().dialect.name == 'postgresql':
+        stmt = stmt.with_for_update(skip_locked=True)
+    ids = db.session.scalars(stmt).all()
+    if ids:
+        db.session.execute(
+            update(Job)
+            .filter(Job.id.in_(ids), Job.status == 'queued')
+            .values(status='running', locked_by=worker_id, started_at=now, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        # Jobs claimed by another worker since they were selected were not
+        # updated
+        ids = db.session.scalars(
+            select(Job.id).filter(Job.id.in_(ids), Job.locked_by == worker_id)
+        ).all()
+    db.session.commit()
+    return ids
+
+
+def requeue_stale_jobs():
+    """
+    Queues again the jobs running for longer than JOB_TIMEOUT, whose worker
+    is assumed to have died, or fails them if they have no attempts left.
+    Returns the number of jobs queued again.
+    """
+    timeout = timedelta(seconds=current_app.config.get('JOB_TIMEOUT', 600))
+    stale = (Job.status == 'running', Job.started_at < datetime.utcnow() - timeout)
+    db.session.execute(
+        update(Job)
+        .filter(*stale, Job.attempts >= Job.max_attempts)
+        .values(status='failed', locked_by=None, finished_at=datetime.utcnow(), last_error='Timed out')
+        .execution_options(synchronize_session=False)
+    )
+    requeued = db.session.execute(
+        update(Job)
+        .filter(*stale)
+        .values(status='queued', locked_by=None, last_error='Timed out')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return requeued
+
+
+def run_job(job_id):
+    """
+    Runs a claimed job, and records its outcome and timings. Returns the
+    (name, status, duration) of the job.
+
+    Args:
+    1. job_id (int): The id of the job.
+    """
+    job = db.session.get(Job, job_id)
+    name, payload = job.name, job.payload
+    waited = (job.started_at - job.run_at).total_seconds()
+    db.session.commit()
+    start = perf_counter()
+    error = None
+    try:
+        function = _job_functions.get(name)
+        if function is None:
+            raise LookupError(f'Unknown job: {name}')
+        function(**payload)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+    duration = perf_counter() - start
+
+    job = db.session.get(Job, job_id)
+    job.wait, job.duration, job.locked_by = waited, duration, None
+    if error is None:
+        job.status, job.finished_at = 'done', datetime.utcnow()
+    elif job.attempts < job.max_attempts:
+        job.status, job.last_error = 'queued', error
+        job.run_at = datetime.utcnow() + timedelta(seconds=retry_backoff(job.attempts))
+    else:
+        job.status, job.last_error, job.finished_at = 'failed', error, datetime.utcnow()
+    status = job.status
+    db.session.commit()
+    return name, status, duration
+
+
+def _run_in_worker(job_id):
+    with _worker_app.app_context():
+        return job_id, *run_job(job_id)
+
+
+def _report(future, echo):
+    try:
+        job_id, name, status, duration = future.result()
+    except Exception:
+        # The job stays running, and is queued again once timed out
+        _worker_app.logger.exception('Recording the outcome of a job failed')
+        return
+    echo(f'{name} #{job_id} {status} in {duration:.3f}s')
+
+
+def _init_process():
+    # Connections opened by the worker before forking must not be shared with
+    # the processes of the pool
+    with _worker_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def run_worker(concurrency=4, processes=False, burst=False, echo=print):
+    """
+    Runs the jobs of the queue as they are due, up to concurrency at a time,
+    until interrupted, finishing the running jobs first. Must be called in an
+    app context.
+
+    Args:
+    1. concurrency (int): The number of jobs run at the same time.
+    2. processes (bool): Whether jobs are run in a pool of processes rather
+       than threads, e.g. for CPU bound jobs.
+    3. burst (bool): Whether to stop once no job is due, rather than waiting
+       for more.
+    4. echo (callable): Called with a line for every finished job.
+    """
+    global _worker_app
+    _worker_app = current_app._get_current_object()
+    poll_interval = current_app.config.get('JOB_POLL_INTERVAL', 1.0)
+    worker_id = f'{gethostname()}:{os.getpid()}:{uuid4().hex[:8]}'
+    if processes:
+        pool = ProcessPoolExecutor(concurrency, mp_context=get_context('fork'), initializer=_init_process)
+    else:
+        pool = ThreadPoolExecutor(concurrency, thread_name_prefix='job')
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    previous_handler = signal.signal(signal.SIGTERM, stop)
+
+    running = set()
+    try:
+        while not stopping:
+            requeue_stale_jobs()
+            claimed = claim_jobs(worker_id, concurrency - len(running)) if len(running) < concurrency else []
+            running |= {pool.submit(_run_in_worker, job_id) for job_id in claimed}
+            if not running:
+                if burst:
+                    break
+                sleep(poll_interval)
+                continue
+            finished, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in finished:
+                _report(future, echo)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.shutdown()
+        for future in running:
+            _report(future, echo)
+        signal.signal(signal.SIGTERM, previous_handler)
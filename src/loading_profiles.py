@@ -0,0 +1,135 @@
+"""
+A module that defines loading profiles, which translate the fields a schema is
+going to dump into matching SQLAlchemy eager-loading options. Applying the
+profile of a schema to a query loads every relationship the schema touches up
+front, so serializing a list of records issues a fixed number of queries
+instead of one lazy load per record and relationship.
+
+Profiles also restrict the columns each query loads to the ones the schema
+dumps, so that a schema narrowed down with only, e.g. from the "fields" query
+parameter, neither fetches the unrequested columns nor loads the unrequested
+relationships.
+
+As the fields may come from the request, the computed profiles are kept in an
+LRU cache of PROFILE_CACHE_SIZE entries, like the schemas of the serializer
+registry.
+"""
+
+
+# Standard Library Modules
+from collections import OrderedDict
+from threading import Lock
+
+# Third-party Library Modules
+from marshmallow import fields
+from sqlalchemy.orm import joinedload, load_only, selectinload
+
+
+# Number of profiles kept by the cache
+PROFILE_CACHE_SIZE = 256
+
+# Cache of computed profiles, least recently used first, keyed on the schema
+# class and the fields it dumps including those of its nested schemas, the
+# model it is applied to and the extra columns it loads
+_profiles = OrderedDict()
+_profiles_lock = Lock()
+
+
+def loading_profile(schema, model, columns=()):
+    """
+    Returns a tuple of loader options that eagerly load every relationship
+    dumped by the schema, including relationships of nested schemas, and only
+    the columns dumped by the schemas.
+    Many-to-one relationships are joined into the main query, while
+    collections are loaded with one extra SELECT ... IN query each.
+
+    Args:
+    1. schema (Schema instance): The schema, with its only / exclude
+    arguments, that will be used to serialize the query results.
+    2. model (Model class): The model that the query selects.
+    3. columns (tuple): The names of columns of the model that are loaded
+    even if the schema does not dump them, e.g. the columns of a cursor.
+    """
+    key = (_fields_signature(schema), model, columns)
+    with _profiles_lock:
+        profile = _profiles.get(key)
+        if profile is not None:
+            _profiles.move_to_end(key)
+            return profile
+    profile = tuple(_build_options(schema, model, columns))
+    with _profiles_lock:
+        _profiles[key] = profile
+        while len(_profiles) > PROFILE_CACHE_SIZE:
+            _profiles.popitem(last=False)
+    return profile
+
+
+def _fields_signature(schema):
+    """
+    Returns a hashable summary of the fields a schema dumps, recursing into
+    nested schemas, as they may be narrowed down separately, e.g. with
+    only=["comments.id"].
+
+    Args:
+    1. schema (Schema instance): The schema whose fields are summarized.
+    """
+    return (type(schema), tuple(
+        (name, _fields_signature(field.schema) if isinstance(field, fields.Nested) else None)
+        for name, field in schema.fields.items()
+    ))
+
+
+def _column_names(schema, model, columns=()):
+    """
+    Returns the names of the columns of the model to load for the schema, or
+    None if the schema dumps fields that are neither columns nor
+    relationships, in which case every column is loaded.
+
+    Args:
+    1. schema (Schema instance): The schema whose fields are dumped.
+    2. model (Model class): The model the schema serializes.
+    3. columns (tuple): The names of columns that are always loaded.
+    """
+    mapper = model.__mapper__
+    # Schemas may name columns their hooks read without dumping them
+    names = set(columns) | set(getattr(schema, 'load_columns', ()))
+    names.update(column.key for column in mapper.primary_key)
+    for name, field in schema.fields.items():
+        attribute = field.attribute or name
+        if attribute in mapper.column_attrs:
+            names.add(attribute)
+        elif attribute not in mapper.relationships:
+            return None
+    return names
+
+
+def _build_options(schema, model, columns=()):
+    """
+    Walks the nested fields of a schema and builds the loader options for the
+    columns and relationships of the model they correspond to.
+
+    Args:
+    1. schema (Schema instance): The schema whose fields are walked.
+    2. model (Model class): The model the schema serializes.
+    3. columns (tuple): The names of columns that are always loaded.
+    """
+    relationships = model.__mapper__.relationships
+    options = []
+    column_names = _column_names(schema, model, columns)
+    if column_names is not None:
+        options.append(load_only(*(getattr(model, name) for name in sorted(column_names))))
+    for name, field in schema.fields.items():
+        attribute = field.attribute or name
+        if not isinstance(field, fields.Nested) or attribute not in relationships:
+            continue
+        relationship = relationships[attribute]
+        related_model = relationship.mapper.class_
+        loader = selectinload if relationship.uselist else joinedload
+        option = loader(getattr(model, attribute))
+        # Recurse into the nested schema, so that e.g. the users and images of
+        # the comments of an item post are also loaded eagerly
+        nested_options = _build_options(field.schema, related_model)
+        if nested_options:
+            option = option.options(*nested_options)
+        options.append(option)
+    return options
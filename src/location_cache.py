@@ -0,0 +1,196 @@
+"""
+A module that defines how the locations of item posts are resolved to records
+of the locations table. Locations are identified by their normalized key, so
+that the same address is only stored once.
+
+Resolved locations are kept in an in-process LRU cache mapping keys to rows,
+so that frequently reused addresses are resolved without querying the
+database. Locations missing from the cache are looked up by key, and the
+remaining ones are inserted with a single INSERT ... ON CONFLICT DO NOTHING
+RETURNING, so that concurrent requests registering the same new address do
+not fail on the unique index.
+
+Locations resolved within a transaction only enter the cache once it is
+committed, as a rolled back insert would otherwise leave an id in the cache
+that does not exist.
+"""
+
+
+# Standard Library Modules
+from collections import OrderedDict
+from threading import Lock
+
+# Third-party Library Modules
+from flask import current_app, has_app_context
+from sqlalchemy import event, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+# Local Modules
+from setup import db
+from models.location import Location, LOCATION_COLUMNS, location_key, location_coordinates
+
+
+# Columns of a location row, as kept in the cache
+ROW_COLUMNS = ('id',) + LOCATION_COLUMNS + ('latitude', 'longitude')
+
+
+class LocationCache:
+    """
+    An in-process cache of location rows by key, evicting the least recently
+    used rows once max_entries are stored.
+    """
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._rows = OrderedDict()
+        self._lock = Lock()
+
+    def get_many(self, keys):
+        """
+        Returns a dictionary mapping the keys found in the cache to their rows.
+
+        Args:
+        1. keys (iterable): The location keys to look up.
+        """
+        found = {}
+        with self._lock:
+            for key in keys:
+                row = self._rows.get(key)
+                if row is not None:
+                    self._rows.move_to_end(key)
+                    found[key] = row
+        return found
+
+    def update(self, rows):
+        """
+        Stores location rows in the cache.
+
+        Args:
+        1. rows (dict): Location rows, as tuples of ROW_COLUMNS, by key.
+        """
+        with self._lock:
+            self._rows.update(rows)
+            for key in rows:
+                self._rows.move_to_end(key)
+            while len(self._rows) > self.max_entries:
+                self._rows.popitem(last=False)
+
+
+def _get_cache():
+    return current_app.extensions.get('location_cache') if has_app_context() else None
+
+
+@event.listens_for(Session, 'after_commit')
+def cache_resolved_locations(session):
+    """
+    Adds the locations resolved during a transaction to the cache once the
+    transaction is committed.
+    """
+    resolved = session.info.pop('resolved_locations', None)
+    cache = _get_cache()
+    if resolved and cache is not None:
+        cache.update(resolved)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def discard_resolved_locations(session, transaction):
+    """
+    Forgets the locations resolved during a transaction that was rolled back
+    or closed without committing.
+    """
+    if transaction.parent is None:
+        session.info.pop('resolved_locations', None)
+
+
+def _upsert_statement():
+    """
+    Returns an INSERT statement into the locations table that skips the
+    locations whose key already exists, on dialects that support it.
+    Elsewhere, a concurrent insert of the same location fails with an
+    IntegrityError.
+    """
+    dialect = db.session.get_bind(mapper=Location.__mapper__).dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(Location).on_conflict_do_nothing(index_elements=['location_key'])
+    if dialect == 'sqlite':
+        return sqlite.insert(Location).on_conflict_do_nothing(index_elements=['location_key'])
+    return insert(Location)
+
+
+def resolve_locations(location_infos):
+    """
+    A function that returns the rows of many locations at once, as a
+    dictionary mapping each location key to a tuple of ROW_COLUMNS. Cached
+    locations are not queried, the other existing locations are found with one
+    query, and the missing ones are inserted with one statement. Nothing is
+    committed.
+
+    Args:
+    1. location_infos (iterable): Location dictionaries parsed through the
+    LocationSchema.
+    """
+    location_infos = {
+        location_key(location_info): location_info for location_info in location_infos
+    }
+    # Locations already resolved in this transaction, then cached locations
+    resolved = db.session.info.setdefault('resolved_locations', {})
+    rows = {key: resolved[key] for key in location_infos if key in resolved}
+    cache = _get_cache()
+    if cache is not None:
+        rows.update(cache.get_many(location_infos.keys() - rows.keys()))
+
+    columns = [getattr(Location, column) for column in ROW_COLUMNS]
+
+    def select_missing():
+        missing = location_infos.keys() - rows.keys()
+        if missing:
+            stmt = db.select(Location.location_key, *columns).filter(
+                Location.location_key.in_(missing)
+            )
+            for row in db.session.execute(stmt):
+                rows[row[0]] = resolved[row[0]] = tuple(row[1:])
+
+    select_missing()
+    missing = sorted(location_infos.keys() - rows.keys())
+    if missing:
+        stmt = _upsert_statement().values([
+            {
+                **{column: location_infos[key].get(column, "") for column in LOCATION_COLUMNS},
+                **location_coordinates(location_infos[key]),
+                'location_key': key,
+            }
+            for key in missing
+        ]).returning(Location.location_key, *columns)
+        for row in db.session.execute(stmt):
+            rows[row[0]] = resolved[row[0]] = tuple(row[1:])
+        # Locations inserted concurrently by another transaction were skipped,
+        # and are selected instead
+        select_missing()
+    return rows
+
+
+def location_record(row):
+    """
+    A function that returns the Location instance of a resolved location row,
+    from the session's identity map or built from the row without querying
+    the database.
+
+    Args:
+    1. row (tuple): A location row returned by resolve_locations.
+    """
+    location = Location(**dict(zip(ROW_COLUMNS, row)))
+    make_transient_to_detached(location)
+    return db.session.merge(location, load=False)
+
+
+def init_location_cache(app):
+    """
+    Sets up the location cache of the app, holding LOCATION_CACHE_SIZE
+    locations. A size of 0 disables the cache.
+
+    Args:
+    1. app (Flask): The Flask app.
+    """
+    size = app.config.get('LOCATION_CACHE_SIZE', 4096)
+    if size > 0:
+        app.extensions['location_cache'] = LocationCache(size)
@@ -0,0 +1,311 @@
+"""
+A module that defines the matching engine, which pairs lost item posts with
+found ones that may be the same item.
+
+A candidate is an item post of the other post type, in the same category, not
+claimed yet, and posted within MATCH_WINDOW_DAYS of the item post. Candidates
+are scored between 0 and 1 from:
+
+1. The similarity of their words, the title counting more than the
+   description (TEXT_WEIGHT).
+2. How close their seen locations are, from the same location down to the
+   same state (LOCATION_WEIGHT).
+3. How close their dates are (DATE_WEIGHT).
+
+Item posts without a word in common are never matched.
+
+The matches of an item post are its MATCHES_PER_POST best candidates scoring
+at least MIN_MATCH_SCORE, stored in the item_post_matches table so that
+reading them is a single index range scan whatever the number of posts. The
+table is kept up to date incrementally when an item post is created or
+edited:
+
+1. Its own matches are recomputed.
+2. It is added to the matches of every candidate it scores high enough with,
+   whose matches are then pruned back to MATCHES_PER_POST.
+3. The item posts it was a match of are recomputed, as its edit may have
+   moved it down or out of their matches.
+
+Deleted item posts are removed from the table by the database, and the item
+posts they were a match of are then recomputed with rematch.
+"""
+
+
+# Standard Library Modules
+from datetime import timedelta
+
+# Third-party Library Modules
+from sqlalchemy import delete, func, insert, or_, select, tuple_
+from sqlalchemy.orm import aliased
+
+# Local Modules
+from setup import db
+from models.item_post import ItemPost
+from models.item_post_match import ItemPostMatch
+from models.location import Location
+from search import search_terms
+from jobs import job
+
+
+# Number of days between two item posts beyond which they are not matched
+MATCH_WINDOW_DAYS = 30
+# Maximum number of candidates scored for an item post, the latest first
+MAX_CANDIDATES = 1000
+# Number of matches stored for an item post
+MATCHES_PER_POST = 20
+# Minimum score of a stored match
+MIN_MATCH_SCORE = 0.3
+
+# Weights of the components of the score, adding up to 1
+TEXT_WEIGHT = 0.5
+LOCATION_WEIGHT = 0.3
+DATE_WEIGHT = 0.2
+
+# Words too common to tell items apart
+STOP_WORDS = frozenset((
+    'a', 'an', 'and', 'at', 'for', 'from', 'i', 'in', 'is', 'it', 'my', 'of',
+    'on', 'or', 'the', 'to', 'was', 'with',
+))
+
+# Columns of an item post and of its seen location used for scoring
+_seen = aliased(Location)
+_SCORED_COLUMNS = (
+    ItemPost.id, ItemPost.title, ItemPost.item_description, ItemPost.date,
+    _seen.id.label('location_id'), _seen.suburb, _seen.state, _seen.postcode,
+)
+
+
+def _words(text):
+    return frozenset(search_terms(text or '')) - STOP_WORDS
+
+
+def _similarity(first, second):
+    """
+    Returns the Jaccard similarity of two sets of words.
+    """
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def _location_score(first, second):
+    """
+    Returns how close two seen locations are, from 1 for the same location
+    down to 0 for different states or unknown locations.
+
+    Args:
+    1. first, second (Row): The scored columns of two item posts.
+    """
+    if first.location_id is None or second.location_id is None:
+        return 0.0
+    if first.location_id == second.location_id:
+        return 1.0
+    if first.postcode is not None and first.postcode == second.postcode:
+        return 0.8
+    if first.suburb and (first.suburb.lower(), first.state) == ((second.suburb or '').lower(), second.state):
+        return 0.7
+    if first.state and first.state == second.state:
+        return 0.2
+    return 0.0
+
+
+def score_match(first, second):
+    """
+    Returns the score, between 0 and 1, of two item posts being the same item.
+
+    Args:
+    1. first, second (Row): The scored columns of two item posts.
+    """
+    text_similarity = _similarity(
+        _words(f'{first.title} {first.item_description}'),
+        _words(f'{second.title} {second.item_description}')
+    )
+    # Item posts without a word in common are not the same item, however
+    # close they are
+    if not text_similarity:
+        return 0.0
+    title_similarity = _similarity(_words(first.title), _words(second.title))
+    days = abs((first.date - second.date).days)
+    return (
+        TEXT_WEIGHT * (0.6 * title_similarity + 0.4 * text_similarity)
+        + LOCATION_WEIGHT * _location_score(first, second)
+        + DATE_WEIGHT * max(0.0, 1 - days / MATCH_WINDOW_DAYS)
+    )
+
+
+def _scored_row(item_post_id):
+    stmt = (
+        select(*_SCORED_COLUMNS, ItemPost.post_type, ItemPost.category, ItemPost.status)
+        .outerjoin(_seen, ItemPost.seen_location_id == _seen.id)
+        .filter(ItemPost.id == item_post_id)
+    )
+    return db.session.execute(stmt).one_or_none()
+
+
+def _scored_candidates(item_post):
+    """
+    Returns the (score, id) of the candidates of an item post scoring at
+    least MIN_MATCH_SCORE, best first.
+
+    Args:
+    1. item_post (Row): The scored columns, post type, category and status of
+       the item post.
+    """
+    if item_post.status == 'claimed' or item_post.date is None:
+        return []
+    # Selects the candidates within the date window, backed by the index on
+    # (category, post_type, date)
+    window = timedelta(days=MATCH_WINDOW_DAYS)
+    stmt = (
+        select(*_SCORED_COLUMNS)
+        .outerjoin(_seen, ItemPost.seen_location_id == _seen.id)
+        .filter(
+            ItemPost.category == item_post.category,
+            ItemPost.post_type == ('found' if item_post.post_type == 'lost' else 'lost'),
+            ItemPost.date.between(item_post.date - window, item_post.date + window),
+            ItemPost.status != 'claimed',
+        )
+        .order_by(ItemPost.date.desc())
+        .limit(MAX_CANDIDATES)
+    )
+    scored = [
+        (score_match(item_post, candidate), candidate.id)
+        for candidate in db.session.execute(stmt)
+    ]
+    # Ties are broken by id, as when matches are read
+    return sorted(
+        (match for match in scored if match[0] >= MIN_MATCH_SCORE),
+        key=lambda match: (-match[0], match[1])
+    )
+
+
+def matched_by(item_post_ids):
+    """
+    Returns the ids of the other item posts that item posts are a match of,
+    which need to be rematched when they are deleted.
+
+    Args:
+    1. item_post_ids (list or Select): The ids of the item posts.
+    """
+    stmt = select(ItemPostMatch.item_post_id).filter(
+        ItemPostMatch.match_id.in_(item_post_ids),
+        ItemPostMatch.item_post_id.not_in(item_post_ids)
+    )
+    return set(db.session.scalars(stmt))
+
+
+def _prune_matches(item_post_ids):
+    """
+    Deletes the matches of item posts beyond their MATCHES_PER_POST best.
+    """
+    ranked = (
+        select(
+            ItemPostMatch.item_post_id, ItemPostMatch.match_id,
+            func.row_number().over(
+                partition_by=ItemPostMatch.item_post_id,
+                order_by=(ItemPostMatch.score.desc(), ItemPostMatch.match_id)
+            ).label('rank')
+        )
+        .filter(ItemPostMatch.item_post_id.in_(item_post_ids))
+        .subquery()
+    )
+    db.session.execute(delete(ItemPostMatch).filter(
+        tuple_(ItemPostMatch.item_post_id, ItemPostMatch.match_id).in_(
+            select(ranked.c.item_post_id, ranked.c.match_id).filter(ranked.c.rank > MATCHES_PER_POST)
+        )
+    ))
+
+
+def rematch(*item_post_ids):
+    """
+    Recomputes the matches of item posts, without changing the matches of
+    other item posts, in the current transaction. Enough when the item posts
+    did not change but their candidates did, e.g. when one of their matches
+    was deleted or after the table was emptied.
+
+    Args:
+    1. *item_post_ids (int): The ids of the item posts.
+    """
+    if not item_post_ids:
+        return
+    db.session.execute(delete(ItemPostMatch).filter(ItemPostMatch.item_post_id.in_(item_post_ids)))
+    rows = []
+    for item_post_id in item_post_ids:
+        item_post = _scored_row(item_post_id)
+        if item_post is None:
+            continue
+        rows += [
+            {'item_post_id': item_post_id, 'match_id': match_id, 'score': score}
+            for score, match_id in _scored_candidates(item_post)[:MATCHES_PER_POST]
+        ]
+    if rows:
+        db.session.execute(insert(ItemPostMatch), rows)
+
+
+def update_matches(item_post_id):
+    """
+    Recomputes the matches of a new or edited item post, which must be
+    flushed, and its place in the matches of other item posts, in the current
+    transaction. Returns the ids of the matched item posts.
+
+    Args:
+    1. item_post_id (int): The id of the item post.
+    """
+    previously_matched_by = matched_by([item_post_id])
+    db.session.execute(delete(ItemPostMatch).filter(or_(
+        ItemPostMatch.item_post_id == item_post_id,
+        ItemPostMatch.match_id == item_post_id
+    )))
+    item_post = _scored_row(item_post_id)
+    scored = _scored_candidates(item_post) if item_post is not None else []
+
+    # Stores its best candidates as its matches, and adds it to the matches
+    # of every candidate, except those it was a match of
+    partners = [match_id for _, match_id in scored if match_id not in previously_matched_by]
+    rows = [
+        {'item_post_id': item_post_id, 'match_id': match_id, 'score': score}
+        for score, match_id in scored[:MATCHES_PER_POST]
+    ] + [
+        {'item_post_id': match_id, 'match_id': item_post_id, 'score': score}
+        for score, match_id in scored
+        if match_id not in previously_matched_by
+    ]
+    if rows:
+        db.session.execute(insert(ItemPostMatch), rows)
+    # The candidates keep their best matches only, which may no longer
+    # include it
+    if partners:
+        _prune_matches(partners)
+    # The item posts it was a match of are recomputed, as it may have moved
+    # down or out of their matches
+    if previously_matched_by:
+        rematch(*previously_matched_by)
+    return [match_id for _, match_id in scored[:MATCHES_PER_POST]]
+
+
+@job('match_item_posts')
+def match_item_posts(item_post_ids):
+    """
+    Matches new item posts, e.g. those created in bulk, unless they were
+    deleted since.
+
+    Args:
+    1. item_post_ids (list): The ids of the item posts.
+    """
+    for item_post_id in item_post_ids:
+        update_matches(item_post_id)
+    db.session.commit()
+
+
+def matches_statement(item_post_id):
+    """
+    Returns a select statement for the matches of an item post, best first.
+
+    Args:
+    1. item_post_id (int): The id of the item post.
+    """
+    return (
+        db.select(ItemPostMatch)
+        .filter_by(item_post_id=item_post_id)
+        .order_by(ItemPostMatch.score.desc(), ItemPostMatch.match_id)
+    )
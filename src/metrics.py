@@ -0,0 +1,328 @@
+"""
+A module that defines the per-request performance instrumentation of the app.
+For every request it records the wall time, the number of SQL statements and
+the time spent running them, the time spent serializing with Marshmallow and
+the size of the response. These are aggregated into per-endpoint histograms
+which are exposed in the Prometheus text format at /metrics.
+
+Metrics are kept in memory per process, so with several gunicorn workers each
+worker reports its own values.
+
+As the metrics reveal the routes, their traffic and their timings, /metrics
+only answers requests with an "Authorization: Bearer <METRICS_TOKEN>" header,
+and is disabled when METRICS_TOKEN is not set.
+"""
+
+
+# Standard Library Modules
+from bisect import bisect_left
+from hmac import compare_digest
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+# Third-party Library Modules
+from flask import Response, abort, current_app, g, has_request_context, request
+from marshmallow import Schema
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Upper bounds of the histogram buckets of each kind of measurement
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """
+    A Prometheus histogram, with one series of buckets per combination of
+    label values.
+    """
+    def __init__(self, name, description, buckets, labels=('endpoint',)):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.labels = labels
+        # Maps label values to [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = Lock()
+
+    def observe(self, label_values, value):
+        """
+        Records one measurement.
+
+        Args:
+        1. label_values (tuple): The values of the histogram's labels.
+        2. value (float): The measured value.
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """
+        Returns the lines of the histogram in the Prometheus text format.
+        """
+        lines = [
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            series = {key: (list(counts), total, count)
+                      for key, (counts, total, count) in self._series.items()}
+        for label_values, (counts, total, count) in sorted(series.items()):
+            labels = ','.join(
+                f'{name}="{_escape(label_value)}"'
+                for name, label_value in zip(self.labels, label_values)
+            )
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+class Counter:
+    """
+    A Prometheus counter, with one value per combination of label values.
+    """
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, label_values, amount=1):
+        """
+        Increments the counter.
+
+        Args:
+        1. label_values (tuple): The values of the counter's labels.
+        2. amount (float): The amount to increment the counter by.
+        """
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        """
+        Returns the lines of the counter in the Prometheus text format.
+        """
+        lines = [
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} counter',
+        ]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            labels = ','.join(
+                f'{name}="{_escape(label_value)}"'
+                for name, label_value in zip(self.labels, label_values)
+            )
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return lines
+
+
+class Gauge:
+    """
+    A Prometheus gauge, whose values are read when rendered from a function
+    returning a dictionary mapping label values to values.
+    """
+    def __init__(self, name, description, labels, read):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.read = read
+
+    def render(self):
+        """
+        Returns the lines of the gauge in the Prometheus text format.
+        """
+        lines = [
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} gauge',
+        ]
+        for label_values, value in sorted(self.read().items()):
+            labels = ','.join(
+                f'{name}="{_escape(label_value)}"'
+                for name, label_value in zip(self.labels, label_values)
+            )
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return lines
+
+
+def _escape(value):
+    """
+    Escapes a label value for the Prometheus text format.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# All metrics exposed at /metrics. Other modules may append their own metric
+# objects, or callables returning lines, to this list.
+REGISTRY = []
+
+REQUESTS = Counter(
+    'http_requests_total', 'Number of requests handled.',
+    labels=('endpoint', 'method', 'status')
+)
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Wall time spent handling a request.',
+    LATENCY_BUCKETS
+)
+SQL_STATEMENTS = Histogram(
+    'http_request_sql_statements', 'Number of SQL statements run by a request.',
+    STATEMENT_BUCKETS
+)
+SQL_DURATION = Histogram(
+    'http_request_sql_duration_seconds', 'Time spent running SQL statements in a request.',
+    LATENCY_BUCKETS
+)
+SERIALIZATION_DURATION = Histogram(
+    'http_request_serialization_duration_seconds',
+    'Time spent serializing with Marshmallow in a request.',
+    LATENCY_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Size of the response body.',
+    SIZE_BUCKETS
+)
+REGISTRY.extend([
+    REQUESTS, REQUEST_DURATION, SQL_STATEMENTS, SQL_DURATION,
+    SERIALIZATION_DURATION, RESPONSE_SIZE,
+])
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Timings are kept on the connection, as the same statement may run
+    # outside of a request, e.g. from CLI commands
+    conn.info.setdefault('query_start', []).append((context, perf_counter()))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_statement(conn)
+
+
+def _handle_error(exception_context):
+    # A statement that raised is not followed by after_cursor_execute, so its
+    # timing is taken off the connection here, unless it failed before it was
+    # run, e.g. while being compiled
+    conn = exception_context.connection
+    started = conn.info.get('query_start') if conn is not None else None
+    if started and started[-1][0] is exception_context.execution_context:
+        _record_statement(conn)
+
+
+def _record_statement(conn):
+    _, start = conn.info['query_start'].pop()
+    if has_request_context() and 'metrics_start' in g:
+        g.sql_statements += 1
+        g.sql_duration += perf_counter() - start
+
+
+@contextmanager
+def timed_serialization():
+    """
+    A context manager recording the time spent in its block as serialization
+    time of the current request. Blocks nested in another timed block, e.g.
+    the dumps of nested schemas, are not timed again.
+    """
+    if not has_request_context() or 'metrics_start' not in g or g.dumping:
+        yield
+        return
+    g.dumping = True
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        g.serialization_duration += perf_counter() - start
+        g.dumping = False
+
+
+def _timed_dump(dump):
+    """
+    Wraps Schema.dump so that the time spent serializing during a request is
+    recorded.
+    """
+    def wrapper(self, *args, **kwargs):
+        with timed_serialization():
+            return dump(self, *args, **kwargs)
+    wrapper.__wrapped__ = dump
+    return wrapper
+
+
+def _start_request():
+    g.metrics_start = perf_counter()
+    g.sql_statements = 0
+    g.sql_duration = 0.0
+    g.serialization_duration = 0.0
+    g.dumping = False
+
+
+def _record_request(response):
+    if 'metrics_start' not in g:
+        return response
+    endpoint = (request.endpoint or 'unmatched',)
+    REQUESTS.inc(endpoint + (request.method, str(response.status_code)))
+    REQUEST_DURATION.observe(endpoint, perf_counter() - g.metrics_start)
+    SQL_STATEMENTS.observe(endpoint, g.sql_statements)
+    SQL_DURATION.observe(endpoint, g.sql_duration)
+    SERIALIZATION_DURATION.observe(endpoint, g.serialization_duration)
+    # Streamed responses have no known size
+    if response.content_length is not None:
+        RESPONSE_SIZE.observe(endpoint, response.content_length)
+    return response
+
+
+def render_metrics():
+    """
+    Returns every metric of the registry in the Prometheus text format.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric() if callable(metric) else metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app):
+    """
+    Installs the request instrumentation on the app and registers the
+    /metrics endpoint.
+
+    Args:
+    1. app (Flask): The Flask app to instrument.
+    """
+    if not getattr(Schema.dump, '__wrapped__', None):
+        Schema.dump = _timed_dump(Schema.dump)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def start_request():
+        # Scrapes of /metrics itself are not recorded
+        if request.endpoint != 'metrics':
+            _start_request()
+
+    app.after_request(_record_request)
+
+    @app.route('/metrics')
+    def metrics():
+        # Disabled unless a token is set, and only served to who has it
+        token = current_app.config.get('METRICS_TOKEN')
+        if not token:
+            abort(404)
+        # Compared as bytes, as compare_digest rejects non-ASCII strings
+        authorization = request.headers.get('Authorization', '').encode()
+        if not compare_digest(authorization, f'Bearer {token}'.encode()):
+            abort(401)
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
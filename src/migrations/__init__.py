@@ -0,0 +1,184 @@
+"""
+A package that defines the schema migrations of the database, which evolve a
+live database to match the models without recreating it.
+
+Every module of this package named "m<number>_<description>" is a migration,
+applied once, in the order of the numbers, by "flask db upgrade". Applied
+migrations are recorded in the schema_migrations table. A database created
+with "flask db create" already matches the models, so every migration is
+recorded as applied when it is created.
+
+A migration defines an upgrade(connection) function, run in a transaction of
+its own unless the module sets transactional = False, e.g. to build indexes
+concurrently on PostgreSQL, which cannot be done in a transaction. Migrations
+are applied while the app is running, so they must keep the schema usable by
+the running version of the app and not lock busy tables for long:
+
+1. Indexes are built with create_index, which builds them concurrently on
+   PostgreSQL, without blocking writes to the table.
+2. Columns are added as nullable or with a constant default, backfilled in
+   batches, and only then made required.
+3. Columns and tables are only dropped once no running version uses them.
+4. SQLite cannot drop constraints or make columns required, so tables whose
+   constraints change are rebuilt from the models there, keeping their rows.
+
+Every statement should be safe to run again, e.g. with IF NOT EXISTS, as a
+migration that fails outside of a transaction is run again from the start.
+"""
+
+
+# Standard Library Modules
+import importlib
+import pkgutil
+import re
+from contextlib import contextmanager
+from datetime import datetime
+
+# Third-party Library Modules
+from sqlalchemy import Column, DateTime, MetaData, String, Table, text
+from sqlalchemy.schema import CreateIndex
+
+
+# Key of the PostgreSQL advisory lock held while migrating, so that two
+# deployments never migrate at the same time
+MIGRATION_LOCK_KEY = 8236104
+
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', String(100), primary_key=True),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def migrations():
+    """
+    Returns the (version, module) of every migration, in the order they are
+    applied.
+    """
+    names = sorted(
+        (int(match.group(1)), info.name)
+        for info in pkgutil.iter_modules(__path__)
+        if (match := re.fullmatch(r'm(\d+)_\w+', info.name))
+    )
+    return [(name, importlib.import_module(f'{__name__}.{name}')) for _, name in names]
+
+
+def applied_versions(engine):
+    """
+    Returns the set of the versions of the migrations applied to a database.
+
+    Args:
+    1. engine (Engine): The engine of the database.
+    """
+    with engine.begin() as connection:
+        schema_migrations.create(connection, checkfirst=True)
+        return set(connection.scalars(schema_migrations.select().with_only_columns(
+            schema_migrations.c.version
+        )))
+
+
+def _record(connection, version):
+    connection.execute(schema_migrations.insert().values(
+        version=version, applied_at=datetime.utcnow()
+    ))
+
+
+def stamp(engine):
+    """
+    Records every migration as applied, e.g. for a database just created from
+    the models.
+
+    Args:
+    1. engine (Engine): The engine of the database.
+    """
+    applied = applied_versions(engine)
+    with engine.begin() as connection:
+        for version, _ in migrations():
+            if version not in applied:
+                _record(connection, version)
+
+
+@contextmanager
+def _migration_lock(engine):
+    """
+    A context manager holding the migration lock of a PostgreSQL database.
+    SQLite databases are not shared between servers and need no lock.
+    """
+    if engine.dialect.name != 'postgresql':
+        yield
+        return
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as lock:
+        lock.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+        try:
+            yield
+        finally:
+            lock.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+
+
+def upgrade(engine, echo=print):
+    """
+    Applies the migrations not applied to a database yet, in order. Returns
+    the versions of the applied migrations.
+
+    Args:
+    1. engine (Engine): The engine of the database.
+    2. echo (callable): Called with a progress message for each migration.
+    """
+    with _migration_lock(engine):
+        applied = applied_versions(engine)
+        done = []
+        for version, module in migrations():
+            if version in applied:
+                continue
+            echo(f'Applying {version}')
+            if getattr(module, 'transactional', True):
+                with engine.begin() as connection:
+                    module.upgrade(connection)
+                    _record(connection, version)
+            else:
+                with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                    module.upgrade(connection)
+                with engine.begin() as connection:
+                    _record(connection, version)
+            done.append(version)
+        return done
+
+
+def create_index(connection, table, name):
+    """
+    Builds an index of the models if it does not exist, concurrently on
+    PostgreSQL, where the connection must be in autocommit mode. An invalid
+    index left behind by a failed concurrent build is dropped and built again.
+
+    Args:
+    1. connection (Connection): The connection of the migration.
+    2. table (Table): The table of the index, e.g. ItemPost.__table__.
+    3. name (str): The name of the index, as defined in the models.
+    """
+    index = next(index for index in table.indexes if index.name == name)
+    statement = str(CreateIndex(index, if_not_exists=True).compile(dialect=connection.dialect))
+    build_index(connection, name, statement)
+
+
+def build_index(connection, name, statement):
+    """
+    Runs a CREATE INDEX IF NOT EXISTS statement, concurrently on PostgreSQL,
+    where the connection must be in autocommit mode, e.g. for indexes that
+    are not part of the models. An invalid index left behind by a failed
+    concurrent build is dropped and built again.
+
+    Args:
+    1. connection (Connection): The connection of the migration.
+    2. name (str): The name of the index.
+    3. statement (str): The statement creating the index.
+    """
+    if connection.dialect.name == 'postgresql':
+        invalid = connection.scalar(text(
+            "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+            "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+        ), {'name': name})
+        if invalid:
+            connection.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+        statement = re.sub(r'^CREATE (UNIQUE )?INDEX', r'CREATE \1INDEX CONCURRENTLY', statement)
+    connection.exec_driver_sql(statement)
@@ -0,0 +1,42 @@
+"""
+A migration that adds the indexes of the foreign keys of the item_posts,
+comments and images tables, and of the date, status and category columns of
+item posts, to databases created before they were part of the models.
+"""
+
+
+# Local Modules
+from migrations import create_index
+from models.item_post import ItemPost
+from models.comment import Comment
+from models.image import Image
+
+
+# The indexes are built concurrently on PostgreSQL, outside of a transaction
+transactional = False
+
+# Indexes of the models added by this migration, by table
+INDEXES = (
+    (ItemPost.__table__, (
+        'ix_item_posts_user_id',
+        'ix_item_posts_seen_location_id',
+        'ix_item_posts_pickup_location_id',
+        'ix_item_posts_date_id',
+        'ix_item_posts_status',
+        'ix_item_posts_category_post_type_date',
+    )),
+    (Comment.__table__, (
+        'ix_comments_item_post_id_time_stamp',
+        'ix_comments_user_id',
+    )),
+    (Image.__table__, (
+        'ix_images_item_post_id',
+        'ix_images_comment_id',
+    )),
+)
+
+
+def upgrade(connection):
+    for table, names in INDEXES:
+        for name in names:
+            create_index(connection, table, name)
@@ -0,0 +1,106 @@
+"""
+A migration that makes the foreign keys of the item_posts, comments and
+images tables delete their records along with the records they refer to (ON
+DELETE CASCADE), in databases created before they were part of the models.
+
+On PostgreSQL, each foreign key is replaced by one added as NOT VALID, which
+only locks the tables briefly, and then validated without blocking writes.
+
+SQLite cannot alter a constraint, but the actions of a foreign key do not
+change how the table is stored, so the ON DELETE clause is added to the
+definition of the table in the schema, as described in "Making Other Kinds Of
+Table Schema Changes" of the SQLite documentation.
+"""
+
+
+# Standard Library Modules
+import re
+
+# Third-party Library Modules
+from sqlalchemy import inspect
+
+# Local Modules
+from models.item_post import ItemPost
+from models.comment import Comment
+from models.image import Image
+
+
+# The constraints are validated on PostgreSQL outside of the transaction that
+# adds them, so that writes are only blocked while they are added
+transactional = False
+
+# Longest wait for the lock of a table before giving up, rather than blocking
+# every query queued behind the migration
+LOCK_TIMEOUT = '5s'
+
+
+def cascading_foreign_keys():
+    """
+    Returns the (table, column, referred table) of the foreign keys of the
+    models that delete their records on cascade.
+    """
+    return [
+        (table.name, foreign_key.parent.name, foreign_key.column.table.name)
+        for table in (ItemPost.__table__, Comment.__table__, Image.__table__)
+        for foreign_key in sorted(table.foreign_keys, key=lambda key: key.parent.name)
+        if foreign_key.ondelete == 'CASCADE'
+    ]
+
+
+def _upgrade_postgresql(connection):
+    inspector = inspect(connection)
+    connection.exec_driver_sql(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+    try:
+        for table, column, referred_table in cascading_foreign_keys():
+            constraint = next(
+                key for key in inspector.get_foreign_keys(table)
+                if key['constrained_columns'] == [column]
+            )
+            name = constraint['name']
+            if constraint['options'].get('ondelete', '').upper() != 'CASCADE':
+                connection.exec_driver_sql(
+                    f'ALTER TABLE {table} DROP CONSTRAINT {name}, '
+                    f'ADD CONSTRAINT {name} FOREIGN KEY ({column}) '
+                    f'REFERENCES {referred_table} (id) ON DELETE CASCADE NOT VALID'
+                )
+            # Also completes a constraint left not valid by a failed run
+            connection.exec_driver_sql(f'ALTER TABLE {table} VALIDATE CONSTRAINT {name}')
+    finally:
+        connection.exec_driver_sql('RESET lock_timeout')
+
+
+def _upgrade_sqlite(connection):
+    definitions = dict(connection.exec_driver_sql(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table'"
+    ).all())
+    changed = {}
+    for table, column, referred_table in cascading_foreign_keys():
+        sql = changed.get(table, definitions[table])
+        changed[table] = re.sub(
+            rf'(FOREIGN KEY\s*\(\s*"?{column}"?\s*\)\s*REFERENCES\s+"?{referred_table}"?\s*\(\s*"?id"?\s*\))'
+            r'(?!\s*ON DELETE)',
+            r'\1 ON DELETE CASCADE',
+            sql
+        )
+    changed = {table: sql for table, sql in changed.items() if sql != definitions[table]}
+    if not changed:
+        return
+    schema_version = connection.exec_driver_sql('PRAGMA schema_version').scalar()
+    connection.exec_driver_sql('PRAGMA writable_schema = ON')
+    try:
+        for table, sql in changed.items():
+            connection.exec_driver_sql(
+                "UPDATE sqlite_master SET sql = ? WHERE type = 'table' AND name = ?",
+                (sql, table)
+            )
+        # Makes every connection reload the schema
+        connection.exec_driver_sql(f'PRAGMA schema_version = {schema_version + 1}')
+    finally:
+        connection.exec_driver_sql('PRAGMA writable_schema = OFF')
+
+
+def upgrade(connection):
+    if connection.dialect.name == 'postgresql':
+        _upgrade_postgresql(connection)
+    elif connection.dialect.name == 'sqlite':
+        _upgrade_sqlite(connection)
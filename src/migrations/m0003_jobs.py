@@ -0,0 +1,12 @@
+"""
+A migration that creates the jobs table of the background job queue, in
+databases created before it was part of the models.
+"""
+
+
+# Local Modules
+from models.job import Job
+
+
+def upgrade(connection):
+    Job.__table__.create(connection, checkfirst=True)
@@ -0,0 +1,161 @@
+"""
+A migration that identifies locations by the normalized key of their address,
+in databases created before the location_key column was part of the models.
+The column is added as nullable and backfilled in batches, locations whose
+addresses only differ in case or whitespace are merged, the unique index over
+the key is built, the column is made required and the unique constraint over
+the seven address columns is dropped.
+
+SQLite cannot drop a constraint or make a column required, so the locations
+table is rebuilt from the models instead, as described in "Making Other Kinds
+Of Table Schema Changes" of the SQLite documentation.
+"""
+
+
+# Third-party Library Modules
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+
+# Local Modules
+from migrations import create_index
+from models.location import Location, LOCATION_COLUMNS, location_key
+
+
+# Building the unique index concurrently on PostgreSQL must be done outside
+# of a transaction
+transactional = False
+
+# Number of locations updated per statement by the backfill
+BATCH_SIZE = 1000
+
+
+def _columns(connection):
+    return {column['name'] for column in inspect(connection).get_columns('locations')}
+
+
+def _address_constraint(connection):
+    """
+    Returns the unique constraint over the address columns, or None if it was
+    dropped.
+    """
+    return next((
+        constraint
+        for constraint in inspect(connection).get_unique_constraints('locations')
+        if sorted(constraint['column_names']) == sorted(LOCATION_COLUMNS)
+    ), None)
+
+
+def _backfill_keys(connection):
+    columns = ', '.join(LOCATION_COLUMNS)
+    last_id = 0
+    while True:
+        rows = connection.execute(text(
+            f'SELECT id, {columns} FROM locations '
+            'WHERE id > :last_id AND location_key IS NULL ORDER BY id LIMIT :limit'
+        ), {'last_id': last_id, 'limit': BATCH_SIZE}).mappings().all()
+        if not rows:
+            return
+        connection.execute(
+            text('UPDATE locations SET location_key = :key WHERE id = :id'),
+            [{'id': row['id'], 'key': location_key(row)} for row in rows]
+        )
+        last_id = rows[-1]['id']
+
+
+def _merge_duplicates(connection):
+    """
+    Merges the locations with the same key into the oldest of them, pointing
+    the item posts at it before deleting the others.
+    """
+    rows = connection.execute(text(
+        'SELECT location_key, id FROM locations WHERE location_key IN ('
+        'SELECT location_key FROM locations GROUP BY location_key HAVING count(*) > 1'
+        ') ORDER BY location_key, id'
+    )).all()
+    kept, duplicates = {}, []
+    for key, location_id in rows:
+        if key in kept:
+            duplicates.append({'id': location_id, 'kept': kept[key]})
+        else:
+            kept[key] = location_id
+    if not duplicates:
+        return
+    for column in ('seen_location_id', 'pickup_location_id'):
+        connection.execute(
+            text(f'UPDATE item_posts SET {column} = :kept WHERE {column} = :id'),
+            duplicates
+        )
+    connection.execute(
+        text('DELETE FROM locations WHERE id = :id'),
+        [{'id': duplicate['id']} for duplicate in duplicates]
+    )
+
+
+def _upgrade_postgresql(connection):
+    connection.exec_driver_sql('ALTER TABLE locations ADD COLUMN IF NOT EXISTS location_key VARCHAR(32)')
+    _backfill_keys(connection)
+    _merge_duplicates(connection)
+    create_index(connection, Location.__table__, 'ix_locations_location_key')
+    # Locations inserted by the running version of the app in the meantime
+    _backfill_keys(connection)
+    # A validated check constraint lets SET NOT NULL skip scanning the table
+    # while holding an exclusive lock on it
+    connection.exec_driver_sql('ALTER TABLE locations DROP CONSTRAINT IF EXISTS locations_location_key_not_null')
+    connection.exec_driver_sql(
+        'ALTER TABLE locations ADD CONSTRAINT locations_location_key_not_null '
+        'CHECK (location_key IS NOT NULL) NOT VALID'
+    )
+    connection.exec_driver_sql('ALTER TABLE locations VALIDATE CONSTRAINT locations_location_key_not_null')
+    connection.exec_driver_sql('ALTER TABLE locations ALTER COLUMN location_key SET NOT NULL')
+    connection.exec_driver_sql('ALTER TABLE locations DROP CONSTRAINT locations_location_key_not_null')
+    constraint = _address_constraint(connection)
+    if constraint is not None:
+        connection.exec_driver_sql(f'ALTER TABLE locations DROP CONSTRAINT {constraint["name"]}')
+
+
+def _rebuild_sqlite(connection):
+    """
+    Replaces the locations table with one created from the models, keeping
+    its rows and ids.
+    """
+    columns = ', '.join(name for name in Location.__table__.columns.keys() if name in _columns(connection))
+    create = str(CreateTable(Location.__table__).compile(dialect=connection.dialect))
+    create = create.replace('CREATE TABLE locations', 'CREATE TABLE locations_new', 1)
+    # Dropping the old table must not set the locations of item posts to
+    # NULL, and foreign keys can only be disabled outside of a transaction
+    connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+    try:
+        connection.exec_driver_sql('BEGIN')
+        try:
+            connection.exec_driver_sql('DROP TABLE IF EXISTS locations_new')
+            connection.exec_driver_sql(create)
+            connection.exec_driver_sql(
+                f'INSERT INTO locations_new ({columns}) SELECT {columns} FROM locations'
+            )
+            connection.exec_driver_sql('DROP TABLE locations')
+            connection.exec_driver_sql('ALTER TABLE locations_new RENAME TO locations')
+            if connection.exec_driver_sql('PRAGMA foreign_key_check').first() is not None:
+                raise RuntimeError('Rebuilding the locations table broke a foreign key')
+            connection.exec_driver_sql('COMMIT')
+        except Exception:
+            connection.exec_driver_sql('ROLLBACK')
+            raise
+    finally:
+        connection.exec_driver_sql('PRAGMA foreign_keys = ON')
+
+
+def _upgrade_sqlite(connection):
+    if 'location_key' not in _columns(connection):
+        connection.exec_driver_sql('ALTER TABLE locations ADD COLUMN location_key VARCHAR(32)')
+    _backfill_keys(connection)
+    _merge_duplicates(connection)
+    if _address_constraint(connection) is not None:
+        _rebuild_sqlite(connection)
+    create_index(connection, Location.__table__, 'ix_locations_location_key')
+
+
+def upgrade(connection):
+    if connection.dialect.name == 'postgresql':
+        _upgrade_postgresql(connection)
+    else:
+        _upgrade_sqlite(connection)
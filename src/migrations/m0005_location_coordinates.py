@@ -0,0 +1,57 @@
+"""
+A migration that adds the coordinates of locations and their geohash, used
+by radius searches, to databases created before they were part of the
+models. The columns are added as nullable, filled in batches from the
+postcode centroid table, and the geohash index is built.
+"""
+
+
+# Third-party Library Modules
+from sqlalchemy import inspect, text
+
+# Local Modules
+from migrations import create_index
+from models.location import Location, location_coordinates
+
+
+# The index is built concurrently on PostgreSQL, outside of a transaction
+transactional = False
+
+# Columns added by this migration
+COORDINATE_COLUMNS = ('latitude', 'longitude', 'geohash')
+
+# Number of locations read per batch of the backfill
+BATCH_SIZE = 1000
+
+
+def upgrade(connection):
+    existing = {column['name'] for column in inspect(connection).get_columns('locations')}
+    for name in COORDINATE_COLUMNS:
+        if name not in existing:
+            column_type = Location.__table__.c[name].type.compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f'ALTER TABLE locations ADD COLUMN {name} {column_type}')
+
+    # Locations whose postcode has no known centroid keep no coordinates, so
+    # the backfill goes through the locations by id rather than until none
+    # is left without coordinates
+    last_id = 0
+    while True:
+        rows = connection.execute(text(
+            'SELECT id, country, postcode FROM locations '
+            'WHERE id > :last_id AND geohash IS NULL ORDER BY id LIMIT :limit'
+        ), {'last_id': last_id, 'limit': BATCH_SIZE}).mappings().all()
+        if not rows:
+            break
+        updates = [
+            {'id': row['id'], **coordinates}
+            for row in rows
+            if (coordinates := location_coordinates(row))['geohash'] is not None
+        ]
+        if updates:
+            connection.execute(text(
+                'UPDATE locations SET latitude = :latitude, longitude = :longitude, '
+                'geohash = :geohash WHERE id = :id'
+            ), updates)
+        last_id = rows[-1]['id']
+
+    create_index(connection, Location.__table__, 'ix_locations_geohash')
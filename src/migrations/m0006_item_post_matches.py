@@ -0,0 +1,16 @@
+"""
+A migration that creates the item_post_matches table of the matching engine,
+in databases created before it was part of the models.
+
+Matches are otherwise only computed when item posts are created or edited, so
+the matches of the existing item posts are computed afterwards with "flask db
+rebuild-matches".
+"""
+
+
+# Local Modules
+from models.item_post_match import ItemPostMatch
+
+
+def upgrade(connection):
+    ItemPostMatch.__table__.create(connection, checkfirst=True)
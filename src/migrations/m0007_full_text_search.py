@@ -0,0 +1,32 @@
+"""
+A migration that adds the full-text search structures of item posts to
+databases created before they were part of the models: the generated
+search_vector column and its GIN index on PostgreSQL, or the FTS5 table and
+the triggers keeping it in sync on SQLite.
+
+On PostgreSQL, adding a stored generated column rewrites the item_posts
+table while holding an exclusive lock on it, so this migration should be
+applied at a quiet time on large tables. The GIN index is then built
+concurrently.
+"""
+
+
+# Local Modules
+from migrations import build_index
+from models.item_post import FTS_DDL, SEARCH_VECTOR_COLUMN_DDL, SEARCH_VECTOR_INDEX_DDL
+
+
+# The index is built concurrently on PostgreSQL, outside of a transaction
+transactional = False
+
+
+def upgrade(connection):
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql(SEARCH_VECTOR_COLUMN_DDL)
+        build_index(connection, 'ix_item_posts_search_vector', SEARCH_VECTOR_INDEX_DDL)
+    elif connection.dialect.name == 'sqlite':
+        for statement in FTS_DDL:
+            connection.exec_driver_sql(statement)
+        # Indexes the existing item posts, from scratch so that a run
+        # interrupted after creating the table is completed
+        connection.exec_driver_sql("INSERT INTO item_posts_fts(item_posts_fts) VALUES ('rebuild')")
@@ -0,0 +1,28 @@
+"""
+A migration that adds the indexes of location searches to databases created
+before they were part of the models: the postcode index, and on PostgreSQL
+the pg_trgm extension and the trigram indexes of substring searches.
+"""
+
+
+# Local Modules
+from migrations import create_index
+from models.location import Location, TRIGRAM_EXTENSION_DDL
+
+
+# The indexes are built concurrently on PostgreSQL, outside of a transaction
+transactional = False
+
+TRIGRAM_INDEXES = (
+    'ix_locations_suburb_trgm',
+    'ix_locations_state_trgm',
+    'ix_locations_country_trgm',
+)
+
+
+def upgrade(connection):
+    create_index(connection, Location.__table__, 'ix_locations_postcode')
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql(TRIGRAM_EXTENSION_DDL)
+        for name in TRIGRAM_INDEXES:
+            create_index(connection, Location.__table__, name)
@@ -0,0 +1,19 @@
+"""
+A migration that adds the deleted_at column of users, which disables the
+accounts being deleted in the background, to databases created before it was
+part of the models.
+"""
+
+
+# Third-party Library Modules
+from sqlalchemy import inspect
+
+# Local Modules
+from models.user import User
+
+
+def upgrade(connection):
+    existing = {column['name'] for column in inspect(connection).get_columns('users')}
+    if 'deleted_at' not in existing:
+        column_type = User.__table__.c.deleted_at.type.compile(dialect=connection.dialect)
+        connection.exec_driver_sql(f'ALTER TABLE users ADD COLUMN deleted_at {column_type}')
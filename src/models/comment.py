@@ -23,11 +23,22 @@ class Comment(db.Model):
 
     # Attributes
     comment_text = db.Column(db.Text, nullable=False)
-    time_stamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow())
+    time_stamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
     # Foreign Keys
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    item_post_id = db.Column(db.Integer, db.ForeignKey('item_posts.id'), nullable=False)
+    # Deleted along with their user or item post. Indexed for the comments of
+    # a user, e.g. when the user is deleted.
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True
+    )
+    item_post_id = db.Column(
+        db.Integer,
+        db.ForeignKey('item_posts.id', ondelete='CASCADE'),
+        nullable=False
+    )
 
     # Relationships
     user = db.relationship('User', back_populates='comments')
@@ -36,8 +47,15 @@ class Comment(db.Model):
         'Image',
         back_populates='comment',
         # Deletes and update all its associated comments when an item post is 
-        # deleted or updated
-        cascade='all, delete'
+        # deleted or updated. Images that are not loaded are deleted by the
+        # database.
+        cascade='all, delete',
+        passive_deletes=True
+    )
+
+    __table_args__ = (
+        # Index for the comments of an item post, oldest first
+        db.Index('ix_comments_item_post_id_time_stamp', 'item_post_id', 'time_stamp', 'id'),
     )
 
 class CommentSchema(ma.Schema):
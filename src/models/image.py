@@ -25,11 +25,18 @@ class Image(db.Model):
     image_url = db.Column(db.String, nullable=False)
 
     # Foreign Keys
+    # Deleted along with their item post or comment. Indexed for the images
+    # of an item post or a comment.
     item_post_id = db.Column(
         db.Integer,
-        db.ForeignKey('item_posts.id'),
+        db.ForeignKey('item_posts.id', ondelete='CASCADE'),
+        index=True
+    )
+    comment_id = db.Column(
+        db.Integer,
+        db.ForeignKey('comments.id', ondelete='CASCADE'),
+        index=True
     )
-    comment_id = db.Column(db.Integer, db.ForeignKey('comments.id'))
 
     # Relationships
     item_post = db.relationship('ItemPost', back_populates='images')
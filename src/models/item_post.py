@@ -3,11 +3,12 @@ A module containing the model and schema of an item post record in the database.
 """
 
 # Standard Library Modules
-from datetime import datetime
+from datetime import date
 
 # Third-party Library Modules
 from marshmallow import fields
 from marshmallow.validate import OneOf, Regexp, Length, And
+from sqlalchemy import DDL, event
 
 # Local Modules
 from setup import db, ma
@@ -44,13 +45,18 @@ class ItemPost(db.Model):
     item_description = db.Column(db.Text)
     retrieval_description = db.Column(db.Text)
     status = db.Column(db.String(10), nullable=False, default='unclaimed')
-    date = db.Column(db.Date, default=datetime.now().strftime('%Y-%m-%d'))
+    # Callable default, so the date is taken when the post is created rather
+    # than when the app is started
+    date = db.Column(db.Date, default=date.today)
 
     # Foreign keys
     user_id = db.Column(
         db.Integer,
-        db.ForeignKey('users.id'),
+        # Deleted along with the user
+        db.ForeignKey('users.id', ondelete='CASCADE'),
         nullable=False,
+        # Indexed for the item posts of a user
+        index=True
     )
     seen_location_id = db.Column(
         db.Integer,
@@ -58,7 +64,9 @@ class ItemPost(db.Model):
             'locations.id',
             # Set this key to NULL if referred location is deleted
             ondelete='SET NULL'
-        )
+        ),
+        # Indexed for joins from locations in location searches
+        index=True
     )
     pickup_location_id = db.Column(
         db.Integer,
@@ -66,7 +74,9 @@ class ItemPost(db.Model):
             'locations.id',
             # Set this key to NULL if referred location is deleted
             ondelete='SET NULL'
-        )
+        ),
+        # Indexed for joins from locations in location searches
+        index=True
     )
 
     # Relationships
@@ -75,15 +85,19 @@ class ItemPost(db.Model):
         'Comment',
         back_populates='item_post',
         # Deletes or updates all its associated comments when an item post is
-        # deleted or updated
-        cascade='all, delete'
+        # deleted or updated. Comments that are not loaded are deleted by the
+        # database.
+        cascade='all, delete',
+        passive_deletes=True
     )
     images = db.relationship(
         'Image',
         back_populates='item_post',
         # Deletes or updates all its associated images when an item post is
-        # deleted or updated
-        cascade='all, delete'
+        # deleted or updated. Images that are not loaded are deleted by the
+        # database.
+        cascade='all, delete',
+        passive_deletes=True
     )
     seen_location = db.relationship('Location',
         back_populates='item_post_seen',
@@ -94,6 +108,73 @@ class ItemPost(db.Model):
         foreign_keys=[pickup_location_id]
     )
 
+    # Index backing the (date, id) keyset pagination of item post listings,
+    # index of the candidates of the matching engine, also used for category
+    # searches, and index for status searches
+    __table_args__ = (
+        db.Index('ix_item_posts_date_id', 'date', 'id'),
+        db.Index('ix_item_posts_category_post_type_date', 'category', 'post_type', 'date'),
+        db.Index('ix_item_posts_status', 'status'),
+    )
+
+
+# Full-text search structures, created and dropped together with the
+# item_posts table, and added to existing databases by a migration. See
+# search.py for how they are queried.
+
+# On PostgreSQL, a generated tsvector column kept up to date by the database,
+# weighting title (A) over item_description (B) and retrieval_description (C),
+# and a GIN index over it
+SEARCH_VECTOR_COLUMN_DDL = (
+    "ALTER TABLE item_posts ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(item_description, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(retrieval_description, '')), 'C')"
+    ") STORED"
+)
+SEARCH_VECTOR_INDEX_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_item_posts_search_vector ON item_posts "
+    "USING GIN (search_vector)"
+)
+for statement in (SEARCH_VECTOR_COLUMN_DDL, SEARCH_VECTOR_INDEX_DDL):
+    event.listen(
+        ItemPost.__table__, 'after_create',
+        DDL(statement).execute_if(dialect='postgresql')
+    )
+
+# On SQLite, an external content FTS5 table kept in sync with triggers, with
+# bm25 column weights matching the PostgreSQL ones
+FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS item_posts_fts USING fts5("
+    "title, item_description, retrieval_description, "
+    "content='item_posts', content_rowid='id', tokenize='porter unicode61')",
+    "INSERT INTO item_posts_fts(item_posts_fts, rank) "
+    "VALUES ('rank', 'bm25(10.0, 4.0, 1.0)')",
+    "CREATE TRIGGER IF NOT EXISTS item_posts_fts_insert AFTER INSERT ON item_posts BEGIN "
+    "INSERT INTO item_posts_fts(rowid, title, item_description, retrieval_description) "
+    "VALUES (new.id, new.title, new.item_description, new.retrieval_description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS item_posts_fts_delete AFTER DELETE ON item_posts BEGIN "
+    "INSERT INTO item_posts_fts(item_posts_fts, rowid, title, item_description, retrieval_description) "
+    "VALUES ('delete', old.id, old.title, old.item_description, old.retrieval_description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS item_posts_fts_update AFTER UPDATE ON item_posts BEGIN "
+    "INSERT INTO item_posts_fts(item_posts_fts, rowid, title, item_description, retrieval_description) "
+    "VALUES ('delete', old.id, old.title, old.item_description, old.retrieval_description); "
+    "INSERT INTO item_posts_fts(rowid, title, item_description, retrieval_description) "
+    "VALUES (new.id, new.title, new.item_description, new.retrieval_description); "
+    "END",
+)
+for statement in FTS_DDL:
+    event.listen(
+        ItemPost.__table__, 'after_create',
+        DDL(statement).execute_if(dialect='sqlite')
+    )
+event.listen(ItemPost.__table__, 'before_drop', DDL(
+    "DROP TABLE IF EXISTS item_posts_fts"
+).execute_if(dialect='sqlite'))
+
 
 class ItemPostSchema(ma.Schema):
     """
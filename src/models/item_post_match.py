@@ -0,0 +1,57 @@
+"""
+A module containing the model and schema of an item post match record in the
+database.
+"""
+
+
+# Third-party Library Modules
+from marshmallow import fields
+
+# Local Modules
+from setup import db, ma
+
+
+class ItemPostMatch(db.Model):
+    """
+    Creates the table structure of the "item_post_matches" table using
+    SQLAlchemy. Every item post has a row for each of its best matches, so
+    that its matches are read from one index range. See matching.py for how
+    matches are scored and kept up to date.
+    """
+    __tablename__ = "item_post_matches"
+
+    # Primary Key, also the index of the matches of an item post
+    item_post_id = db.Column(
+        db.Integer,
+        db.ForeignKey('item_posts.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    match_id = db.Column(
+        db.Integer,
+        db.ForeignKey('item_posts.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+
+    # Attributes
+    score = db.Column(db.Float, nullable=False)
+
+    # Relationships
+    match = db.relationship('ItemPost', foreign_keys=[match_id])
+
+    # Index for the matches of an item post, best first
+    __table_args__ = (
+        db.Index('ix_item_post_matches_item_post_id_score', 'item_post_id', 'score'),
+    )
+
+
+class ItemPostMatchSchema(ma.Schema):
+    """
+    Defines the schema to convert an "item_post_match" record using
+    Marshmallow into a readable format.
+    """
+    score = fields.Float()
+    item_post = fields.Nested('ItemPostSchema', attribute='match', exclude=['comments'])
+
+    class Meta:
+        ordered = True
+        fields = ("score", "item_post")
@@ -0,0 +1,54 @@
+"""
+A module containing the model of a background job record in the database.
+"""
+
+# Standard Library Modules
+from datetime import datetime
+
+# Local Modules
+from setup import db
+
+
+VALID_JOB_STATUS = (
+    'queued', 'running', 'done', 'failed'
+)
+
+
+class Job(db.Model):
+    """
+    Creates the table structure of the "jobs" table using SQLAlchemy. Every
+    job is a call to a registered job function, run by a worker outside of
+    the request that queued it. See jobs.py for how jobs are run.
+    """
+    __tablename__ = "jobs"
+
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Attributes
+    # Name of the job function, and the keyword arguments it is called with
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    # Jobs with the same key are not queued twice, e.g. "purge_user:5"
+    key = db.Column(db.String(200), index=True)
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    last_error = db.Column(db.Text)
+    # Callable defaults, so the times are taken when the job is queued
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # The job is not run before this time, pushed back after a failed attempt
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    # Worker running the job
+    locked_by = db.Column(db.String(64))
+    # Seconds between the job being due and its last attempt starting, and
+    # seconds its last attempt ran for
+    wait = db.Column(db.Float)
+    duration = db.Column(db.Float)
+
+    # Index of the jobs due to run, oldest first
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at', 'id'),
+    )
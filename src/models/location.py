@@ -3,13 +3,65 @@ A module containing the model and schema of a location record in the database.
 """
 
 
+# Standard Library Modules
+from hashlib import blake2b
+
 # Third-party Library Modules
 from marshmallow import fields, validates, ValidationError
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import DDL, event
 
 # Local Modules
 from setup import db, ma
 from models.item_post import ItemPost
+from geo import GEOHASH_PRECISION, postcode_centroid, geohash
+
+
+# Columns whose values together identify a location
+LOCATION_COLUMNS = (
+    "unit_number", "street_number", "street_name", "suburb", "state",
+    "postcode", "country"
+)
+
+
+def location_key(location_info):
+    """
+    A function that returns the normalized key of a location, a hash of its
+    address in which case and whitespace are ignored, so that e.g.
+    "Mascot " and "mascot" are the same location.
+
+    Args:
+    1. location_info (dict): A location dictionary parsed through the
+    LocationSchema, or the parameters of a location being inserted.
+    """
+    address = '\x1f'.join(
+        ' '.join(str(location_info.get(column) or '').split()).casefold()
+        for column in LOCATION_COLUMNS
+    )
+    return blake2b(address.encode('utf8'), digest_size=16).hexdigest()
+
+
+def location_coordinates(location_info):
+    """
+    A function that returns the latitude, longitude and geohash of a
+    location, from the centroid of its postcode, all None if the postcode has
+    no known centroid.
+
+    Args:
+    1. location_info (dict): A location dictionary parsed through the
+    LocationSchema, or the parameters of a location being inserted.
+    """
+    centroid = postcode_centroid(location_info.get('country'), location_info.get('postcode'))
+    if centroid is None:
+        return {'latitude': None, 'longitude': None, 'geohash': None}
+    return {'latitude': centroid[0], 'longitude': centroid[1], 'geohash': geohash(*centroid)}
+
+
+def _coordinate_default(column):
+    """
+    Returns a column default filling in one of the location_coordinates of
+    the location being inserted.
+    """
+    return lambda context: location_coordinates(context.get_current_parameters())[column]
 
 
 class Location(db.Model):
@@ -29,6 +81,17 @@ class Location(db.Model):
     state = db.Column(db.String, nullable=False)
     postcode = db.Column(db.Integer, nullable=False)
     country = db.Column(db.String, nullable=False)
+    # Normalized key of the address, filled in from the other columns
+    location_key = db.Column(
+        db.String(32),
+        nullable=False,
+        default=lambda context: location_key(context.get_current_parameters())
+    )
+    # Coordinates of the centroid of the postcode, if known, and their
+    # geohash for radius searches
+    latitude = db.Column(db.Float, default=_coordinate_default('latitude'))
+    longitude = db.Column(db.Float, default=_coordinate_default('longitude'))
+    geohash = db.Column(db.String(GEOHASH_PRECISION), default=_coordinate_default('geohash'))
 
     # Relationships
     item_post_seen = db.relationship('ItemPost',
@@ -38,11 +101,32 @@ class Location(db.Model):
         back_populates='pickup_location',
         foreign_keys=[ItemPost.pickup_location_id])
 
-    # Unique Constraint Combination
     __table_args__ = (
-        UniqueConstraint("unit_number", "street_number", "street_name", "suburb", "state", "postcode", "country"),
+        # Each address is stored once, identified by its normalized key
+        db.Index('ix_locations_location_key', 'location_key', unique=True),
+        # Index for exact and prefix postcode searches
+        db.Index('ix_locations_postcode', 'postcode'),
+        # Index for the cells of radius searches
+        db.Index('ix_locations_geohash', 'geohash'),
+        # Trigram indexes for substring searches on PostgreSQL
+        *(
+            db.Index(
+                f'ix_locations_{name}_trgm', name,
+                postgresql_using='gin',
+                postgresql_ops={name: 'gin_trgm_ops'},
+            ).ddl_if(dialect='postgresql')
+            for name in ('suburb', 'state', 'country')
+        ),
     )
 
+
+# The trigram indexes need the pg_trgm extension on PostgreSQL
+TRIGRAM_EXTENSION_DDL = "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+event.listen(Location.__table__, 'before_create', DDL(
+    TRIGRAM_EXTENSION_DDL
+).execute_if(dialect='postgresql'))
+
+
 class LocationSchema(ma.Schema):
     """
     Defines the schema to convert a "location" record using Marshmallow into a
@@ -55,6 +139,8 @@ class LocationSchema(ma.Schema):
     state = fields.String(required=True)
     postcode = fields.Integer(required=True)
     country = fields.String(required=True)
+    latitude = fields.Float(dump_only=True)
+    longitude = fields.Float(dump_only=True)
 
     # Ensures unit number is a string containing only digits
     @validates('unit_number')
@@ -71,4 +157,5 @@ class LocationSchema(ma.Schema):
     class Meta:
         ordered = True
         fields = ("id", "unit_number", "street_number", "street_name",
-                  "suburb", "state", "postcode", "country")
+                  "suburb", "state", "postcode", "country", "latitude",
+                  "longitude")
@@ -26,15 +26,22 @@ class User(db.Model):
     password = db.Column(db.String, nullable=False)
     private_email = db.Column(db.Boolean, default=False)
     is_admin = db.Column(db.Boolean, default=False)
+    # Set when the user is deleted in the background, which disables the
+    # account until the purge deletes it
+    deleted_at = db.Column(db.DateTime)
 
-    # Relationships
+    # Relationships. The item posts and comments of a deleted user are
+    # deleted by the database, through the ON DELETE CASCADE of their
+    # foreign keys, rather than loaded and deleted one by one.
     item_posts = db.relationship('ItemPost',
         back_populates='user',
-        cascade='all, delete'
+        cascade='all, delete',
+        passive_deletes=True
     )
     comments = db.relationship('Comment',
         back_populates='user',
-        cascade='all, delete'
+        cascade='all, delete',
+        passive_deletes=True
     )
 
 class UserSchema(ma.Schema):
@@ -62,18 +69,23 @@ class UserSchema(ma.Schema):
         many=True
     )
 
+    # Columns read by hide_email, loaded even when they are not dumped
+    load_columns = ('private_email',)
+
     # Makes sure email is hidden with 'PRIVATE' when serializing responses
-    # containing user data if private_email is set to True for that user
-    @post_dump(pass_many=True)
-    def hide_email(self, data, many, **kwargs):
+    # containing user data if private_email is set to True for that user.
+    # The setting is read from the user itself, so that the email stays hidden
+    # when private_email is not among the dumped fields.
+    @post_dump(pass_many=True, pass_original=True)
+    def hide_email(self, data, original, many, **kwargs):
         # For when a list of users is dumped
         if many:
-            for user_data in data:
-                if 'private_email' in user_data and user_data['private_email']:
+            for user_data, user in zip(data, original):
+                if 'email' in user_data and user.private_email:
                     user_data['email'] = 'PRIVATE'
         # For when a single user is dumped
         else:
-            if 'private_email' in data and data['private_email']:
+            if 'email' in data and original.private_email:
                 data['email'] = 'PRIVATE'
 
         return data
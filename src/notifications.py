@@ -0,0 +1,79 @@
+"""
+A module that defines the notifications sent by the app to a webhook, e.g. to
+let the owner of an item post know that someone commented on it.
+
+Notifications are sent as JSON POST requests to NOTIFICATION_WEBHOOK_URL,
+from background jobs, so that a slow or unavailable webhook never delays the
+request they follow from and is retried with backoff. No notifications are
+sent when NOTIFICATION_WEBHOOK_URL is not set.
+"""
+
+
+# Standard Library Modules
+import json
+from urllib.request import Request, urlopen
+
+# Third-party Library Modules
+from flask import current_app
+
+# Local Modules
+from setup import db
+from models.comment import Comment
+from jobs import enqueue, job
+
+
+def send_notification(body):
+    """
+    Posts a notification to the webhook, raising an error if it is not
+    accepted.
+
+    Args:
+    1. body (dict): The notification, as JSON values.
+    """
+    request = Request(
+        current_app.config['NOTIFICATION_WEBHOOK_URL'],
+        data=json.dumps(body).encode(),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    timeout = current_app.config.get('NOTIFICATION_TIMEOUT', 10)
+    with urlopen(request, timeout=timeout) as response:
+        response.read()
+
+
+@job('notify_comment')
+def send_comment_notification(comment_id):
+    """
+    Notifies the owner of an item post of a comment on it, unless the comment
+    was deleted since.
+
+    Args:
+    1. comment_id (int): The id of the comment.
+    """
+    comment = db.session.get(Comment, comment_id)
+    if comment is None:
+        return
+    send_notification({
+        'event': 'comment.created',
+        'comment_id': comment.id,
+        'comment_text': comment.comment_text,
+        'item_post_id': comment.item_post_id,
+        'item_post_title': comment.item_post.title,
+        'recipient_id': comment.item_post.user_id,
+        'author_id': comment.user_id,
+    })
+
+
+def notify_comment(comment):
+    """
+    Queues the notification of a new comment in the current session, if
+    notifications are enabled and the comment is not on the author's own item
+    post.
+
+    Args:
+    1. comment (Comment): The comment, flushed.
+    """
+    if not current_app.config.get('NOTIFICATION_WEBHOOK_URL'):
+        return
+    if comment.user_id != comment.item_post.user_id:
+        enqueue('notify_comment', comment_id=comment.id)
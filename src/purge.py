@@ -0,0 +1,95 @@
+"""
+A module that defines the background purge of users, for deletions too large
+to run within a request.
+
+Deleting a user deletes their item posts and comments, and with them every
+comment, image and match of their item posts, through the ON DELETE CASCADE
+of the foreign keys. For a user with many item posts, this is one transaction
+holding locks on thousands of rows for as long as it runs. A purge instead
+deletes the item posts and then the comments of the user in chunks of
+PURGE_CHUNK_SIZE, one transaction each, and the user last, in a background
+job, so the request deleting the user returns at once. The request marks the
+user as deleted, which disables their account straight away.
+
+A purge interrupted by a failure or a restart carries on from where it
+stopped when its job is run again. The request queuing the purge invalidates
+the cached responses of its server process, and the job invalidates them again
+once done, which reaches the server only with a cache backend shared between
+processes.
+"""
+
+
+# Standard Library Modules
+from datetime import datetime
+
+# Third-party Library Modules
+from flask import current_app
+from sqlalchemy import delete, select, update
+
+# Local Modules
+from setup import db
+from models.comment import Comment
+from models.item_post import ItemPost
+from models.user import User
+from response_cache import invalidate
+from jobs import enqueue, job
+from matching import matched_by, rematch
+
+
+def _delete_in_chunks(model, user_id, chunk_size):
+    """
+    Deletes the records of a user, chunk_size at a time, one transaction per
+    chunk. Returns the ids of the deleted records.
+
+    The item posts that deleted item posts were a match of are matched again
+    without them, in the same transaction.
+    """
+    deleted = []
+    while True:
+        ids = db.session.scalars(
+            select(model.id).filter_by(user_id=user_id).order_by(model.id).limit(chunk_size)
+        ).all()
+        if not ids:
+            return deleted
+        rematched = matched_by(ids) if model is ItemPost else ()
+        db.session.execute(delete(model).filter(model.id.in_(ids)))
+        rematch(*rematched)
+        db.session.commit()
+        deleted.extend(ids)
+
+
+@job('purge_user')
+def purge_user(user_id, chunk_size=None):
+    """
+    Deletes a user, their item posts and their comments, in chunks. Returns
+    whether the user existed.
+
+    Args:
+    1. user_id (int): The id of the user.
+    2. chunk_size (int): The number of records deleted per transaction,
+       PURGE_CHUNK_SIZE by default.
+    """
+    chunk_size = chunk_size or current_app.config.get('PURGE_CHUNK_SIZE', 500)
+    item_post_ids = _delete_in_chunks(ItemPost, user_id, chunk_size)
+    invalidate('item_posts', *(f'item_post:{id}' for id in item_post_ids))
+    # The comments of the user on the item posts of others
+    _delete_in_chunks(Comment, user_id, chunk_size)
+    deleted = db.session.execute(delete(User).filter_by(id=user_id)).rowcount > 0
+    db.session.commit()
+    invalidate(f'user:{user_id}', 'item_posts')
+    return deleted
+
+
+def schedule_purge(user_id):
+    """
+    Disables a user and queues their purge in the current session, so that
+    the user can no longer log in or use their tokens while their records
+    are being deleted. A user already being purged is not purged twice.
+
+    Args:
+    1. user_id (int): The id of the user.
+    """
+    db.session.execute(
+        update(User).filter_by(id=user_id, deleted_at=None).values(deleted_at=datetime.utcnow())
+    )
+    enqueue('purge_user', key=f'purge_user:{user_id}', user_id=user_id)
@@ -0,0 +1,142 @@
+"""
+A module that defines how read-only routes are sent to a read replica of the
+database, when DB_REPLICA_URI is set.
+
+Routes decorated with reads_from_replica run their queries on the "replica"
+bind instead of the primary database. Anything flushed, e.g. by a route that
+writes after all, still goes to the primary.
+
+Replicas lag behind the primary, so a client that has just written would not
+necessarily see its own write on the replica. Every request that commits a
+change therefore returns the time of the write, both in an "X-Last-Write"
+header and in a "last_write" cookie, and requests sending back a time younger
+than DB_REPLICA_STICKY_SECONDS keep reading from the primary. Browsers send
+the cookie back on their own; API clients, which authenticate with JWT
+tokens and usually ignore cookies, send the header back. Both work whichever
+server process handles the next request. For the same reason, responses read
+from the replica are not cached shortly after a write.
+
+Locally, the replica can be a copy of a SQLite primary, refreshed with
+"flask db copy-replica".
+"""
+
+
+# Standard Library Modules
+from functools import wraps
+from time import monotonic, time
+
+# Third-party Library Modules
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+
+# Name of the cookie, and of the header, holding the time of the client's
+# last write
+LAST_WRITE_COOKIE = 'last_write'
+LAST_WRITE_HEADER = 'X-Last-Write'
+
+# Monotonic time of the last write committed by this process
+_last_write = 0.0
+
+
+class RoutingSession(Session):
+    """
+    A session running the queries of read-only routes on the replica.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and has_request_context()
+            and g.get('use_replica')
+        ):
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_sticky():
+    """
+    A function that returns whether the client of the current request wrote
+    recently enough that the replica may not have its write yet.
+    """
+    # The header is preferred, as API clients may keep an older cookie
+    last_write = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE, 0)
+    try:
+        last_write = float(last_write)
+    except ValueError:
+        return False
+    return time() - last_write < current_app.config['DB_REPLICA_STICKY_SECONDS']
+
+
+def reads_from_replica(view):
+    """
+    A decorator running the queries of a read-only route on the replica, if
+    there is one and the client has not written recently.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = 'replica' in current_app.config['SQLALCHEMY_BINDS'] and not _is_sticky()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def replica_is_current():
+    """
+    A function that returns whether the data read by the current request is
+    current, i.e. it was read from the primary, or from the replica long
+    enough after the last write of this process.
+    """
+    return (
+        not g.get('use_replica')
+        or monotonic() - _last_write >= current_app.config['DB_REPLICA_STICKY_SECONDS']
+    )
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def record_write(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def record_statement_write(orm_execute_state):
+    # INSERT, UPDATE and DELETE statements run with session.execute are not
+    # flushed
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def commit_write(session):
+    global _last_write
+    if session.info.pop('wrote', False):
+        _last_write = monotonic()
+        if has_request_context():
+            g.wrote_at = time()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def discard_write(session):
+    session.info.pop('wrote', None)
+
+
+def _set_last_write(response):
+    if 'wrote_at' in g and 'replica' in current_app.config['SQLALCHEMY_BINDS']:
+        response.headers[LAST_WRITE_HEADER] = f'{g.wrote_at:.3f}'
+        response.set_cookie(
+            LAST_WRITE_COOKIE, f'{g.wrote_at:.3f}',
+            max_age=current_app.config['DB_REPLICA_STICKY_SECONDS'],
+            httponly=True, samesite='Lax'
+        )
+    return response
+
+
+def init_replica(app):
+    """
+    Returns the time of their write to the clients that wrote, so that they
+    keep reading from the primary until the replica has their writes.
+
+    Args:
+    1. app (Flask): The Flask app.
+    """
+    app.after_request(_set_last_write)
@@ -0,0 +1,242 @@
+"""
+A module that defines the response cache of the read-only routes. Responses
+are cached by route and arguments, and served with a strong ETag so that
+clients sending a matching If-None-Match header get a 304 Not Modified.
+
+Every cached response is tagged with the records it was built from, e.g.
+"item_post:5" and "user:2", which are collected as the records are loaded
+while the route runs, plus any fixed tags given to the route, e.g.
+"item_posts" for listings. Write routes invalidate precisely the tags of the
+records they change, after committing.
+
+Invalidation only reaches the backend of the process that made the change.
+The in-process LRU cache is therefore off by default, as other server
+processes and the job worker would leave it stale. When enabled with
+RESPONSE_CACHE_SIZE, e.g. for a single server process, its entries expire
+after RESPONSE_CACHE_MAX_AGE seconds, which bounds how long a change made by
+another process can go unseen. Deployments with several processes should
+configure a backend shared between them with RESPONSE_CACHE_BACKEND.
+"""
+
+
+# Standard Library Modules
+from collections import OrderedDict
+from functools import wraps
+from hashlib import blake2b
+from itertools import count
+from threading import Lock
+from time import monotonic
+
+# Third-party Library Modules
+from flask import current_app, g, has_request_context, make_response, request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# Local Modules
+from replica import replica_is_current
+from models.comment import Comment
+from models.item_post import ItemPost
+from models.user import User
+
+
+# Response headers that are stored with a cached response
+CACHED_HEADERS = ('Content-Type', 'Vary', 'X-Next-Cursor')
+
+
+class LRUBackend:
+    """
+    An in-process cache backend, evicting the least recently used responses
+    once max_entries are stored, and expiring responses max_age seconds after
+    they are stored. Other backends, e.g. one shared between server
+    processes, must provide the same tick, get, set and invalidate methods.
+    """
+    def __init__(self, max_entries=1024, max_age=30):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        # Maps each tag to the keys of the entries tagged with it
+        self._keys_by_tag = {}
+        # Maps each tag to the tick at which it was last invalidated
+        self._invalidated_at = {}
+        self._clock = count(1)
+        self._lock = Lock()
+
+    def tick(self):
+        """
+        Returns an increasing number, to be taken before building a response
+        and passed to set.
+        """
+        return next(self._clock)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, tags, started_at):
+        """
+        Stores a response, unless one of its tags was invalidated while the
+        response was being built, in which case it may already be stale.
+
+        Args:
+        1. key (tuple): The cache key of the response.
+        2. value (tuple): The cached response.
+        3. tags (set): The tags of the records the response was built from.
+        4. started_at (int): The tick taken before building the response.
+        """
+        with self._lock:
+            if any(self._invalidated_at.get(tag, 0) > started_at for tag in tags):
+                return
+            self._remove(key)
+            self._entries[key] = (value, tags, monotonic() + self.max_age)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tags):
+        """
+        Removes every response tagged with one of the tags.
+
+        Args:
+        1. tags (iterable): The tags to invalidate.
+        """
+        with self._lock:
+            now = next(self._clock)
+            for tag in tags:
+                self._invalidated_at[tag] = now
+                for key in self._keys_by_tag.pop(tag, ()):
+                    self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            for tag in entry[1]:
+                keys = self._keys_by_tag.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._keys_by_tag[tag]
+
+
+@event.listens_for(Session, 'loaded_as_persistent')
+def record_tags(session, record):
+    """
+    Adds the tags of a record loaded from the database to the tags of the
+    response being cached, if any. A comment is tagged with its item post, as
+    it is only ever shown as part of one.
+    """
+    if not has_request_context() or 'cache_tags' not in g:
+        return
+    # Only the loaded columns are read, as a query may load some columns
+    # only, and records it does not load cannot be part of the response
+    loaded = inspect(record).dict
+    if isinstance(record, ItemPost):
+        tags = (f'item_post:{record.id}', f'user:{loaded.get("user_id")}')
+    elif isinstance(record, Comment):
+        tags = (f'item_post:{loaded.get("item_post_id")}', f'user:{loaded.get("user_id")}')
+    elif isinstance(record, User):
+        tags = (f'user:{record.id}',)
+    else:
+        return
+    g.cache_tags.update(tag for tag in tags if not tag.endswith(':None'))
+
+
+def cached_response(*tags):
+    """
+    A decorator caching the successful responses of a read-only route, and
+    answering conditional requests with 304 Not Modified.
+
+    Args:
+    1. *tags (str): Fixed tags of the route's responses, e.g. "item_posts"
+    for listings whose contents change when item posts are created.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            backend = current_app.extensions.get('response_cache')
+            if backend is None:
+                return view(*args, **kwargs)
+            key = (
+                request.endpoint,
+                tuple(sorted(request.view_args.items())),
+                tuple(sorted(request.args.items(multi=True))),
+                request.headers.get('Accept', ''),
+            )
+            cached = backend.get(key)
+            if cached is None:
+                started_at = backend.tick()
+                g.cache_tags = set(tags)
+                response = make_response(view(*args, **kwargs))
+                # Errors, streamed responses and responses read from a replica
+                # that may not have the latest writes yet are not cached
+                if (
+                    response.status_code != 200 or response.is_streamed
+                    or not replica_is_current()
+                ):
+                    return response
+                body = response.get_data()
+                headers = {
+                    name: response.headers[name]
+                    for name in CACHED_HEADERS if name in response.headers
+                }
+                cached = (body, headers, blake2b(body, digest_size=16).hexdigest())
+                backend.set(key, cached, g.cache_tags, started_at)
+            body, headers, etag = cached
+            response = current_app.response_class(body, 200, headers)
+            response.set_etag(etag)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+def add_cache_tags(*tags):
+    """
+    Adds tags to the response being cached, if any, for records the response
+    depends on without loading them, e.g. the item post of an empty page of
+    comments.
+
+    Args:
+    1. *tags (str): The tags to add, e.g. "item_post:5".
+    """
+    if has_request_context() and 'cache_tags' in g:
+        g.cache_tags.update(tags)
+
+
+def invalidate(*tags):
+    """
+    Removes the cached responses with any of the tags. Must be called after
+    the change is committed.
+
+    Args:
+    1. *tags (str): The tags of the changed records, e.g. "item_post:5".
+    """
+    backend = current_app.extensions.get('response_cache')
+    if backend is not None:
+        backend.invalidate(tags)
+
+
+def init_response_cache(app):
+    """
+    Sets up the response cache of the app, using the backend given by the
+    RESPONSE_CACHE_BACKEND config, or an in-process LRU cache holding
+    RESPONSE_CACHE_SIZE responses for RESPONSE_CACHE_MAX_AGE seconds. The
+    cache is disabled when neither is set.
+
+    Args:
+    1. app (Flask): The Flask app.
+    """
+    backend = app.config.get('RESPONSE_CACHE_BACKEND')
+    if backend is None and app.config.get('RESPONSE_CACHE_SIZE', 0) > 0:
+        backend = LRUBackend(
+            app.config['RESPONSE_CACHE_SIZE'],
+            app.config.get('RESPONSE_CACHE_MAX_AGE', 30)
+        )
+    if backend is not None:
+        app.extensions['response_cache'] = backend
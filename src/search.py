@@ -0,0 +1,92 @@
+"""
+A module that defines the full-text search engine for item posts. Searches run
+against the text columns of the item_posts table and are ranked by relevance,
+using a tsvector column with a GIN index on PostgreSQL and an FTS5 virtual
+table on SQLite (both defined in models/item_post.py).
+"""
+
+
+# Standard Library Modules
+import re
+
+# Third-party Library Modules
+from sqlalchemy import column, func, literal_column, table
+
+# Local Modules
+from setup import db
+from models.item_post import ItemPost
+
+
+# Columns that are covered by the full-text search
+SEARCH_COLUMNS = ('title', 'item_description', 'retrieval_description')
+
+# Weight labels of each searchable column in the PostgreSQL search vector
+_WEIGHTS = {'title': 'A', 'item_description': 'B', 'retrieval_description': 'C'}
+
+# The FTS5 virtual table mirroring the item_posts table on SQLite
+_fts = table('item_posts_fts', column('rowid'), column('rank'), column('item_posts_fts'))
+
+
+def search_terms(text):
+    """
+    Splits a search query into lowercase words, dropping punctuation so that
+    user input can never break the query syntax of the search engine.
+
+    Args:
+    1. text (str): The search query entered by the user.
+    """
+    return re.findall(r'[^\W_]+', text.lower())
+
+
+def search_item_posts(text, columns=SEARCH_COLUMNS):
+    """
+    Returns a select statement for the item posts matching every word of the
+    search query, most relevant first. Each word also matches as a prefix,
+    e.g. "lap" matches "laptop". Raises ValueError if the query contains no
+    words.
+
+    Args:
+    1. text (str): The search query entered by the user.
+    2. columns (tuple): The searchable columns to restrict the search to.
+    """
+    terms = search_terms(text)
+    if not terms:
+        raise ValueError('Search query must contain at least one word')
+    invalid = set(columns) - set(SEARCH_COLUMNS)
+    if invalid:
+        raise ValueError(f'Cannot search on {", ".join(sorted(invalid))}')
+
+    dialect = db.session.get_bind(mapper=ItemPost.__mapper__).dialect.name
+    stmt = db.select(ItemPost)
+    match dialect:
+        case 'postgresql':
+            # Prefix match every word, restricted to the weights of the
+            # requested columns, e.g. "lap:*A & black:*A"
+            weights = ''.join(_WEIGHTS[name] for name in columns)
+            query = func.to_tsquery(
+                'english', ' & '.join(f'{term}:*{weights}' for term in terms)
+            )
+            vector = literal_column('item_posts.search_vector')
+            rank = func.ts_rank(vector, query)
+            return (
+                stmt.filter(vector.op('@@')(query))
+                .order_by(rank.desc(), ItemPost.id.desc())
+            )
+        case 'sqlite':
+            # Prefix match every word, restricted to the requested columns,
+            # e.g. '{title} : ("lap"* "black"*)'. FTS5 ranks better matches
+            # with lower bm25 scores.
+            query = ' '.join(f'"{term}"*' for term in terms)
+            query = '{' + ' '.join(columns) + '} : (' + query + ')'
+            return (
+                stmt.join(_fts, _fts.c.rowid == ItemPost.id)
+                .filter(_fts.c.item_posts_fts.op('MATCH')(query))
+                .order_by(_fts.c.rank, ItemPost.id.desc())
+            )
+        case _:
+            # Unranked fallback for databases without full-text search
+            for term in terms:
+                stmt = stmt.filter(db.or_(*(
+                    getattr(ItemPost, name).ilike(f'%{term}%') for name in columns
+                )))
+            return stmt.order_by(ItemPost.id.desc())
@@ -0,0 +1,197 @@
+"""
+A module that defines the serializer registry, which shares schema instances
+between requests and dumps them through a fast path.
+
+Creating a schema resolves its string-referenced nested schemas and builds its
+field maps, which is repeated for every request when schemas are created in
+the routes. get_schema instead returns one instance per schema class and set of
+options, kept in an LRU cache since the options may come from the "fields"
+query parameter.
+
+fast_dump serializes model instances with a schema through per-field accessor
+functions compiled once per schema instance, rather than marshmallow's generic
+field machinery. Fields of the types used by this app's schemas (inferred,
+string, email, integer, float, boolean and nested fields) get a direct accessor; any
+other field falls back to its own serialize method, and schemas with pre_dump
+hooks fall back to a plain dump. post_dump hooks are run on every record, so
+hooks processing many records at once see them one at a time. The result is
+the same as marshmallow's, and is only meant for read-only output.
+"""
+
+
+# Standard Library Modules
+from datetime import date, datetime
+from functools import lru_cache
+from operator import attrgetter
+from weakref import WeakKeyDictionary
+
+# Third-party Library Modules
+from marshmallow import fields
+from marshmallow.decorators import POST_DUMP, PRE_DUMP
+
+# Local Modules
+from metrics import timed_serialization
+
+
+# Number of schema instances kept by the registry
+SCHEMA_CACHE_SIZE = 256
+
+# Compiled dump functions, by schema instance
+_dumpers = WeakKeyDictionary()
+
+
+def _check_fields(schema, names, path=''):
+    """
+    Raises a ValueError if any of the fields, possibly dotted, is not a field
+    of a schema, or narrows down a field that is not nested.
+
+    Args:
+    1. schema (Schema instance): The schema, with every field.
+    2. names (iterable): The fields, e.g. ["id", "user.username"].
+    3. path (str): The dotted path of the schema, for error messages.
+    """
+    for name in names:
+        head, _, rest = name.partition('.')
+        field = schema.fields.get(head)
+        if field is None:
+            raise ValueError(f'Unknown field: {path}{head}')
+        if rest:
+            if not isinstance(field, fields.Nested):
+                raise ValueError(f'Field {path}{head} has no nested fields')
+            _check_fields(field.schema, [rest], f'{path}{head}.')
+
+
+@lru_cache(maxsize=SCHEMA_CACHE_SIZE)
+def _cached_schema(schema_class, many, only, exclude):
+    # Marshmallow only checks the first part of dotted fields, and raises a
+    # KeyError rather than a ValueError for an unknown one
+    if only is not None:
+        _check_fields(_cached_schema(schema_class, False, None, frozenset()), only)
+    return schema_class(many=many, only=only, exclude=exclude)
+
+
+def get_schema(schema_class, many=False, only=None, exclude=()):
+    """
+    Returns a shared instance of a schema class with the given options. The
+    instance must not be modified, e.g. by setting its context.
+
+    Args:
+    1. schema_class (Schema class): The schema class, e.g. ItemPostSchema.
+    2. many (bool): Whether the schema serializes lists of records.
+    3. only (iterable): The fields to dump, or None for every field.
+    4. exclude (iterable): The fields not to dump.
+    """
+    return _cached_schema(
+        schema_class, many,
+        None if only is None else frozenset(only),
+        frozenset(exclude)
+    )
+
+
+def _serialize_inferred(value):
+    # Matches the fields marshmallow infers from the type of the value
+    if type(value) in (date, datetime):
+        return value.isoformat()
+    return value
+
+
+def _serialize_string(value):
+    return value if value is None or type(value) is str else str(value)
+
+
+def _serialize_integer(value):
+    return value if value is None else int(value)
+
+
+def _serialize_float(value):
+    return value if value is None else float(value)
+
+
+def _serialize_boolean(value):
+    return value if value is None else bool(value)
+
+
+# Serializing functions of the field types with a direct accessor
+SERIALIZERS = {
+    fields.Inferred: _serialize_inferred,
+    fields.String: _serialize_string,
+    fields.Email: _serialize_string,
+    fields.Integer: _serialize_integer,
+    fields.Float: _serialize_float,
+    fields.Boolean: _serialize_boolean,
+}
+
+
+def _field_accessor(schema, name, field):
+    """
+    Returns a function returning the serialized value of a field from a
+    record.
+
+    Args:
+    1. schema (Schema instance): The schema the field belongs to.
+    2. name (str): The name of the field in the schema.
+    3. field (Field instance): The field.
+    """
+    get = attrgetter(field.attribute or name)
+    if isinstance(field, fields.Nested):
+        dump = _dumper(field.schema)
+        if field.many:
+            return lambda record: None if (value := get(record)) is None else [
+                dump(item) for item in value
+            ]
+        return lambda record: None if (value := get(record)) is None else dump(value)
+    serialize = SERIALIZERS.get(type(field))
+    if serialize is None or getattr(field, 'as_string', False):
+        return lambda record: field.serialize(name, record, accessor=schema.get_attribute)
+    return lambda record: serialize(get(record))
+
+
+def _dumper(schema):
+    """
+    Returns the function dumping a single record with a schema, compiling it
+    on first use.
+
+    Args:
+    1. schema (Schema instance): The schema to compile.
+    """
+    dump = _dumpers.get(schema)
+    if dump is not None:
+        return dump
+
+    if schema._hooks[(PRE_DUMP, False)] or schema._hooks[(PRE_DUMP, True)]:
+        def dump(record):
+            return schema.dump(record, many=False)
+    else:
+        accessors = [
+            (field.data_key or name, _field_accessor(schema, name, field))
+            for name, field in schema.dump_fields.items()
+        ]
+        post_dump = schema._hooks[(POST_DUMP, False)] or schema._hooks[(POST_DUMP, True)]
+
+        def dump(record):
+            data = {key: accessor(record) for key, accessor in accessors}
+            if post_dump:
+                data = schema._invoke_dump_processors(
+                    POST_DUMP, data, many=False, original_data=record
+                )
+            return data
+
+    _dumpers[schema] = dump
+    return dump
+
+
+def fast_dump(schema, records):
+    """
+    Serializes model instances with a schema, like schema.dump but through
+    the compiled dump function of the schema.
+
+    Args:
+    1. schema (Schema instance): The schema, usually from get_schema.
+    2. records: A list of model instances if the schema was created with
+    many=True, otherwise a single model instance.
+    """
+    dump = _dumper(schema)
+    with timed_serialization():
+        if schema.many:
+            return [dump(record) for record in records]
+        return dump(records)
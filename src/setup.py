@@ -15,19 +15,89 @@ from flask_jwt_extended import JWTManager
 from marshmallow.exceptions import ValidationError
 from sqlalchemy.exc import IntegrityError
 
-# Create Flask app instance
+# Local Modules
+from metrics import init_metrics
+from connection_pool import engine_options, init_connection_pool
+from replica import RoutingSession, init_replica
+from response_formats import FastJSONProvider, init_response_formats
+
+# Create Flask app instance, encoding responses with the fast JSON provider
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # Set secret key and database URI
 app.config['JWT_SECRET_KEY'] = environ.get('JWT_KEY')
 app.config["SQLALCHEMY_DATABASE_URI"] = environ.get('DB_URI')
 
+# Set the size of the connection pool of each process, the seconds a request
+# waits for a connection, the seconds after which connections are reopened and
+# whether connections are tested before use
+app.config['DB_POOL_SIZE'] = int(environ.get('DB_POOL_SIZE') or 5)
+app.config['DB_MAX_OVERFLOW'] = int(environ.get('DB_MAX_OVERFLOW') or 10)
+app.config['DB_POOL_TIMEOUT'] = float(environ.get('DB_POOL_TIMEOUT') or 30)
+app.config['DB_POOL_RECYCLE'] = int(environ.get('DB_POOL_RECYCLE') or 1800)
+app.config['DB_POOL_PRE_PING'] = (environ.get('DB_POOL_PRE_PING') or '').lower() in ('1', 'true', 'yes')
+# Set the milliseconds after which PostgreSQL cancels a statement, 0 to disable
+app.config['DB_STATEMENT_TIMEOUT'] = int(environ.get('DB_STATEMENT_TIMEOUT') or 0)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+    app.config, app.config['SQLALCHEMY_DATABASE_URI']
+)
+
+# Set the URI of an optional read replica, used by read-only routes, and the
+# seconds a client keeps reading from the primary after writing
+app.config['DB_REPLICA_URI'] = environ.get('DB_REPLICA_URI')
+app.config['DB_REPLICA_STICKY_SECONDS'] = int(environ.get('DB_REPLICA_STICKY_SECONDS') or 5)
+if app.config['DB_REPLICA_URI']:
+    app.config['SQLALCHEMY_BINDS'] = {
+        'replica': {
+            'url': app.config['DB_REPLICA_URI'],
+            **engine_options(app.config, app.config['DB_REPLICA_URI'], 'replica'),
+        }
+    }
+
+# Set bcrypt work factor and the size of the password hashing pool
+app.config['BCRYPT_LOG_ROUNDS'] = int(environ.get('BCRYPT_LOG_ROUNDS') or 12)
+app.config['PASSWORD_HASH_WORKERS'] = int(environ.get('PASSWORD_HASH_WORKERS') or 2)
+app.config['PASSWORD_HASH_QUEUE_SIZE'] = int(environ.get('PASSWORD_HASH_QUEUE_SIZE') or 16)
+app.config['PASSWORD_HASH_TIMEOUT'] = float(environ.get('PASSWORD_HASH_TIMEOUT') or 10)
+
+# Set the number of responses kept by the in-process response cache, and how
+# many seconds they are kept for. The cache is disabled by default, as it is
+# only invalidated by the process making a change.
+app.config['RESPONSE_CACHE_SIZE'] = int(environ.get('RESPONSE_CACHE_SIZE') or 0)
+app.config['RESPONSE_CACHE_MAX_AGE'] = float(environ.get('RESPONSE_CACHE_MAX_AGE') or 30)
+# Set the number of locations kept by the location cache, 0 to disable it
+app.config['LOCATION_CACHE_SIZE'] = int(environ.get('LOCATION_CACHE_SIZE') or 4096)
+# Set the number of records deleted per transaction by background purges
+app.config['PURGE_CHUNK_SIZE'] = int(environ.get('PURGE_CHUNK_SIZE') or 500)
+
+# Set how background jobs are retried, and how long a running job may take
+# before it is assumed lost and queued again
+app.config['JOB_MAX_ATTEMPTS'] = int(environ.get('JOB_MAX_ATTEMPTS') or 5)
+app.config['JOB_RETRY_BACKOFF'] = float(environ.get('JOB_RETRY_BACKOFF') or 10)
+app.config['JOB_TIMEOUT'] = float(environ.get('JOB_TIMEOUT') or 600)
+app.config['JOB_POLL_INTERVAL'] = float(environ.get('JOB_POLL_INTERVAL') or 1)
+# Set the webhook notified of new comments, no notifications if unset
+app.config['NOTIFICATION_WEBHOOK_URL'] = environ.get('NOTIFICATION_WEBHOOK_URL')
+app.config['NOTIFICATION_TIMEOUT'] = float(environ.get('NOTIFICATION_TIMEOUT') or 10)
+# Set the bearer token required to read /metrics, which is disabled if unset
+app.config['METRICS_TOKEN'] = environ.get('METRICS_TOKEN')
+
 # Create instances of objects that will be used with the Flask app
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 ma = Marshmallow(app)
 bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
 
+# Record per-request performance metrics, exposed at /metrics
+init_metrics(app)
+# Record the waits and connections of the connection pool
+init_connection_pool(app, db)
+# Keep clients that wrote on the primary until the replica has their writes
+init_replica(app)
+# Refuse clients that only accept MessagePack when it is not installed
+init_response_formats(app)
+
 # Error handlers
 @app.errorhandler(401)
 def unauthorized(err):
@@ -41,6 +111,10 @@ def bad_request(err):
 def not_found(err):
     return {'error': str(err)}, 404
 
+@app.errorhandler(503)
+def service_unavailable(err):
+    return {'error': str(err)}, 503
+
 @app.errorhandler(ValidationError)
 def validation_error(err):
     return {'error': str(err)}, 400
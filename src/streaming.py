@@ -0,0 +1,106 @@
+"""
+A module that defines the streaming mode of the listing routes, for exports too
+large to be built in memory. Instead of loading every record, dumping them
+into one list and serializing it in one go, the query is iterated in chunks of
+STREAM_CHUNK_SIZE records, fetched with a server-side cursor where the driver
+supports one, and each chunk is serialized and written to the response before
+the next one is fetched. Memory use therefore does not grow with the number of
+records, and the first bytes are sent as soon as the first chunk is ready.
+
+Streaming is requested with the "stream" query parameter, which returns a JSON
+array, or with an "Accept: application/x-ndjson" header, which returns one JSON
+document per line. A streamed listing is not paginated: it returns every
+matching record, starting after the cursor given by the "after" query
+parameter if any.
+"""
+
+
+# Third-party Library Modules
+from flask import current_app, g, request, stream_with_context
+
+# Local Modules
+from setup import db
+from serializers import fast_dump
+
+
+# Number of records fetched and serialized at a time
+STREAM_CHUNK_SIZE = 500
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def wants_ndjson():
+    """
+    A function that returns whether the client of the current request prefers
+    NDJSON over JSON.
+    """
+    return request.accept_mimetypes.best_match(
+        ['application/json', NDJSON_MIMETYPE]
+    ) == NDJSON_MIMETYPE
+
+
+def wants_stream():
+    """
+    A function that returns whether the current request asks for a streamed
+    listing, either with the "stream" query parameter or by accepting NDJSON.
+    """
+    return (
+        request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+        or wants_ndjson()
+    )
+
+
+def stream_response(stmt, schema):
+    """
+    A function that returns a response streaming the records selected by a
+    statement, serialized with a schema, as a JSON array or as NDJSON.
+
+    Args:
+    1. stmt (Select): The statement selecting the records, with its loader
+    options but without a limit.
+    2. schema (Schema instance): The schema serializing the records, created
+    with many=True.
+    """
+    ndjson = wants_ndjson()
+    dumps = current_app.json.dumps
+    # Streamed responses are not cached, so the records they load need not be
+    # tracked either
+    g.pop('cache_tags', None)
+
+    # Only the primary keys are iterated with yield_per, as SQLAlchemy does
+    # not support it together with the selectinload options of collections.
+    # The records of each chunk of keys, with their relationships, are then
+    # loaded by one more query, restricted to the keys and without the
+    # offset of the statement.
+    model = stmt.column_descriptions[0]['entity']
+    chunk_stmt = stmt.offset(None)
+
+    def load(ids):
+        records = {
+            record.id: record
+            for record in db.session.scalars(chunk_stmt.filter(model.id.in_(ids)))
+        }
+        return [records[id] for id in ids if id in records]
+
+    def generate():
+        result = db.session.scalars(
+            stmt.with_only_columns(model.id).execution_options(yield_per=STREAM_CHUNK_SIZE)
+        )
+        first = True
+        if not ndjson:
+            yield '['
+        for ids in result.partitions():
+            records = load(ids)
+            documents = [dumps(data, separators=(',', ':')) for data in fast_dump(schema, records)]
+            if ndjson:
+                yield '\n'.join(documents) + '\n'
+            else:
+                yield ('' if first else ',') + ','.join(documents)
+            first = False
+        if not ndjson:
+            yield ']'
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype=NDJSON_MIMETYPE if ndjson else 'application/json'
+    )
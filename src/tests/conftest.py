@@ -0,0 +1,121 @@
+"""
+Fixtures of the test suite: the app, using a temporary SQLite database, and
+helpers adding item posts with their comments and images to it.
+"""
+
+
+# Standard Library Modules
+import sys
+from itertools import count
+from datetime import date, datetime
+from os import environ
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+# Third-party Library Modules
+import pytest
+
+# The app reads its settings from the environment when it is imported
+_database_dir = TemporaryDirectory()
+environ['DB_URI'] = f'sqlite:///{Path(_database_dir.name) / "test.db"}'
+environ.setdefault('JWT_KEY', 'test')
+# Passwords are hashed with the lowest work factor, to keep the tests fast
+environ['BCRYPT_LOG_ROUNDS'] = '4'
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Importing the app first registers every model, so that test modules can
+# import them
+from app import app as flask_app  # noqa: E402
+
+# Numbers of the users registered by the tests, keeping them unique
+_user_numbers = count()
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = flask_app
+    from setup import db
+    from models.location import Location
+    from models.user import User
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            User(name='Admin', username='admin', email='admin@email.com', password='-', is_admin=True),
+            User(name='John Doe', username='johndoe', email='john@email.com', password='-'),
+        ])
+        db.session.add_all([
+            Location(suburb='Mascot', state='NSW', postcode=2020, country='Australia'),
+            Location(suburb='Kensington', state='NSW', postcode=2033, country='Australia'),
+        ])
+        db.session.commit()
+    yield app
+    _database_dir.cleanup()
+
+
+@pytest.fixture
+def register(app):
+    """
+    Returns a function registering a user and logging them in, returning the
+    id of the user and the headers authorizing their requests.
+    """
+    def register(is_admin=False):
+        from setup import db
+        from models.user import User
+
+        number = next(_user_numbers)
+        client = app.test_client()
+        user = {
+            'name': f'User {number}', 'username': f'user{number}',
+            'email': f'user{number}@email.com', 'password': 'password123',
+        }
+        response = client.post('/users/register', json=user)
+        assert response.status_code == 201, response.get_data(as_text=True)
+        user_id = response.json['id']
+        if is_admin:
+            with app.app_context():
+                db.session.get(User, user_id).is_admin = True
+                db.session.commit()
+        response = client.post('/users/login', json={'username': user['username'], 'password': 'password123'})
+        return user_id, {'Authorization': f'Bearer {response.json["token"]}'}
+
+    return register
+
+
+@pytest.fixture
+def add_item_posts(app):
+    """
+    Returns a function adding item posts, each with comments and images, so
+    that a test can check that the cost of a route does not grow with them.
+    """
+    from setup import db
+    from models.comment import Comment
+    from models.image import Image
+    from models.item_post import ItemPost
+
+    def add(count, comments_per_post=3):
+        with app.app_context():
+            item_posts = [
+                ItemPost(
+                    title=f'HP Laptop {number}', post_type='lost', category='electronics',
+                    item_description='Black laptop with stickers', retrieval_description='Call me',
+                    date=date(2024, 1, 1), user_id=2, seen_location_id=1, pickup_location_id=2,
+                )
+                for number in range(count)
+            ]
+            db.session.add_all(item_posts)
+            db.session.flush()
+            for item_post in item_posts:
+                db.session.add(Image(image_url='laptop.png', item_post_id=item_post.id))
+                for number in range(comments_per_post):
+                    comment = Comment(
+                        comment_text=f'Comment {number}', time_stamp=datetime(2024, 1, 1, 0, number),
+                        user_id=1 + number % 2, item_post_id=item_post.id,
+                    )
+                    db.session.add(comment)
+                    db.session.flush()
+                    db.session.add(Image(image_url='comment.png', comment_id=comment.id))
+            db.session.commit()
+            return [item_post.id for item_post in item_posts]
+
+    return add
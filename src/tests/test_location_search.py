@@ -0,0 +1,59 @@
+"""
+Tests the search of item posts by the postcode of their locations.
+"""
+
+
+# Third-party Library Modules
+import pytest
+
+# Local Modules
+from setup import db
+from models.item_post import ItemPost
+from models.location import Location
+
+
+@pytest.fixture(scope='module')
+def postcode_item_posts(app):
+    """
+    Adds an item post seen at each of the postcodes, returning their ids by
+    postcode.
+    """
+    ids = {}
+    with app.app_context():
+        for postcode in (2020, 2033, 3000, 90210):
+            location = Location(suburb=f'Suburb {postcode}', state='State', postcode=postcode, country='Country')
+            item_post = ItemPost(
+                title='Black wallet', post_type='lost', category='wallets',
+                user_id=2, seen_location=location, pickup_location=location,
+            )
+            db.session.add(item_post)
+            db.session.flush()
+            ids[postcode] = item_post.id
+        db.session.commit()
+    return ids
+
+
+def search(app, keyword):
+    response = app.test_client().get(f'/item-posts/locations/seen/postcode/{keyword}?fields=id&limit=100')
+    return response.status_code, {item_post['id'] for item_post in response.json} if response.status_code == 200 else None
+
+
+@pytest.mark.parametrize('keyword, postcodes', [
+    ('2', {2020, 2033}),
+    ('20', {2020, 2033}),
+    ('203', {2033}),
+    ('3000', {3000}),
+    ('9021', set()),
+    ('90210', {90210}),
+    ('902100', set()),
+    ('99999999999999', set()),
+])
+def test_postcode_search(app, postcode_item_posts, keyword, postcodes):
+    status, ids = search(app, keyword)
+    assert status in (200, 404)
+    found = {postcode for postcode, item_post_id in postcode_item_posts.items() if item_post_id in (ids or ())}
+    assert found == postcodes
+
+
+def test_postcode_must_be_digits(app, postcode_item_posts):
+    assert search(app, 'abc')[0] == 400
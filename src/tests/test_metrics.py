@@ -0,0 +1,30 @@
+"""
+Tests that /metrics is only served to clients with the metrics token.
+"""
+
+
+# Third-party Library Modules
+import pytest
+
+
+@pytest.fixture
+def metrics_token(app):
+    app.config['METRICS_TOKEN'] = 'secret'
+    yield 'secret'
+    app.config['METRICS_TOKEN'] = None
+
+
+def test_metrics_are_disabled_without_a_token(app):
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+@pytest.mark.parametrize('authorization', [None, 'Bearer wrong', 'Bearer sécret', 'Bearer €'])
+def test_metrics_require_the_token(app, metrics_token, authorization):
+    headers = {'Authorization': authorization} if authorization else {}
+    assert app.test_client().get('/metrics', headers=headers).status_code == 401
+
+
+def test_metrics_are_served_with_the_token(app, metrics_token):
+    response = app.test_client().get('/metrics', headers={'Authorization': f'Bearer {metrics_token}'})
+    assert response.status_code == 200
+    assert 'http_request_sql_statements' in response.get_data(as_text=True)
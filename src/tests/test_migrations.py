@@ -0,0 +1,211 @@
+"""
+Tests the migrations, by upgrading a SQLite database with the schema the app
+had before migrations were added, and duplicate locations that only differ
+in case and whitespace.
+"""
+
+
+# Third-party Library Modules
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+# Local Modules
+import migrations
+from setup import db
+from connection_pool import enforce_foreign_keys
+
+
+# The schema of databases created before the migrations were added
+BASELINE_SCHEMA = (
+    '''CREATE TABLE users (
+        id INTEGER NOT NULL, name VARCHAR NOT NULL, username VARCHAR(20) NOT NULL,
+        email VARCHAR NOT NULL, password VARCHAR NOT NULL, private_email BOOLEAN,
+        is_admin BOOLEAN,
+        PRIMARY KEY (id), UNIQUE (username), UNIQUE (email)
+    )''',
+    '''CREATE TABLE locations (
+        id INTEGER NOT NULL, unit_number VARCHAR, street_number VARCHAR,
+        street_name VARCHAR, suburb VARCHAR NOT NULL, state VARCHAR NOT NULL,
+        postcode INTEGER NOT NULL, country VARCHAR NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (unit_number, street_number, street_name, suburb, state, postcode, country)
+    )''',
+    '''CREATE TABLE item_posts (
+        id INTEGER NOT NULL, title VARCHAR(80) NOT NULL, post_type VARCHAR(10) NOT NULL,
+        category VARCHAR(20) NOT NULL, item_description TEXT, retrieval_description TEXT,
+        status VARCHAR(10) NOT NULL, date DATE, user_id INTEGER NOT NULL,
+        seen_location_id INTEGER, pickup_location_id INTEGER,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES users (id),
+        FOREIGN KEY(seen_location_id) REFERENCES locations (id) ON DELETE SET NULL,
+        FOREIGN KEY(pickup_location_id) REFERENCES locations (id) ON DELETE SET NULL
+    )''',
+    '''CREATE TABLE comments (
+        id INTEGER NOT NULL, comment_text TEXT NOT NULL, time_stamp DATETIME NOT NULL,
+        user_id INTEGER NOT NULL, item_post_id INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES users (id),
+        FOREIGN KEY(item_post_id) REFERENCES item_posts (id)
+    )''',
+    '''CREATE TABLE images (
+        id INTEGER NOT NULL, image_url VARCHAR NOT NULL, item_post_id INTEGER,
+        comment_id INTEGER,
+        PRIMARY KEY (id),
+        CHECK (NOT((item_post_id IS NULL AND comment_id IS NULL)
+            OR (item_post_id IS NOT NULL AND comment_id IS NOT NULL))),
+        FOREIGN KEY(item_post_id) REFERENCES item_posts (id),
+        FOREIGN KEY(comment_id) REFERENCES comments (id)
+    )''',
+)
+
+BASELINE_ROWS = (
+    "INSERT INTO users VALUES (1, 'Admin', 'admin', 'admin@email.com', '-', 0, 1)",
+    "INSERT INTO users VALUES (2, 'John Doe', 'johndoe', 'john@email.com', '-', 0, 0)",
+    # Locations 2 and 3 are duplicates of location 1, and location 5 of 4
+    "INSERT INTO locations VALUES (1, '', '2', 'Muller Lane', 'Mascot', 'NSW', 2020, 'Australia')",
+    "INSERT INTO locations VALUES (2, '', '2', 'MULLER LANE', 'mascot', 'nsw', 2020, 'australia')",
+    "INSERT INTO locations VALUES (3, '', '2', ' Muller  Lane ', 'Mascot ', 'NSW', 2020, 'Australia')",
+    "INSERT INTO locations VALUES (4, '', '', '', 'Kensington', 'NSW', 2033, 'Australia')",
+    "INSERT INTO locations VALUES (5, '', '', '', 'kensington', 'NSW', 2033, 'AUSTRALIA')",
+    "INSERT INTO locations VALUES (6, '', '', '', 'Carlton', 'VIC', 3053, 'Australia')",
+    "INSERT INTO item_posts VALUES (1, 'Black laptop', 'lost', 'electronics', 'HP laptop', 'Call me', "
+    "'unclaimed', '2024-01-01', 2, 2, 5)",
+    "INSERT INTO item_posts VALUES (2, 'Black laptop bag', 'found', 'electronics', 'HP laptop bag', "
+    "'At the desk', 'unclaimed', '2024-01-02', 1, 3, 6)",
+    "INSERT INTO item_posts VALUES (3, 'Red scarf', 'lost', 'apparel', 'Wool', 'Email me', "
+    "'claimed', '2024-01-03', 2, 1, NULL)",
+    "INSERT INTO comments VALUES (1, 'Is it yours?', '2024-01-02 10:00:00', 1, 1)",
+    "INSERT INTO images VALUES (1, 'laptop.png', 1, NULL)",
+    "INSERT INTO images VALUES (2, 'comment.png', NULL, 1)",
+)
+
+
+def schema_of(engine):
+    """
+    Returns the columns, indexes, foreign keys and unique constraints of every
+    table of a database, to compare two databases.
+    """
+    inspector = inspect(engine)
+    return {
+        table: {
+            'columns': sorted(column['name'] for column in inspector.get_columns(table)),
+            'indexes': sorted(
+                (index['name'], tuple(index['column_names']), bool(index['unique']))
+                for index in inspector.get_indexes(table)
+            ),
+            'foreign_keys': sorted(
+                (tuple(key['constrained_columns']), key['referred_table'], key['options'].get('ondelete'))
+                for key in inspector.get_foreign_keys(table)
+            ),
+            'unique_constraints': sorted(
+                tuple(constraint['column_names']) for constraint in inspector.get_unique_constraints(table)
+            ),
+        }
+        for table in inspector.get_table_names()
+        if table != 'schema_migrations' and not table.startswith('item_posts_fts')
+    }
+
+
+def rows(engine, statement):
+    with engine.connect() as connection:
+        return connection.execute(text(statement)).all()
+
+
+def make_engine(path):
+    engine = create_engine(f'sqlite:///{path}')
+    enforce_foreign_keys(engine)
+    return engine
+
+
+@pytest.fixture
+def baseline_engine(app, tmp_path):
+    engine = make_engine(tmp_path / 'baseline.db')
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA + BASELINE_ROWS:
+            connection.exec_driver_sql(statement)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def models_engine(app, tmp_path):
+    """
+    An engine of a database created from the models, as "flask db create"
+    does.
+    """
+    engine = make_engine(tmp_path / 'models.db')
+    with app.app_context():
+        db.metadata.create_all(engine)
+    migrations.stamp(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_baseline_database_is_upgraded_to_the_models(app, baseline_engine, models_engine):
+    with app.app_context():
+        applied = migrations.upgrade(baseline_engine, echo=lambda message: None)
+    assert applied == [version for version, _ in migrations.migrations()]
+    assert schema_of(baseline_engine) == schema_of(models_engine)
+    assert rows(baseline_engine, 'PRAGMA foreign_key_check') == []
+    assert rows(baseline_engine, 'PRAGMA integrity_check') == [('ok',)]
+
+
+def test_duplicate_locations_are_merged(app, baseline_engine):
+    with app.app_context():
+        migrations.upgrade(baseline_engine, echo=lambda message: None)
+    # The oldest location of each address is kept, with a key
+    assert [row[0] for row in rows(baseline_engine, 'SELECT id FROM locations ORDER BY id')] == [1, 4, 6]
+    assert rows(baseline_engine, 'SELECT count(*) FROM locations WHERE location_key IS NULL') == [(0,)]
+    # Item posts point at the kept locations
+    assert rows(
+        baseline_engine, 'SELECT id, seen_location_id, pickup_location_id FROM item_posts ORDER BY id'
+    ) == [(1, 1, 4), (2, 1, 6), (3, 1, None)]
+    # Other records are untouched
+    assert rows(baseline_engine, 'SELECT count(*) FROM comments') == [(1,)]
+    assert rows(baseline_engine, 'SELECT count(*) FROM images') == [(2,)]
+
+
+def test_upgraded_database_is_usable(app, baseline_engine):
+    with app.app_context():
+        migrations.upgrade(baseline_engine, echo=lambda message: None)
+    # The full-text index covers the existing item posts
+    assert rows(
+        baseline_engine,
+        "SELECT rowid FROM item_posts_fts WHERE item_posts_fts MATCH 'laptop' ORDER BY rowid"
+    ) == [(1,), (2,)]
+    # Two locations with the same key can no longer be added
+    with pytest.raises(Exception):
+        with baseline_engine.begin() as connection:
+            connection.exec_driver_sql(
+                "INSERT INTO locations (unit_number, street_number, street_name, suburb, state, "
+                "postcode, country, location_key) SELECT unit_number, street_number, street_name, "
+                "suburb, state, postcode, country, location_key FROM locations WHERE id = 1"
+            )
+    # Deleting a user deletes their records through the cascading foreign keys
+    with baseline_engine.begin() as connection:
+        connection.exec_driver_sql('DELETE FROM users WHERE id = 2')
+    assert rows(baseline_engine, 'SELECT id FROM item_posts') == [(2,)]
+    assert rows(baseline_engine, 'SELECT count(*) FROM comments') == [(0,)]
+    assert rows(baseline_engine, 'SELECT count(*) FROM images') == [(0,)]
+
+
+def test_upgrading_again_changes_nothing(app, baseline_engine):
+    with app.app_context():
+        migrations.upgrade(baseline_engine, echo=lambda message: None)
+        schema = schema_of(baseline_engine)
+        locations = rows(baseline_engine, 'SELECT * FROM locations ORDER BY id')
+        assert migrations.upgrade(baseline_engine, echo=lambda message: None) == []
+        # Every migration is also safe to run again, e.g. after failing
+        # halfway outside of a transaction
+        for _, module in migrations.migrations():
+            with baseline_engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                module.upgrade(connection)
+    assert schema_of(baseline_engine) == schema
+    assert rows(baseline_engine, 'SELECT * FROM locations ORDER BY id') == locations
+    assert rows(baseline_engine, 'SELECT count(*) FROM item_posts_fts') == [(3,)]
+
+
+def test_created_database_is_stamped(app, models_engine):
+    assert migrations.applied_versions(models_engine) == {version for version, _ in migrations.migrations()}
+    with app.app_context():
+        assert migrations.upgrade(models_engine, echo=lambda message: None) == []
@@ -0,0 +1,48 @@
+"""
+Tests that the read routes run a fixed number of SQL statements, counted by
+the cursor hook of the metrics module, however many item posts, comments and
+images are returned. A route exceeding its bound usually loads a
+relationship lazily, once per row.
+"""
+
+
+# Third-party Library Modules
+import pytest
+from flask import g
+
+
+# Routes and the most SQL statements a request to them may run. The id of an
+# item post with comments is substituted for {id}.
+QUERY_BOUNDS = [
+    ('all_item_posts', '/item-posts/', 4),
+    ('search_posts', '/item-posts/title/laptop', 4),
+    ('one_item_post', '/item-posts/{id}', 4),
+    ('search_location', '/item-posts/locations/seen/suburb/mascot', 4),
+    ('view_comments', '/item-posts/{id}/comments/', 2),
+]
+
+
+def count_statements(app, url):
+    """
+    Requests a URL, and returns the number of SQL statements run by the
+    request.
+
+    Args:
+    1. app (Flask): The app.
+    2. url (str): The URL requested.
+    """
+    # The request context, and so g, is kept until the client is closed
+    with app.test_client() as client:
+        response = client.get(url)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return g.sql_statements
+
+
+@pytest.mark.parametrize('route, url, bound', QUERY_BOUNDS, ids=[route for route, _, _ in QUERY_BOUNDS])
+def test_query_count_is_bounded(app, add_item_posts, route, url, bound):
+    few = count_statements(app, url.format(id=add_item_posts(2)[0]))
+    # Many more rows, with their comments and images, must not add statements
+    many = count_statements(app, url.format(id=add_item_posts(20, comments_per_post=10)[0]))
+    assert few <= bound
+    assert many <= bound
+    assert many == few
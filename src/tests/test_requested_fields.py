@@ -0,0 +1,61 @@
+"""
+Tests that the "fields" query parameter narrows down the responses of the read
+routes, and that unknown fields, or unknown parts of dotted fields, are
+rejected with a 400.
+"""
+
+
+# Third-party Library Modules
+import pytest
+
+
+# Requested fields that are not fields of the dumped records. The id of an
+# item post is substituted for {id}.
+UNKNOWN_FIELDS = [
+    '/item-posts/?fields=bogus',
+    '/item-posts/?fields=bogus.x',
+    '/item-posts/?fields=user.bogus',
+    '/item-posts/?fields=title.x',
+    '/item-posts/?fields=comments.bogus',
+    '/item-posts/{id}?fields=seen_location.bogus',
+    '/item-posts/{id}/comments/?fields=bogus.x',
+    '/item-posts/{id}/comments/?fields=user.name',
+    '/item-posts/{id}/matches?fields=item_post.id',
+    '/item-posts/{id}/matches?fields=comments',
+    '/item-posts/locations/seen/suburb/mascot?fields=images.bogus',
+]
+
+
+@pytest.mark.parametrize('url', UNKNOWN_FIELDS)
+def test_unknown_fields_are_rejected(app, add_item_posts, url):
+    url = url.format(id=add_item_posts(1)[0])
+    response = app.test_client().get(url)
+    assert response.status_code == 400
+    assert 'error' in response.json
+
+
+def test_nested_fields_narrow_down_the_response(app, add_item_posts):
+    item_post_id = add_item_posts(1)[0]
+    client = app.test_client()
+
+    response = client.get(f'/item-posts/{item_post_id}?fields=title,user.username,images.image_url')
+    assert response.status_code == 200
+    assert response.json == {
+        'title': 'HP Laptop 0',
+        'user': {'username': 'johndoe'},
+        'images': [{'image_url': 'laptop.png'}],
+    }
+
+    response = client.get(f'/item-posts/{item_post_id}/comments/?fields=comment_text,user.username')
+    assert response.status_code == 200
+    assert response.json['comments'][0] == {'comment_text': 'Comment 0', 'user': {'username': 'admin'}}
+
+
+def test_loading_profiles_are_bounded(app, add_item_posts, monkeypatch):
+    import loading_profiles
+    monkeypatch.setattr(loading_profiles, 'PROFILE_CACHE_SIZE', 4)
+    add_item_posts(1)
+    client = app.test_client()
+    for field in ('id', 'title', 'status', 'date', 'category', 'post_type', 'user', 'images'):
+        assert client.get(f'/item-posts/?fields={field}').status_code == 200
+    assert len(loading_profiles._profiles) <= 4
@@ -0,0 +1,206 @@
+"""
+Tests the response cache of the read routes: conditional requests, the
+invalidation of cached responses by each write route, and the responses that
+must not be cached.
+"""
+
+
+# Third-party Library Modules
+import pytest
+
+# Local Modules
+import response_cache
+from setup import db
+from models.item_post import ItemPost
+from response_cache import LRUBackend
+
+
+def new_item_post(title, suburb='Mascot'):
+    return {
+        'title': title, 'post_type': 'lost', 'category': 'others',
+        'item_description': 'Green', 'retrieval_description': 'Call me',
+        'seen_location': {'suburb': suburb, 'state': 'NSW', 'postcode': 2020, 'country': 'Australia'},
+    }
+
+
+def retitle_behind_the_cache(app, item_post_id, title):
+    """
+    Changes the title of an item post without invalidating the cached
+    responses, so that a response showing the new title was not cached.
+    """
+    with app.app_context():
+        db.session.get(ItemPost, item_post_id).title = title
+        db.session.commit()
+
+
+def titles(response):
+    return [item_post['title'] for item_post in response.json]
+
+
+@pytest.fixture
+def cache(app):
+    """
+    Enables the in-process response cache for the test.
+    """
+    backend = LRUBackend(max_entries=64, max_age=60)
+    app.extensions['response_cache'] = backend
+    yield backend
+    del app.extensions['response_cache']
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def author(register):
+    return register()
+
+
+@pytest.fixture
+def item_post_id(client, author):
+    _, headers = author
+    response = client.post('/item-posts/', json=new_item_post('Green umbrella'), headers=headers)
+    assert response.status_code == 201
+    return response.json['id']
+
+
+def test_responses_are_cached(app, cache, client, item_post_id):
+    first = client.get(f'/item-posts/{item_post_id}')
+    retitle_behind_the_cache(app, item_post_id, 'Stale umbrella')
+    second = client.get(f'/item-posts/{item_post_id}')
+    assert second.json['title'] == first.json['title'] == 'Green umbrella'
+
+
+def test_matching_etag_is_answered_with_not_modified(cache, client, author, item_post_id):
+    _, headers = author
+    response = client.get(f'/item-posts/{item_post_id}')
+    etag = response.headers['ETag']
+    assert not response.headers['ETag'].startswith('W/')
+
+    response = client.get(f'/item-posts/{item_post_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.headers['ETag'] == etag
+
+    # Once the item post changes, the old ETag no longer matches
+    client.patch(f'/item-posts/{item_post_id}', json={'title': 'Red umbrella'}, headers=headers)
+    response = client.get(f'/item-posts/{item_post_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['title'] == 'Red umbrella'
+    assert response.headers['ETag'] != etag
+
+
+def test_creating_an_item_post_invalidates_listings(cache, client, author):
+    _, headers = author
+    client.post('/item-posts/', json=new_item_post('Wombat keyring', 'Bilbyton'), headers=headers)
+    assert titles(client.get('/item-posts/locations/seen/suburb/bilbyton')) == ['Wombat keyring']
+    assert client.get('/item-posts/title/wombat').status_code == 200
+    assert titles(client.get('/item-posts/'))[0] == 'Wombat keyring'
+
+    client.post('/item-posts/', json=new_item_post('Wombat wallet', 'Bilbyton'), headers=headers)
+    assert titles(client.get('/item-posts/locations/seen/suburb/bilbyton')) == ['Wombat wallet', 'Wombat keyring']
+    assert titles(client.get('/item-posts/title/wombat')) == ['Wombat wallet', 'Wombat keyring']
+    assert titles(client.get('/item-posts/'))[0] == 'Wombat wallet'
+
+
+def test_creating_item_posts_in_bulk_invalidates_listings(cache, client, author):
+    _, headers = author
+    assert client.get('/item-posts/title/potoroo').status_code == 404
+    client.post('/item-posts/', json=new_item_post('Potoroo badge'), headers=headers)
+    assert titles(client.get('/item-posts/title/potoroo')) == ['Potoroo badge']
+
+    client.post('/item-posts/bulk', json=[new_item_post('Potoroo scarf')], headers=headers)
+    assert set(titles(client.get('/item-posts/title/potoroo'))) == {'Potoroo badge', 'Potoroo scarf'}
+
+
+def test_editing_an_item_post_invalidates_it_and_listings(cache, client, author, item_post_id):
+    _, headers = author
+    assert client.get(f'/item-posts/{item_post_id}').json['title'] == 'Green umbrella'
+    assert client.get('/item-posts/title/numbat').status_code == 404
+    assert client.get('/item-posts/locations/seen/suburb/numbatton').status_code == 404
+
+    client.patch(f'/item-posts/{item_post_id}', json={
+        'title': 'Numbat umbrella',
+        'seen_location': new_item_post('', 'Numbatton')['seen_location'],
+    }, headers=headers)
+    assert client.get(f'/item-posts/{item_post_id}').json['title'] == 'Numbat umbrella'
+    assert titles(client.get('/item-posts/title/numbat')) == ['Numbat umbrella']
+    assert titles(client.get('/item-posts/locations/seen/suburb/numbatton')) == ['Numbat umbrella']
+
+
+def test_deleting_an_item_post_invalidates_it_and_listings(cache, client, author, item_post_id):
+    _, headers = author
+    client.patch(f'/item-posts/{item_post_id}', json={'title': 'Dingo umbrella'}, headers=headers)
+    assert client.get(f'/item-posts/{item_post_id}').status_code == 200
+    assert titles(client.get('/item-posts/title/dingo')) == ['Dingo umbrella']
+
+    client.delete(f'/item-posts/{item_post_id}', headers=headers)
+    assert client.get(f'/item-posts/{item_post_id}').status_code == 404
+    assert client.get('/item-posts/title/dingo').status_code == 404
+
+
+def test_comment_routes_invalidate_their_item_post(cache, client, author, item_post_id):
+    _, headers = author
+    comments_url = f'/item-posts/{item_post_id}/comments/'
+    assert client.get(comments_url).json['comments'] == []
+    assert client.get(f'/item-posts/{item_post_id}').json['comments'] == []
+
+    comment_id = client.post(comments_url, json={'comment_text': 'Mine'}, headers=headers).json['id']
+    assert [comment['comment_text'] for comment in client.get(comments_url).json['comments']] == ['Mine']
+    assert len(client.get(f'/item-posts/{item_post_id}').json['comments']) == 1
+
+    client.patch(f'{comments_url}{comment_id}', json={'comment_text': 'Not mine'}, headers=headers)
+    assert [comment['comment_text'] for comment in client.get(comments_url).json['comments']] == ['Not mine']
+    assert client.get(f'/item-posts/{item_post_id}').json['comments'][0]['comment_text'] == 'Not mine'
+
+    client.delete(f'{comments_url}{comment_id}', headers=headers)
+    assert client.get(comments_url).json['comments'] == []
+    assert client.get(f'/item-posts/{item_post_id}').json['comments'] == []
+
+
+def test_updating_a_user_invalidates_their_records(cache, client, author, item_post_id):
+    user_id, headers = author
+    comments_url = f'/item-posts/{item_post_id}/comments/'
+    client.post(comments_url, json={'comment_text': 'Mine'}, headers=headers)
+    assert client.get(f'/item-posts/{item_post_id}').json['user']['name'] != 'Renamed'
+    assert client.get(comments_url).json['comments'][0]['user']['username'] != f'renamed{user_id}'
+
+    client.patch(f'/users/{user_id}', json={'name': 'Renamed', 'username': f'renamed{user_id}'}, headers=headers)
+    assert client.get(f'/item-posts/{item_post_id}').json['user']['name'] == 'Renamed'
+    assert client.get(comments_url).json['comments'][0]['user']['username'] == f'renamed{user_id}'
+
+
+def test_deleting_a_user_invalidates_their_records(cache, client, author, item_post_id):
+    user_id, headers = author
+    assert client.get(f'/item-posts/{item_post_id}').status_code == 200
+    client.delete(f'/users/{user_id}', headers=headers)
+    assert client.get(f'/item-posts/{item_post_id}').status_code == 404
+
+
+def test_streamed_responses_are_not_cached(app, cache, client, item_post_id):
+    first = client.get('/item-posts/locations/seen/suburb/mascot?stream=true')
+    assert first.is_streamed
+    assert 'ETag' not in first.headers
+    first.get_data()
+    retitle_behind_the_cache(app, item_post_id, 'Streamed umbrella')
+    second = client.get('/item-posts/locations/seen/suburb/mascot?stream=true')
+    assert 'Streamed umbrella' in second.get_data(as_text=True)
+
+
+def test_errors_are_not_cached(app, cache, client, item_post_id):
+    with app.app_context():
+        missing_id = db.session.scalar(db.select(db.func.max(ItemPost.id))) + 1
+    assert client.get(f'/item-posts/{missing_id}').status_code == 404
+    with app.app_context():
+        db.session.add(ItemPost(id=missing_id, title='Late umbrella', post_type='lost', category='others', user_id=2))
+        db.session.commit()
+    assert client.get(f'/item-posts/{missing_id}').json['title'] == 'Late umbrella'
+
+
+def test_responses_read_from_a_stale_replica_are_not_cached(app, cache, client, item_post_id, monkeypatch):
+    monkeypatch.setattr(response_cache, 'replica_is_current', lambda: False)
+    client.get(f'/item-posts/{item_post_id}')
+    retitle_behind_the_cache(app, item_post_id, 'Replicated umbrella')
+    assert client.get(f'/item-posts/{item_post_id}').json['title'] == 'Replicated umbrella'
@@ -0,0 +1,94 @@
+"""
+Tests the full-text search of item posts, run on the FTS5 table on SQLite,
+and the keyword search of the /item-posts/<field>/<keyword> route.
+"""
+
+
+# Third-party Library Modules
+import pytest
+
+# Local Modules
+from setup import db
+from models.item_post import ItemPost
+from search import search_item_posts
+
+
+def add_item_post(app, title, item_description='', retrieval_description=''):
+    with app.app_context():
+        item_post = ItemPost(
+            title=title, post_type='lost', category='others', user_id=2,
+            item_description=item_description, retrieval_description=retrieval_description,
+        )
+        db.session.add(item_post)
+        db.session.commit()
+        return item_post.id
+
+
+def search(app, text, **kwargs):
+    with app.app_context():
+        return db.session.scalars(search_item_posts(text, **kwargs).with_only_columns(ItemPost.id)).all()
+
+
+def test_words_match_as_prefixes(app):
+    item_post_id = add_item_post(app, 'Quokkaphone charger', 'White cable')
+    assert search(app, 'quokka') == [item_post_id]
+    assert search(app, 'QUOKKAPHONE white') == [item_post_id]
+    # Every word must match
+    assert search(app, 'quokka black') == []
+    # Words are only matched from their start
+    assert search(app, 'kkaphone') == []
+
+
+def test_results_are_ranked_by_relevance(app):
+    in_retrieval = add_item_post(app, 'Umbrella', 'Green', 'Ask for the wombatine desk')
+    in_title = add_item_post(app, 'Wombatine keyring', 'Silver')
+    assert search(app, 'wombatine') == [in_title, in_retrieval]
+
+
+def test_search_can_be_restricted_to_columns(app):
+    in_title = add_item_post(app, 'Platypode scarf', 'Wool')
+    in_description = add_item_post(app, 'Beanie', 'Matches the platypode scarf')
+    assert set(search(app, 'platypode')) == {in_title, in_description}
+    assert search(app, 'platypode', columns=('title',)) == [in_title]
+    with pytest.raises(ValueError):
+        search(app, 'platypode', columns=('category',))
+
+
+def test_queries_without_words_are_rejected(app):
+    with pytest.raises(ValueError):
+        search(app, '"*:)')
+    assert app.test_client().get('/item-posts/search?q=%22*').status_code == 400
+
+
+def test_index_follows_updates_and_deletes(app):
+    item_post_id = add_item_post(app, 'Echidnaware bottle')
+    assert search(app, 'echidnaware') == [item_post_id]
+
+    with app.app_context():
+        db.session.get(ItemPost, item_post_id).title = 'Numbatware bottle'
+        db.session.commit()
+    assert search(app, 'echidnaware') == []
+    assert search(app, 'numbatware') == [item_post_id]
+
+    with app.app_context():
+        db.session.delete(db.session.get(ItemPost, item_post_id))
+        db.session.commit()
+    assert search(app, 'numbatware') == []
+
+
+def test_search_route_pages_results(app):
+    ids = [add_item_post(app, f'Bilbyware torch {number}') for number in range(3)]
+    client = app.test_client()
+    first = client.get('/item-posts/search?q=bilbyware&limit=2&fields=id')
+    assert first.status_code == 200
+    second = client.get(f'/item-posts/search?q=bilbyware&limit=2&fields=id&after={first.headers["X-Next-Cursor"]}')
+    assert sorted(post['id'] for post in first.json + second.json) == ids
+
+
+def test_field_search_matches_substrings(app):
+    item_post_id = add_item_post(app, 'Dingolaptop sleeve')
+    client = app.test_client()
+    response = client.get('/item-posts/title/olapto?fields=id')
+    assert response.status_code == 200
+    assert [post['id'] for post in response.json] == [item_post_id]
+    assert client.get('/item-posts/title/zzzznotfound').status_code == 404
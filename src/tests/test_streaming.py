@@ -0,0 +1,55 @@
+"""
+Tests the streamed listings, which must return the same item posts, in the
+same order and with the same relationships, as the paginated listings.
+"""
+
+
+# Third-party Library Modules
+import json
+
+import pytest
+
+
+LISTINGS = [
+    '/item-posts/',
+    '/item-posts/search?q=laptop',
+    '/item-posts/title/laptop',
+    '/item-posts/locations/seen/suburb/mascot',
+]
+
+
+def all_pages(client, url):
+    """
+    Requests every page of a listing, and returns the item posts of all of
+    them.
+    """
+    separator = '&' if '?' in url else '?'
+    item_posts, cursor = [], None
+    while True:
+        response = client.get(f'{url}{separator}limit=100' + (f'&after={cursor}' if cursor else ''))
+        assert response.status_code == 200, response.get_data(as_text=True)
+        item_posts += response.json
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return item_posts
+
+
+@pytest.mark.parametrize('url', LISTINGS)
+def test_streamed_listing_matches_the_pages(app, add_item_posts, url):
+    add_item_posts(5)
+    client = app.test_client()
+    separator = '&' if '?' in url else '?'
+
+    streamed = client.get(f'{url}{separator}stream=true')
+    assert streamed.is_streamed
+    item_posts = json.loads(streamed.get_data())
+    assert item_posts == all_pages(client, url)
+    assert any(item_post['images'] and item_post['comments'] for item_post in item_posts)
+
+    ndjson = client.get(url, headers={'Accept': 'application/x-ndjson'})
+    assert [json.loads(line) for line in ndjson.get_data(as_text=True).splitlines()] == item_posts
+
+    # A streamed listing starts after the cursor, if one is given
+    cursor = client.get(f'{url}{separator}limit=2').headers['X-Next-Cursor']
+    rest = client.get(f'{url}{separator}stream=true&after={cursor}')
+    assert json.loads(rest.get_data()) == item_posts[2:]
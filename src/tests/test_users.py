@@ -0,0 +1,58 @@
+"""
+Tests the deletion of users, and that deleted users can no longer use the
+app.
+"""
+
+
+# Local Modules
+from setup import db
+from models.item_post import ItemPost
+from models.user import User
+from purge import purge_user
+
+
+NEW_ITEM_POST = {
+    'title': 'Blue umbrella', 'post_type': 'lost', 'category': 'others',
+    'item_description': 'Blue', 'retrieval_description': 'Call me',
+}
+
+
+def test_user_deleted_in_the_background_is_disabled_at_once(app, register):
+    client = app.test_client()
+    user_id, headers = register()
+    item_post_id = client.post('/item-posts/', json=NEW_ITEM_POST, headers=headers).json['id']
+
+    assert client.delete(f'/users/{user_id}?background=true', headers=headers).status_code == 202
+
+    # No worker has run the purge yet, but the account is already unusable
+    assert client.patch(f'/item-posts/{item_post_id}', json={'title': 'Mine'}, headers=headers).status_code == 401
+    assert client.post('/item-posts/', json=NEW_ITEM_POST, headers=headers).status_code == 401
+    with app.app_context():
+        username = db.session.get(User, user_id).username
+    login = client.post('/users/login', json={'username': username, 'password': 'password123'})
+    assert login.status_code == 401
+
+    # The purge then deletes the user and their records
+    with app.app_context():
+        assert purge_user(user_id)
+        assert db.session.get(User, user_id) is None
+        assert db.session.get(ItemPost, item_post_id) is None
+
+
+def test_deleted_user_tokens_are_rejected(app, register):
+    client = app.test_client()
+    user_id, headers = register()
+    assert client.delete(f'/users/{user_id}', headers=headers).status_code == 200
+    assert client.post('/item-posts/', json=NEW_ITEM_POST, headers=headers).status_code == 401
+
+
+def test_demoted_admin_loses_admin_rights(app, register):
+    client = app.test_client()
+    admin_id, admin_headers = register(is_admin=True)
+    other_id, other_headers = register()
+    assert client.patch(f'/users/{other_id}', json={'name': 'Renamed'}, headers=admin_headers).status_code == 201
+
+    with app.app_context():
+        db.session.get(User, admin_id).is_admin = False
+        db.session.commit()
+    assert client.patch(f'/users/{other_id}', json={'name': 'Again'}, headers=admin_headers).status_code == 401
@@ -1,96 +1,59 @@
+# Standard Library Modules
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from binascii import Error as Base64Error
+
 # Third-party Library Modules
-from sqlalchemy.exc import IntegrityError
-from marshmallow.exceptions import ValidationError
+from flask import request
 
 # Local Modules
 from setup import db
-from models.location import Location, LocationSchema
-from models.image import Image, ImageSchema
+from models.location import location_key
+from models.image import Image
+from location_cache import location_record, resolve_locations
 
 
 def check_location(parsed_info):
     """
-    A function that checks for the locations in an item_post. If the location
-    does not exist yet, the location is registered to the locations table in
-    the db. Otherwise, the location is retrieved from the locations table in
-    the db.
+    A function that checks for the locations in an item_post. Locations are
+    resolved through the location cache, and the ones that do not exist yet
+    are registered to the locations table in the db, without committing so
+    that they are saved in the same transaction as the item post referring to
+    them. Returns the seen and pickup locations as Location instances, or
+    None for a location missing from the parsed information.
 
     Args:
     1. raw_info (dict): The raw_info is a dictionary parsed through a specific
     schema, with keys that contain a location dictionary.
     """
-    def register_location(parsed_info, location_attribute):
-        """
-        Registers the location if it is not already registered into the db.
-
-        Args:
-        1. parsed_info (dict): A dictionary parsed through a specific
-        schema, with keys that contain a location dictionary that follows the
-        LocationSchema.
-        2. location_attribute (str): The location attribute refers to either
-        "seen_location" or "pickup_location" key of the raw_info dictionary.
-        """
-        # If parsed info does not contain seen or pickup location, return None
-        if location_attribute not in parsed_info:
-            return None
-        location_data = parsed_info[location_attribute]
-        location_info = LocationSchema().load(location_data)
-        # Checks if the attached location already exists in the db
-        stmt = db.select(Location).filter_by(**location_info)
-        existing_location = db.session.scalar(stmt)
-        # If location exists already, returns existing location instead of
-        # registering a new location
-        if existing_location:
-            return existing_location
-        else:
-            location = Location(**location_info)
-            # Session added but not committed, for error handling purposes later.
-            db.session.add(location)
-            return location
-
-    try:
-        seen_location = register_location(parsed_info, 'seen_location')
-        pickup_location = register_location(parsed_info, 'pickup_location')
-        db.session.commit()
-    # IntegrityError is raised if unique combination constraint is violated
-    # during commit, ValidationError is raised if the requirements in the
-    # LocationSchema is violated, such as missing required fields
-    except (ValidationError, IntegrityError) as err:
-        db.session.rollback()
-        return {'error': str(err)}, 404
-    return seen_location, pickup_location
+    attributes = ('seen_location', 'pickup_location')
+    rows = resolve_locations(
+        parsed_info[attribute] for attribute in attributes if parsed_info.get(attribute)
+    )
+    return tuple(
+        location_record(rows[location_key(parsed_info[attribute])])
+        if parsed_info.get(attribute) else None
+        for attribute in attributes
+    )
 
 
-def attach_image(parsed_info, record, model):
+def attach_image(parsed_info, record):
     """
-    A function for attaching an image into a record, namely comment and
-    item post.
+    A function for attaching images to a record, namely comment and item
+    post. The images are appended to the record's images, so that they are
+    inserted together with a single statement when the session is flushed,
+    without committing.
 
     Args:
-    1. parsed_info (dict): A dictionary parsed through a specific schema, 
-    with keys that contain image dictionaries.
-    2. record (Model instance): The record which the image will be attached to.
-    3. model (str): The name of the model in which to attach the image, i.e.
-    "comment" or "item_post"
+    1. parsed_info (dict): A dictionary parsed through a specific schema,
+    with keys that contain image dictionaries. The images have already been
+    validated by the ImageSchema nested in that schema.
+    2. record (Model instance): The record which the images will be attached to.
     """
-    model_id = model + "_id"
-
-    # Check if there are any images that need to be attached in the parsed information.
-    if parsed_info.get("images", ""):
-        # Create new image records one by one based on image_url
-        for image in parsed_info.get("images"):
-            image_info = ImageSchema(only=["image_url"]).load(image)
-            if image_info:
-                attached_image = Image(
-                    image_url=image.get("image_url"),
-                )
-                # Set model_id (foreign key referring to comment / item post record)
-                setattr(attached_image, model_id, record.id)
-                db.session.add(attached_image)
-
-    # Commit the new image records to the database only if all image are
-    # successfully validated
-    db.session.commit()
+    record.images.extend(
+        Image(image_url=image_info['image_url'])
+        for image_info in parsed_info.get('images') or ()
+    )
 
 
 def clear_attached_images(record, model):
@@ -111,3 +74,112 @@ def clear_attached_images(record, model):
     for image in attached_images:
         db.session.delete(image)
     db.session.commit()
+
+
+# Default and maximum number of records returned in a single page
+DEFAULT_PAGE_LIMIT = 20
+MAX_PAGE_LIMIT = 100
+
+
+def get_page_limit():
+    """
+    A function that reads the "limit" query parameter of the current request,
+    falling back to DEFAULT_PAGE_LIMIT. Raises ValueError if the limit is not
+    an integer between 1 and MAX_PAGE_LIMIT.
+    """
+    limit = request.args.get('limit', DEFAULT_PAGE_LIMIT)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError('Limit must be an integer')
+    if not 1 <= limit <= MAX_PAGE_LIMIT:
+        raise ValueError(f'Limit must be between 1 and {MAX_PAGE_LIMIT}')
+    return limit
+
+
+def encode_cursor(*values):
+    """
+    A function that encodes the sort key of the last record of a page into an
+    opaque, URL-safe cursor string.
+
+    Args:
+    1. *values: The values of the sort key, e.g. (date, id). Dates are stored
+    in ISO format.
+    """
+    values = [
+        value.isoformat() if hasattr(value, 'isoformat') else value
+        for value in values
+    ]
+    raw = json.dumps(values, separators=(',', ':')).encode('utf8')
+    return urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    A function that decodes a cursor produced by encode_cursor back into a
+    list of sort key values. Raises ValueError if the cursor is malformed.
+
+    Args:
+    1. cursor (str): The opaque cursor string taken from the request.
+    2. size (int): The number of values the cursor is expected to contain.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(urlsafe_b64decode(padded.encode('ascii')))
+    except (Base64Error, UnicodeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def get_page_offset():
+    """
+    A function that reads the "after" cursor of the current request for
+    listings that are paginated by position, such as relevance-ranked search
+    results, and returns the number of records to skip.
+    """
+    cursor = request.args.get('after')
+    if not cursor:
+        return 0
+    offset, = decode_cursor(cursor, 1)
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError('Invalid cursor')
+    return offset
+
+
+def paginated_response(body, next_cursor, status=200):
+    """
+    A function that attaches the cursor of the next page to a response as the
+    "X-Next-Cursor" header, so that list responses keep their JSON array
+    shape. No header is set on the last page.
+
+    Args:
+    1. body: The serialized records of the current page.
+    2. next_cursor (str): The cursor of the next page, or None.
+    3. status (int): The HTTP status code of the response.
+    """
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+    return body, status, headers
+
+
+def get_requested_fields(prefix=''):
+    """
+    A function that reads the "fields" query parameter of the current request,
+    a comma-separated list of the fields to return, e.g. "id,title,images". A
+    nested field can be narrowed down with a dot, e.g. "user.username".
+    Returns the list of fields to pass as the only argument of a schema, or
+    None if every field is requested. Unknown fields, including unknown parts
+    of dotted fields, are rejected by get_schema with a ValueError.
+
+    Args:
+    1. prefix (str): Prepended to every field, e.g. "comments." when the
+    requested fields are those of records nested in the dumped one.
+    """
+    value = request.args.get('fields')
+    if value is None:
+        return None
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    if not names:
+        raise ValueError('Fields must list at least one field')
+    return [prefix + name for name in names]